@@ -3,36 +3,26 @@
 # =====================================
 
 import streamlit as st
-import pandas as pd
-import time
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows # <--- 添加或确保这一行存在
-from io import BytesIO
-
-def normalize_contract_key(series: pd.Series) -> pd.Series:
-    """
-    对合同号 Series 进行标准化处理，用于安全的 pd.merge 操作。
-    """
-    # 1. 确保是字符串类型，同时处理缺失值（如果存在）
-    s = series.astype(str)
-    
-    # 2. 移除常见的浮点数残留（以防原始数据错误输入）
-    s = s.str.replace(r"\.0$", "", regex=True) 
-    
-    # 3. 核心：移除首尾空格（处理最常见的导入错误）
-    s = s.str.strip()
-    
-    # 4. 统一转换为大写（处理大小写不一致问题，如 'pazl' vs 'PAZL'）
-    s = s.str.upper() 
-    
-    # 5. 处理全角/半角差异（将常见的全角连接符转为半角）
-    s = s.str.replace('－', '-', regex=False) # 全角连接符转半角
-    
-    # 6. 处理其他可能的空白字符（例如 tabs, 换行符等）
-    s = s.str.replace(r'\s+', '', regex=True)
-    
-    return s
+import os
+import re
+import importlib.util
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import BrokenExecutor
+from audit_engine import (
+    sheet_keywords, WORKBOOK_SHEETS, EXPORT_SHEETS, EXPORT_FILE_NAMES, BUNDLE_FORMATS, EXPORT_COMPRESSLEVEL,
+    find_file, find_col, parse_workbook, reference_frame, load_references, build_ref_index,
+    find_missing_contracts, render_sheet_workbook, render_missing_workbook, render_export_bundle,
+    make_executor, run_sheet_audits, StageProfiler, profile_frame, FingerprintStore, ReferenceStore, STREAM_CHUNK_SIZE,
+)
+from audit_jobs import AuditJobQueue, JOB_STATUS
+
+# 多进程执行时 spawn 出的工作进程按 __main__ 的 __spec__ 重新导入主模块；指向 audit_worker，工作进程不会重新执行本界面脚本
+__spec__ = importlib.util.find_spec("audit_worker")
 
 # =====================================
 # 🏁 应用标题与说明
@@ -56,422 +46,180 @@ if not uploaded_files or len(uploaded_files) < 4:
 else:
     st.success("✅ 文件上传完成")
 
-# =====================================
-# 🧰 工具函数区（文件定位、列名模糊匹配、日期/数值处理）
-# =====================================
-
-# 按关键字查找文件（文件名包含关键字）
-def find_file(files_list, keyword):
-    for f in files_list:
-        if keyword in f.name:
-            return f
-    raise FileNotFoundError(f"❌ 未找到包含关键词「{keyword}」的文件")
-
-# 统一列名格式（去空格、转小写）
-def normalize_colname(c): return str(c).strip().lower()
-
-# 按关键字匹配列名（支持 exact 精确匹配与模糊匹配）
-def find_col(df, keyword, exact=False):
-    key = keyword.strip().lower()
-    for col in df.columns:
-        cname = normalize_colname(col)
-        if (exact and cname == key) or (not exact and key in cname):
-            return col
-    return None
-
-# 查找sheet（sheet名包含关键字即可）
-def find_sheet(xls, keyword):
-    for s in xls.sheet_names:
-        if keyword in s:
-            return s
-    raise ValueError(f"❌ 未找到包含关键词「{keyword}」的sheet")
-
-# 统一数值解析（去逗号、转float、处理百分号）
-def normalize_num(val):
-    if pd.isna(val): return None
-    s = str(val).replace(",", "").strip()
-    if s in ["", "-", "nan"]: return None
-    try:
-        if "%" in s: return float(s.replace("%", "")) / 100
-        return float(s)
-    except ValueError:
-        return s
-
-# 日期匹配（年/月/日完全一致）
-def same_date_ymd(a, b):
-    try:
-        da = pd.to_datetime(a, errors='coerce')
-        db = pd.to_datetime(b, errors='coerce')
-        if pd.isna(da) or pd.isna(db): return False
-        return (da.year, da.month, da.day) == (db.year, db.month, db.day)
-    except Exception:
-        return False
-def prepare_ref_df(ref_df, mapping, prefix):
-    # --- 修正开始 ---
-    
-    # 1. 找到参考表(ref_df)中的“合同”列
-    # 我们使用 find_col，这才是正确的做法
-    contract_col = find_col(ref_df, "合同") 
-    
-    # 2. 如果在 ref_df 中找不到合同列，则无法继续
-    if not contract_col:
-        st.warning(f"⚠️ 在 {prefix} 参考表中未找到'合同'列，跳过此数据源。")
-        return pd.DataFrame(columns=['__KEY__']) # 返回一个空的带key的df
-        
-    std_df = pd.DataFrame()
-    
-    # 3. VVVV 插入归一化函数 VVVV
-    # 使用找到的 contract_col 来应用归一化
-    std_df['__KEY__'] = normalize_contract_key(ref_df[contract_col])
-    # ^^^^ 插入归一化函数 ^^^^
-    
-    # --- 修正结束 ---
-    # 4. 提取并重命名所有需要的字段 (【已修改】增加租赁期限*12的逻辑)
-    for main_kw, ref_kw in mapping.items():
-        # 城市经理需要精确匹配
-        exact = (main_kw == "城市经理")
-        ref_col_name = find_col(ref_df, ref_kw, exact=exact)
-        
-        if ref_col_name:
-            # 获取原始数据 Series
-            s_ref_raw = ref_df[ref_col_name]
-            
-            # 检查是否是 'fk' 表的 '租赁期限'
-            if prefix == 'fk' and main_kw == '租赁期限':
-                # 应用转换：年 -> 月
-                s_ref_transformed = pd.to_numeric(s_ref_raw, errors='coerce') * 12
-                std_df[f'ref_{prefix}_{main_kw}'] = s_ref_transformed
-            else:
-                # 无转换，直接赋值
-                std_df[f'ref_{prefix}_{main_kw}'] = s_ref_raw
-            # --- ^^^^ (新逻辑结束) ^^^^ ---
-        else:
-            st.warning(f"⚠️ 在 {prefix} 参考表中未找到列 (main: '{main_kw}', ref: '{ref_kw}')")
-
-    # 5. 效仿原始逻辑：只取第一个匹配项 (这部分逻辑保持不变)
-    std_df = std_df.drop_duplicates(subset=['__KEY__'], keep='first')
-    return std_df
-
-def compare_series_vec(s_main, s_ref, main_kw):
-    """
-    向量化比较两个Series，复刻原始的 compare_fields_and_mark 逻辑。
-    返回一个布尔Series，True表示存在差异。
-    (V2：增加对 merge 失败 (NaN) 的静默跳过)
-    """
-    
-    # 0. 识别真正的 "Merge 失败" (s_ref 是物理 NaN)
-    #    我们必须在 s_ref 被 astype(str) 污染前执行此操作
-    merge_failed_mask = s_ref.isna() 
-
-    # 1. 预处理：处理空值。原始逻辑：同为NaN/空则认为一致。
-    main_is_na = pd.isna(s_main) | (s_main.astype(str).str.strip().isin(["", "nan", "None"]))
-    ref_is_na = pd.isna(s_ref) | (s_ref.astype(str).str.strip().isin(["", "nan", "None"]))
-    
-    # 两者都为空（NaN, "", "None"等），不算错误
-    both_are_na = main_is_na & ref_is_na
-    
-    # 2. 日期字段比较
-    if any(k in main_kw for k in ["日期", "时间"]):
-        d_main = pd.to_datetime(s_main, errors='coerce')
-        d_ref = pd.to_datetime(s_ref, errors='coerce')
-        
-        valid_dates_mask = d_main.notna() & d_ref.notna()
-        date_diff_mask = (d_main.dt.date != d_ref.dt.date)
-        
-        errors = valid_dates_mask & date_diff_mask
-    
-    # 3. 数值/文本比较
-    else:
-        s_main_norm = s_main.apply(normalize_num)
-        s_ref_norm = s_ref.apply(normalize_num)
-        
-        main_is_na_norm = pd.isna(s_main_norm) | (s_main_norm.astype(str).str.strip().isin(["", "nan", "None"]))
-        ref_is_na_norm = pd.isna(s_ref_norm) | (s_ref_norm.astype(str).str.strip().isin(["", "nan", "None"]))
-        both_are_na_norm = main_is_na_norm & ref_is_na_norm
-
-        is_num_main = s_main_norm.apply(lambda x: isinstance(x, (int, float)))
-        is_num_ref = s_ref_norm.apply(lambda x: isinstance(x, (int, float)))
-        both_are_num = is_num_main & is_num_ref
-        
-        errors = pd.Series(False, index=s_main.index)
-
-        # 3a. 数值比较
-        if both_are_num.any():
-            num_main = s_main_norm[both_are_num].fillna(0) # fillna(0) for safety
-            num_ref = s_ref_norm[both_are_num].fillna(0)
-            diff = (num_main - num_ref).abs()
-            
-            # --- VVVV (这是修改后的逻辑) VVVV ---
-            if main_kw == "保证金比例":
-                num_errors = (diff > 0.00500001) # 保证金比例容错
-            
-            elif "租赁期限" in main_kw: # 匹配 "租赁期限" 和 "租赁期限月"
-                # 忽略小于 1.0 个月的差距 (即：差异 >= 1.0 才算错误)
-                num_errors = (diff >= 1.0) 
-            
-            else:
-                # 其他数值字段，使用标准微小容错
-                num_errors = (diff > 1e-6)
-            # --- ^^^^ (修改结束) ^^^^ ---
-            
-            errors.loc[both_are_num] = num_errors
-
-        # 3b. 文本比较
-        not_num_mask = ~both_are_num
-        if not_num_mask.any():
-            str_main = s_main_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
-            str_ref = s_ref_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
-            
-            str_errors = (str_main != str_ref)
-            errors.loc[not_num_mask] = str_errors
-            
-        # 排除掉那些两者皆为空的情况
-        errors = errors & ~both_are_na_norm
-        # return errors # (这是旧的返回)
-
-    # 4. === 最终错误逻辑 ===
-    
-    # a. 排除 "两者皆为空" 的情况 (原始逻辑)
-    final_errors = errors & ~both_are_na
-    
-    # b. 排除 "Merge 失败" 的情况 (复刻 iterrows 的 'if ref_rows.empty: return 0')
-    #    条件:
-    #    1. merge_failed_mask 为 True (s_ref 是物理 NaN)
-    #    2. main_is_na 为 False (s_main 不是空的)
-    #    如果 (1) 和 (2) 都成立，说明这是一个 "lookup failure"，我们必须忽略它
-    
-    lookup_failure_mask = merge_failed_mask & ~main_is_na
-    
-    final_errors = final_errors & ~lookup_failure_mask
-    
-    return final_errors
+# 计算上传文件的内容哈希；同一上传文件(file_id)在会话内只计算一次
+def file_digest(uploaded_file):
+    digests = st.session_state.setdefault("file_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    return digests[uploaded_file.file_id]
 
 # =====================================
-# 🧮 单sheet检查函数 (向量化版)
+# 🗄️ 缓存层：各阶段结果按上传文件内容哈希缓存
 # =====================================
-def check_one_sheet(sheet_keyword, main_file, ref_dfs_std_dict):
-    start_time = time.time()
-    xls_main = pd.ExcelFile(main_file)
-
-    # 查找目标sheet
-    try:
-        target_sheet = find_sheet(xls_main, sheet_keyword)
-    except ValueError:
-        st.warning(f"⚠️ 未找到包含「{sheet_keyword}」的sheet，跳过。")
-        return 0, None, 0, set()
-
-    # 1. 读取目标sheet（第二行为表头）
-    try:
-        main_df = pd.read_excel(xls_main, sheet_name=target_sheet, header=1)
-    except Exception as e:
-        st.error(f"❌ 读取「{sheet_keyword}」时出错: {e}")
-        return 0, None, 0, set()
-        
-    if main_df.empty:
-        st.warning(f"⚠️ 「{sheet_keyword}」为空，跳过。")
-        return 0, None, 0, set()
-
-    # 2. 查找合同号列
-    global contract_col_main
-    contract_col_main = find_col(main_df, "合同")
-    if not contract_col_main:
-        st.error(f"❌ 在「{sheet_keyword}」中未找到合同列。")
-        return 0, None, 0, set()
-
-    # 3. 创建临时输出文件 (保留原始表头空行)
-    output_path = f"月重卡_{sheet_keyword}_审核标注版.xlsx"
-    empty_row = pd.DataFrame([[""] * len(main_df.columns)], columns=main_df.columns)
-    # 注意：这里我们保存的是原始main_df
-    pd.concat([empty_row, main_df], ignore_index=True).to_excel(output_path, index=False)
-
-    # 打开Excel用于写入标注
-    wb = load_workbook(output_path)
-    ws = wb.active
-    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-
-   # 4. 准备主表用于合并
-    # (注意：contract_col_main 已经在第 236 行被正确找到了，我们不需要再找了)
-    
-    # 存储原始索引，用于 openpyxl 定位
-    main_df['__ROW_IDX__'] = main_df.index
-    
-    # VVVV 插入归一化函数 VVVV
-    # 创建标准合并Key
-    main_df['__KEY__'] = normalize_contract_key(main_df[contract_col_main])
-    # ^^^^ 插入归一化函数 ^^^^
-    
-    # 获取本表所有合同号（用于统计等）
-    contracts_seen = set(main_df['__KEY__'].dropna())
-
-    # 5. 一次性合并所有参考数据
-    merged_df = main_df.copy()
-    for prefix, std_df in ref_dfs_std_dict.items():
-        if not std_df.empty:
-            merged_df = pd.merge(merged_df, std_df, on='__KEY__', how='left')
-    
-    total_errors = 0
-    skip_city_manager = [0]
-    errors_locations = set() # 存储 (row_idx, col_name)
-    row_has_error = pd.Series(False, index=merged_df.index) # 标记哪一行有错误
-
-    # 添加Streamlit进度条
-    progress = st.progress(0)
-    status = st.empty()
-
-    # 6. === 遍历字段进行向量化比对 ===
-    mappings_all = {
-        'fk': (mapping_fk, ref_dfs_std_dict['fk']),
-        'zd': (mapping_zd, ref_dfs_std_dict['zd']),
-        'ec': (mapping_ec, ref_dfs_std_dict['ec'])
-    }
-    
-    total_comparisons = sum(len(m[0]) for m in mappings_all.values())
-    current_comparison = 0
-
-    for prefix, (mapping, std_df) in mappings_all.items():
-        if std_df.empty:
-            current_comparison += len(mapping) # 跳过空表
-            continue
-            
-        for main_kw, ref_kw in mapping.items():
-            current_comparison += 1
-            status.text(f"检查「{sheet_keyword}」: {prefix} - {main_kw}...")
-            
-            # 关键：在原始 main_df 中找到列名
-            exact = (main_kw == "城市经理")
-            main_col = find_col(main_df, main_kw, exact=exact)
-            
-            # 参考列的列名是我们在 prepare_ref_df 中标准化的
-            ref_col = f'ref_{prefix}_{main_kw}'
-
-            if not main_col or ref_col not in merged_df.columns:
-                continue # 跳过不存在的列
-
-            s_main = merged_df[main_col]
-            s_ref = merged_df[ref_col]
-
-            # 处理 "城市经理" 跳过逻辑
-            skip_mask = pd.Series(False, index=merged_df.index)
-            if main_kw == "城市经理":
-                na_strings = ["", "-", "nan", "none", "null"]
-                # 检查参考列是否为空
-                skip_mask = pd.isna(s_ref) | s_ref.astype(str).str.strip().isin(na_strings)
-                skip_city_manager[0] += skip_mask.sum()
-            
-            # 7. 获取向量化比较结果
-            errors_mask = compare_series_vec(s_main, s_ref, main_kw)
-            
-            # 应用跳过逻辑：如果 skip_mask 为 True，则不算错误
-            final_errors_mask = errors_mask & ~skip_mask
-            
-            if final_errors_mask.any():
-                total_errors += final_errors_mask.sum()
-                row_has_error |= final_errors_mask
-                
-                # 8. 存储错误位置 (使用 __ROW_IDX__ 和 原始 main_col 名称)
-                bad_indices = merged_df[final_errors_mask]['__ROW_IDX__']
-                for idx in bad_indices:
-                    errors_locations.add((idx, main_col))
-                    
-            progress.progress(current_comparison / total_comparisons)
-
-    status.text(f"「{sheet_keyword}」比对完成，正在生成标注文件...")
-
-    # 9. === 遍历错误进行Excel标注 ===
-    # (这比遍历所有单元格快得多)
-    
-    # 获取原始列名 (去掉我们添加的辅助列)
-    original_cols_list = list(main_df.drop(columns=['__ROW_IDX__', '__KEY__']).columns)
-    # 创建列名到Excel列索引(1-based)的映射
-    col_name_to_idx = {name: i + 1 for i, name in enumerate(original_cols_list)}
-
-    # 标红错误单元格
-    for (row_idx, col_name) in errors_locations:
-        if col_name in col_name_to_idx:
-            # +3: (1-based index) + (1 for header) + (1 for empty row)
-            ws.cell(row_idx + 3, col_name_to_idx[col_name]).fill = red_fill
-
-    # 标黄有错误的合同号
-    if contract_col_main in col_name_to_idx:
-        contract_col_excel_idx = col_name_to_idx[contract_col_main]
-        # 找到所有出错的原始行号
-        error_row_indices = merged_df[row_has_error]['__ROW_IDX__']
-        for row_idx in error_row_indices:
-            ws.cell(row_idx + 3, contract_col_excel_idx).fill = yellow_fill
-
-    # 10. 导出检查结果
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    st.download_button(
-        label=f"📥 下载 {sheet_keyword}审核标注版",
-        data=output,
-        file_name=f"记录表_{sheet_keyword}_审核标注版.xlsx",
-        key=f"download_{sheet_keyword}" # 增加key避免streamlit重跑问题
-    )
-
-    # 11. (新) 导出仅含错误行的文件 (带标红)
-    if row_has_error.any():
+# Streamlit 每次交互（如点击下载按钮）都会从头重跑脚本。输入文件不变时各阶段直接命中缓存，
+# 只重绘界面。参数名以 "_" 开头的不参与缓存键计算，缓存键只由文件哈希决定；
+# 超过 max_entries 后按最近最少使用淘汰。
+CACHE_MAX_ENTRIES = 8
+
+# 开启性能分析（profile=True）时各阶段重新计算一次，并把性能记录与结果一起缓存
+# 解析结果与标准化参考表体积大且只读，用 cache_resource 共享同一份对象，命中时不做复制。
+# full=True 时按 EXPORT_SHEETS 整表读取（导出字段表时）
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def parse_workbook_cached(digest, file_kw, _uploaded_file, profile=False, full=False):
+    notes = []
+    profiler = StageProfiler(enabled=profile)
+    specs = EXPORT_SHEETS[file_kw] if full else WORKBOOK_SHEETS[file_kw]
+    return parse_workbook(_uploaded_file.getvalue(), specs, profiler, notes), notes, profiler.records
+
+# 参考文件先查持久化缓存（_ref_store 不为 None 时），命中的文件不解析
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def prepare_refs_cached(ref_key, _file_data, _digests, _ref_store, profile=False):
+    notes = []
+    profiler = StageProfiler(enabled=profile)
+    refs = load_references(_file_data, _ref_store, _digests, profiler=profiler, notes=notes)
+    ref_index = build_ref_index(refs["std"], profiler)
+    return ref_index, refs["missing_frame"], notes, profiler.records
+
+# 线程安全的有界 LRU 缓存（供需要在计算过程中刷新界面的阶段使用）
+class BoundedCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# 比对阶段要刷新函数外创建的进度条，st.cache_data 无法回放这类元素，故使用共享的 BoundedCache；
+# 每个缓存项为单张sheet的 (比对结果, 标注文件)，每个月重卡文件对应 len(sheet_keywords) 项
+@st.cache_resource
+def sheet_result_cache():
+    return BoundedCache(CACHE_MAX_ENTRIES * len(sheet_keywords))
+
+# 多sheet执行器在服务进程内共享，避免每次审核都重新启动工作进程；只有一个 CPU 时并行没有收益（多进程还要传输数据），串行执行
+@st.cache_resource
+def sheet_executor(mode):
+    workers = min(len(sheet_keywords), os.cpu_count() or 1)
+    return make_executor(mode if workers > 1 else "serial", max_workers=workers)
+
+# 先查缓存，只把未命中的sheet交给执行器并行处理，结果按 sheet_keywords 顺序返回。
+# store 不为 None 时做增量比对（按 scope 区分上传者与文件，结果的变化提示也随 scope 缓存），只比对与上次相比有变化的行；
+# chunk_size 不为 None 时 main_sheets 为月重卡 xlsx 字节，分块流式审核（标注文件在比对时按 compresslevel 写出），
+# 否则只比对，标注文件在点击「生成」时才写出（见 export_download）
+def audit_sheets_cached(main_digest, ref_key, main_sheets, ref_index, mode, on_progress=None, profile=False, store=None, scope="", chunk_size=None, compresslevel=None):
+    cache = sheet_result_cache()
+    incremental_scope = scope if store is not None else None
+    key = lambda kw: (main_digest, ref_key, kw, profile, incremental_scope, chunk_size, compresslevel if chunk_size else None)
+    results = {kw: cache.get(key(kw)) for kw in sheet_keywords}
+    todo = [kw for kw, value in results.items() if value is None]
+    if todo:
         try:
-            # 1. 获取仅含错误行的 DataFrame (只保留原始列)
-            #    (original_cols_list 已在第 365 行定义)
-            df_errors_only = merged_df.loc[row_has_error, original_cols_list].copy()
-            
-            # 2. 关键：创建 "原始行索引" 到 "新Excel行号" 的映射
-            #    我们获取所有出错行的 __ROW_IDX__
-            original_indices_with_error = merged_df.loc[row_has_error, '__ROW_IDX__']
-            
-            #    创建映射: { 原始索引 : 新的Excel行号 }
-            #    (enumerate start=2, 因为 Excel 行 1 是表头, 数据从行 2 开始)
-            original_idx_to_new_excel_row = {
-                original_idx: new_row_num 
-                for new_row_num, original_idx in enumerate(original_indices_with_error, start=2)
-            }
-
-            # 3. 创建一个新的工作簿(Workbook)
-            wb_errors = Workbook()
-            ws_errors = wb_errors.active
-            
-            # 4. 使用 dataframe_to_rows 快速写入数据
-            for r in dataframe_to_rows(df_errors_only, index=False, header=True):
-                ws_errors.append(r)
-                
-            # 5. 遍历主错误列表(errors_locations)，进行标红
-            #    (col_name_to_idx 和 red_fill 已在前面定义)
-            for (original_row_idx, col_name) in errors_locations:
-                
-                # 检查这个错误是否在我们 "仅错误行" 的映射中
-                if original_row_idx in original_idx_to_new_excel_row:
-                    
-                    # 获取它在新Excel文件中的行号
-                    new_row = original_idx_to_new_excel_row[original_row_idx]
-                    
-                    # 获取列号
-                    if col_name in col_name_to_idx:
-                        new_col = col_name_to_idx[col_name]
-                        
-                        # 应用标红
-                        ws_errors.cell(row=new_row, column=new_col).fill = red_fill
-            
-            # 6. 保存到 BytesIO
-            output_errors_only = BytesIO()
-            wb_errors.save(output_errors_only)
-            output_errors_only.seek(0)
-            
-            # 7. 创建下载按钮
-            st.download_button(
-                label=f"📥 下载 {sheet_keyword} (仅含错误行, 带标红)", # 更新了标签
-                data=output_errors_only,
-                file_name=f"记录表_{sheet_keyword}_仅错误行_标红.xlsx", # 更新了文件名
-                key=f"download_{sheet_keyword}_errors_only" # Key 保持不变
+            computed = run_sheet_audits(
+                todo, main_sheets, ref_index, sheet_executor(mode), on_progress, profile, store, scope, chunk_size,
+                render=False, compresslevel=compresslevel,
             )
-        except Exception as e:
-            st.error(f"❌ 生成“仅错误行”文件时出错: {e}")
-    
-    elapsed = time.time() - start_time
-    st.success(f"✅ {sheet_keyword} 检查完成，共 {total_errors} 处错误，用时 {elapsed:.2f} 秒。")
-    return total_errors, elapsed, skip_city_manager[0], contracts_seen
+        except BrokenExecutor:
+            sheet_executor.clear()  # 工作进程异常退出后丢弃执行器，下次重新创建
+            raise
+        for kw, value in computed.items():
+            cache.put(key(kw), value)
+            results[kw] = value
+    return results
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def find_missing_contracts_cached(zd_digest, main_digest, _missing_frame, contract_col_zd, _contracts_seen_all_sheets, profile=False):
+    profiler = StageProfiler(enabled=profile)
+    with profiler.stage("find_missing", target="字段", rows=len(_missing_frame)):
+        missing = find_missing_contracts(_missing_frame, contract_col_zd, _contracts_seen_all_sheets)
+    return missing, profiler.records
+
+# =====================================
+# 📤 按需生成导出文件：比对只保留错误矩阵，点击「生成」后才写出对应的 xlsx，生成的文件按文件哈希缓存
+# =====================================
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES * len(sheet_keywords) * 2, show_spinner=False)
+def render_sheet_workbook_cached(main_digest, ref_key, kw, kind, compresslevel, _main_df, _result, profile=False):
+    profiler = StageProfiler(enabled=profile)
+    return render_sheet_workbook(_main_df, _result, kind, profiler, compresslevel), profiler.records
+
+# _load_zd_df 返回整表读取的字段表，只在未命中缓存时调用
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES * 2, show_spinner=False)
+def render_missing_workbook_cached(zd_digest, main_digest, kind, compresslevel, _load_zd_df, _missing_mask, profile=False):
+    profiler = StageProfiler(enabled=profile)
+    zd_df, records = _load_zd_df()
+    profiler.records.extend(records)
+    return render_missing_workbook(zd_df, _missing_mask, kind, profiler, compresslevel), profiler.records
+
+# 合并导出：全部结果一次写成一个工作簿或 zip（ref_key 已包含字段表的哈希）；
+# 分块流式审核时 _main_frames 为 None，打包比对时已写出的标注文件
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES * 2, show_spinner=False)
+def render_export_bundle_cached(main_digest, ref_key, fmt, compresslevel, _sheet_results, _main_frames, _load_zd_df, _missing_mask, profile=False):
+    profiler = StageProfiler(enabled=profile)
+    zd_df, records = _load_zd_df()
+    profiler.records.extend(records)
+    return render_export_bundle(_sheet_results, _main_frames, zd_df, _missing_mask, fmt, compresslevel, profiler), profiler.records
+
+# 已生成过的文件直接显示下载按钮（重跑时命中缓存），否则先显示「生成」按钮；render() 返回 (文件字节, 性能记录)
+def export_download(label, file_name, export_key, render):
+    generated = st.session_state.setdefault("generated_exports", set())
+    if export_key not in generated:
+        if not st.button(f"⚙️ 生成 {label}", key=f"generate_{export_key}"):
+            return
+        generated.add(export_key)
+    with st.spinner(f"正在生成 {label}..."):
+        data, records = render()
+    profile_records.extend(records)
+    st.download_button(f"📥 下载 {label}", data, file_name, key=f"download_{export_key}")
+
+# 显示各阶段收集的提示信息
+def show_notes(notes):
+    for level, text in notes:
+        getattr(st, level)(text)
+
+# 增量比对记录按「浏览器 + 月重卡文件名」区分：首次打开页面时分配一个客户端编号写入地址栏（?client=...），
+# 刷新或收藏该地址后沿用；不同上传者的同名文件不会覆盖对方上次的比对记录
+def incremental_scope(file_name):
+    client = st.query_params.get("client", "")
+    if not re.fullmatch(r"[0-9a-f]{12}", client):
+        client = st.query_params["client"] = uuid.uuid4().hex[:12]
+    return f"{client}/{file_name}"
+
+# 性能分析开关：开启后记录各阶段 / 各字段的耗时、内存与行数，在页面底部显示
+profile_enabled = st.sidebar.toggle("📈 性能分析", help="记录各阶段与各对照字段的耗时、阶段内分配的内存峰值与行数（开启后审核会变慢一些）")
+profile_records = []
+
+# 增量比对开关：按上传者与月重卡文件名保存每个合同的比对记录（见 incremental_scope），重新上传修改后的文件时只比对变化的行
+incremental_enabled = st.sidebar.toggle("🔁 增量比对", value=True, help="重新上传修改后的月重卡时，只重新比对内容有变化的合同，并提示与上次相比的变化")
+
+# 参考数据缓存：标准化后的放款明细 / 字段 / 二次明细按文件内容保存在本地，再次上传同一文件时不再解析
+ref_cache_enabled = st.sidebar.toggle("🗃️ 参考数据缓存", value=True, help="参考文件内容不变时直接读取上次标准化的结果（保存在 .audit_cache/references/，超过上限自动清理最久未用的）")
+
+# 分块流式审核：超大月重卡不整表读入内存，按行块读取、比对并直接写出标注文件
+stream_enabled = st.sidebar.toggle("🌊 分块流式审核", help="用于超大月重卡：按行分块读取与比对，峰值内存取决于每块行数而不是文件大小（不使用增量比对）")
+chunk_size = st.sidebar.number_input("每块行数", min_value=1000, value=STREAM_CHUNK_SIZE, step=1000) if stream_enabled else None
+
+# 后台审核：提交后页面立即返回，可继续操作或排队多组文件；进度、取消与下载在任务面板中
+background_enabled = st.sidebar.toggle("🧵 后台审核", help="审核在服务器的后台工作池中运行，页面不被阻塞；多人可同时排队，结果保留到下载为止（有上限）")
+
+# 导出方式：各文件分别生成下载，或全部结果一次写成一个工作簿 / 一个 zip，只需下载一次。
+# 分块流式审核不保留错误矩阵，只能打包为 zip；压缩级别越低压缩越快、文件越大
+EXPORT_MODES = {"separate": "分别下载", "workbook": "合并为一个工作簿", "zip": "打包为 zip"}
+export_mode = st.sidebar.selectbox(
+    "📦 导出方式", [mode for mode in EXPORT_MODES if not (stream_enabled and mode == "workbook")], format_func=EXPORT_MODES.get,
+)
+bundle = None if export_mode == "separate" else export_mode
+compresslevel = st.sidebar.slider(
+    "导出压缩级别", 0, 9, 6 if EXPORT_COMPRESSLEVEL is None else EXPORT_COMPRESSLEVEL, help="越低压缩越快、文件越大",
+)
 
 # =====================================
 # 📖 文件读取：按关键字识别五份文件
@@ -481,132 +229,241 @@ fk_file = find_file(uploaded_files, "放款明细")
 zd_file = find_file(uploaded_files, "字段")
 ec_file = find_file(uploaded_files, "二次明细")
 
-# 各文件sheet读取（模糊匹配sheet名）
-fk_df = pd.read_excel(pd.ExcelFile(fk_file), sheet_name=find_sheet(pd.ExcelFile(fk_file), "威田"))
-zd_df = pd.read_excel(pd.ExcelFile(zd_file), sheet_name=find_sheet(pd.ExcelFile(zd_file), "重卡"))
-ec_df = pd.read_excel(ec_file)
-
-# 合同列定位
-contract_col_fk = find_col(fk_df, "合同")
-contract_col_zd = find_col(zd_df, "合同")
-contract_col_ec = find_col(ec_df, "合同")
-
-# 对照字段映射表
-# --- VVVV (这是新的，修正的) VVVV ---
-# 格式: {"记录表(主表)的列名": "放款明细(参考表)的列名关键字"}
-mapping_fk = {
-    # 这3个是正确的
-    "授信方": "授信方",     # "授信方" in "授信方"
-    "租赁本金": "租赁本金",  
-    "租赁期限": "租赁期限",
-    
-    # 这4个是修正的
-    "挂车台数": "挂车数量",     # "挂车数量" in "挂车数量"
-    "起租收益率": "XIRR"      # 假设 "费率" 是您想要的 "收益率"。如果不是，请修改为 "XIRR" 或其他
-}
-# --- ^^^^ (修正结束) ^^^^ ---
+# 每个文件只解析一次，所有sheet一次读出（模糊匹配sheet名）；按内容哈希缓存
+input_files = {"月重卡": main_file, "放款明细": fk_file, "字段": zd_file, "二次明细": ec_file}
+scope = incremental_scope(main_file.name)
 
-
-mapping_zd = {"保证金比例": "保证金比例_2", "项目提报人": "提报", "起租时间": "起租日_商", "客户经理": "客户经理_资产", "所属省区": "区域", "主车台数": "主车台数", "城市经理": "城市经理"}
-mapping_ec = {"二次时间": "出本流程时间"}
+# =====================================
+# 🧵 后台审核任务：任务队列在服务进程内共享，每个会话只显示自己提交的任务
+# =====================================
+JOB_REFRESH_SECONDS = 1.0
+
+@st.cache_resource
+def audit_job_queue():
+    return AuditJobQueue()
+
+# 已完成任务的结果：提示信息 + 各文件下载（任一文件下载后该任务在淘汰时优先）
+def show_job_result(job_id, audit):
+    queue = audit_job_queue()
+    st.success(f"✅ 审核完成，共 {audit['total_errors']} 处错误，漏填 {audit['missing_count']} 个合同。")
+    notes = list(audit["notes"])
+    downloads = []
+    for kw, (result, rendered) in audit["sheets"].items():
+        notes.extend(result["notes"])
+        if rendered is None:
+            continue
+        notes.extend(rendered["notes"])
+        if audit["bundle"] is not None:
+            continue  # 分块流式审核时标注文件已打包进合并导出文件
+        downloads.append((f"📥 {kw}审核标注版", rendered["annotated"], EXPORT_FILE_NAMES["annotated"].format(sheet=kw)))
+        if rendered["errors_only"] is not None:
+            downloads.append((f"📥 {kw} (仅含错误行, 带标红)", rendered["errors_only"], EXPORT_FILE_NAMES["errors_only"].format(sheet=kw)))
+    if audit["bundle"] is not None:
+        downloads.append((f"📥 全部结果（{EXPORT_MODES[audit['bundle_format']]}）", audit["bundle"], BUNDLE_FORMATS[audit["bundle_format"]]))
+    else:
+        output_all, out2 = audit["missing_workbooks"]
+        downloads.append(("📥 字段表漏填标注版", output_all, EXPORT_FILE_NAMES["all"]))
+        if out2 is not None:
+            downloads.append(("📥 仅漏填字段表", out2, EXPORT_FILE_NAMES["missing_only"]))
+    for label, data, file_name in downloads:
+        st.download_button(label, data, file_name, key=f"job_{job_id}_{file_name}", on_click=queue.mark_downloaded, args=(job_id,))
+    if notes:
+        with st.expander("提示信息"):
+            show_notes(notes)
+
+# 任务面板定时刷新（只重绘本面板，不重跑整个页面）
+@st.fragment(run_every=JOB_REFRESH_SECONDS)
+def show_job_panel():
+    queue = audit_job_queue()
+    job_ids = st.session_state.setdefault("audit_job_ids", [])
+    jobs = queue.snapshot(job_ids)
+    job_ids[:] = [job["id"] for job in jobs]  # 已被淘汰的任务不再显示
+    if not jobs:
+        st.info("ℹ️ 还没有后台审核任务。")
+    for job in reversed(jobs):
+        with st.container(border=True):
+            st.markdown(f"**{job['name']}** · 任务号 `{job['id']}` · {JOB_STATUS[job['status']]}")
+            if job["status"] in ("queued", "running"):
+                st.progress(job["fraction"], text=job["text"])
+                st.button("⏹️ 取消", key=f"cancel_{job['id']}", on_click=queue.cancel, args=(job["id"],))
+            elif job["status"] == "failed":
+                st.error(f"❌ 审核失败: {job['error']}")
+            elif job["status"] == "done":
+                audit = queue.result(job["id"])
+                if audit is not None:
+                    show_job_result(job["id"], audit)
+
+if background_enabled:
+    if st.button("📨 提交后台审核"):
+        st.session_state.setdefault("audit_job_ids", []).append(audit_job_queue().submit(
+            main_file.name, {file_kw: f.getvalue() for file_kw, f in input_files.items()},
+            profile=profile_enabled,
+            store=FingerprintStore() if incremental_enabled and not stream_enabled else None,
+            scope=scope, chunk_size=chunk_size,
+            ref_store=ReferenceStore() if ref_cache_enabled else None, bundle=bundle, compresslevel=compresslevel,
+        ))
+    show_job_panel()
+    st.stop()
+digests = {file_kw: file_digest(f) for file_kw, f in input_files.items()}
+parsed_workbooks = {}
+# 参考文件在预处理时按需解析（命中参考数据缓存时不解析）；分块流式审核时月重卡在比对阶段按块读取
+if not stream_enabled:
+    parsed_workbooks["月重卡"], parse_notes, records = parse_workbook_cached(digests["月重卡"], "月重卡", main_file, profile_enabled)
+    show_notes(parse_notes)
+    profile_records.extend(records)
 
 # =====================================
 # 🚀 (新) 预处理所有参考表
 # =====================================
 st.info("ℹ️ 正在预处理参考数据...")
 
-# (fk_df, zd_df, ec_df, zk_df 必须已经加载)
-fk_std = prepare_ref_df(fk_df, mapping_fk, 'fk')
-zd_std = prepare_ref_df(zd_df, mapping_zd, 'zd')
-ec_std = prepare_ref_df(ec_df, mapping_ec, 'ec')
-
-# 将所有预处理过的DF存入字典，传递给检查函数
-ref_dfs_std_dict = {
-    'fk': fk_std,
-    'zd': zd_std,
-    'ec': ec_std
-}
+# 标准化所有参考表并按合同号建立参考索引，传递给检查函数
+ref_key = "|".join(digests[file_kw] for file_kw in ("放款明细", "字段", "二次明细"))
+ref_files = {file_kw: input_files[file_kw].getvalue() for file_kw in ("放款明细", "字段", "二次明细")}
+try:
+    ref_index, missing_frame, ref_notes, records = prepare_refs_cached(
+        ref_key, ref_files, digests, ReferenceStore() if ref_cache_enabled else None, profile_enabled,
+    )
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+profile_records.extend(records)
+show_notes(ref_notes)
 st.success("✅ 参考数据预处理完成。")
 
 # =====================================
-# 🧾 多sheet循环 + 驻店客户表
+# 🧾 多sheet循环 + 驻店客户表（四张sheet互相独立，可并行）
 # =====================================
-sheet_keywords = ["二次", "部分担保", "随州", "驻店客户"]
+PARALLEL_MODES = {"process": "多进程并行", "thread": "多线程并行", "serial": "串行"}
+parallel_mode = st.sidebar.selectbox("多sheet执行方式", list(PARALLEL_MODES), format_func=PARALLEL_MODES.get)
+
 total_all = elapsed_all = skip_total = 0
 contracts_seen_all_sheets = set()
 
-# 循环处理四张sheet (调用新函数)
+# 每张sheet预留显示区域（进度条命中缓存时不会出现），结果按原顺序显示
+sheet_slots = {kw: st.container() for kw in sheet_keywords}
+progress_slots = {kw: (sheet_slots[kw].empty(), sheet_slots[kw].empty()) for kw in sheet_keywords}
+
+def report_progress(kw, fraction, text):
+    progress_bar, status = progress_slots[kw]
+    progress_bar.progress(fraction)
+    status.text(text)
+
+sheet_results = audit_sheets_cached(
+    digests["月重卡"], ref_key, main_file.getvalue() if stream_enabled else parsed_workbooks["月重卡"], ref_index,
+    parallel_mode, report_progress, profile_enabled,
+    FingerprintStore() if incremental_enabled and not stream_enabled else None, scope,
+    chunk_size, compresslevel,
+)
+
 for kw in sheet_keywords:
-    # 将 main_file 和 ref_dfs_std_dict 传递进去
-    count, used, skipped, seen = check_one_sheet(kw, main_file, ref_dfs_std_dict)
+    result, rendered = sheet_results[kw]
+    with sheet_slots[kw]:
+        show_notes(result["notes"])
+        used = result["elapsed"]
+
+        if rendered is not None:
+            # 分块流式审核：标注文件已在比对时写出（合并导出时打包在合并导出文件中）
+            if bundle is None:
+                st.download_button(
+                    label=f"📥 下载 {kw}审核标注版",
+                    data=rendered["annotated"],
+                    file_name=EXPORT_FILE_NAMES["annotated"].format(sheet=kw),
+                    key=f"download_{kw}" # 增加key避免streamlit重跑问题
+                )
+                if rendered["errors_only"] is not None:
+                    st.download_button(
+                        label=f"📥 下载 {kw} (仅含错误行, 带标红)",
+                        data=rendered["errors_only"],
+                        file_name=EXPORT_FILE_NAMES["errors_only"].format(sheet=kw),
+                        key=f"download_{kw}_errors_only"
+                    )
+            show_notes(rendered["notes"])
+            used += rendered["elapsed"]
+        elif used is not None and bundle is None:
+            main_df = parsed_workbooks["月重卡"][0][kw]
+            export_key = f"{digests['月重卡']}_{ref_key}_{kw}_{compresslevel}"
+            export_download(
+                f"{kw}审核标注版", EXPORT_FILE_NAMES["annotated"].format(sheet=kw), f"{export_key}_annotated",
+                partial(render_sheet_workbook_cached, digests["月重卡"], ref_key, kw, "annotated", compresslevel, main_df, result, profile_enabled),
+            )
+            if result["error_rows"]:
+                export_download(
+                    f"{kw} (仅含错误行, 带标红)", EXPORT_FILE_NAMES["errors_only"].format(sheet=kw), f"{export_key}_errors_only",
+                    partial(render_sheet_workbook_cached, digests["月重卡"], ref_key, kw, "errors_only", compresslevel, main_df, result, profile_enabled),
+                )
+        if used is not None:
+            st.success(f"✅ {kw} 检查完成，共 {result['total_errors']} 处错误，用时 {used:.2f} 秒。")
     
-    total_all += count
+    total_all += result["total_errors"]
     elapsed_all += used or 0
-    skip_total += skipped
-    contracts_seen_all_sheets.update(seen)
+    skip_total += result["skip_city_manager"]
+    contracts_seen_all_sheets.update(result["contracts_seen"])
+    profile_records.extend(result["profile"])
 
 st.success(f"🎯 全部审核完成，共 {total_all} 处错误，总耗时 {elapsed_all:.2f} 秒。")
 
 # =====================================
-# 🕵️ 漏填检查：跳过“是否车管家=是”与“提成类型=联合租赁/驻店”
+# 🕵️ 漏填检查 + 📤 导出字段表
 # =====================================
-field_contracts = zd_df[contract_col_zd].dropna().astype(str).str.strip()
-col_car_manager = find_col(zd_df, "是否车管家", exact=True)
-col_bonus_type = find_col(zd_df, "提成类型", exact=True)
-
-missing_contracts_mask = (~field_contracts.isin(contracts_seen_all_sheets))
-
-# 跳过“车管家=是”
-if col_car_manager:
-    missing_contracts_mask &= ~(zd_df[col_car_manager].astype(str).str.strip().str.lower() == "是")
-# 跳过“联合租赁/驻店”
-if col_bonus_type:
-    missing_contracts_mask &= ~(
-        zd_df[col_bonus_type].astype(str).str.strip().isin(["联合租赁", "驻店"])
-    )
-
-# 标记漏填
-zd_df_missing = zd_df.copy()
-zd_df_missing["漏填检查"] = ""
-zd_df_missing.loc[missing_contracts_mask, "漏填检查"] = "❗ 漏填"
-漏填合同数 = zd_df_missing["漏填检查"].eq("❗ 漏填").sum()
+(missing_mask, unmatched), records = find_missing_contracts_cached(
+    digests["字段"], digests["月重卡"], missing_frame, find_col(missing_frame, "合同"), contracts_seen_all_sheets, profile_enabled
+)
+profile_records.extend(records)
+漏填合同数 = int(missing_mask.sum())
 st.warning(f"⚠️ 共发现 {漏填合同数} 个合同在记录表中未出现（已排除车管家、联合租赁、驻店）")
+# 反方向：记录表中出现、字段表中没有的合同（最多列出 UNMATCHED_SHOWN 个）
+UNMATCHED_SHOWN = 20
+if unmatched:
+    shown = "、".join(unmatched[:UNMATCHED_SHOWN]) + ("……" if len(unmatched) > UNMATCHED_SHOWN else "")
+    st.warning(f"⚠️ 共有 {len(unmatched)} 个合同在记录表中出现、但字段表中没有：{shown}")
+
+# 字段表漏填标注版需要整表，只在生成导出文件时整表读取字段表
+def load_full_zd_df():
+    parsed, _, records = parse_workbook_cached(digests["字段"], "字段", zd_file, profile_enabled, full=True)
+    return reference_frame({"字段": parsed}, "字段", "重卡"), records
+
+if bundle is None:
+    export_key = f"{digests['字段']}_{digests['月重卡']}_{compresslevel}"
+    export_download(
+        "字段表漏填标注版", EXPORT_FILE_NAMES["all"], f"{export_key}_missing_all",
+        partial(render_missing_workbook_cached, digests["字段"], digests["月重卡"], "all", compresslevel, load_full_zd_df, missing_mask, profile_enabled),
+    )
+    if 漏填合同数:
+        export_download(
+            "仅漏填字段表", EXPORT_FILE_NAMES["missing_only"], f"{export_key}_missing_only",
+            partial(render_missing_workbook_cached, digests["字段"], digests["月重卡"], "missing_only", compresslevel, load_full_zd_df, missing_mask, profile_enabled),
+        )
+else:
+    # 合并导出：各sheet标注版与字段表两个版本一次写出，只需下载一次
+    export_download(
+        f"全部结果（{EXPORT_MODES[bundle]}）", BUNDLE_FORMATS[bundle], f"{digests['月重卡']}_{ref_key}_bundle_{bundle}_{compresslevel}",
+        partial(
+            render_export_bundle_cached, digests["月重卡"], ref_key, bundle, compresslevel, sheet_results,
+            None if stream_enabled else parsed_workbooks["月重卡"][0], load_full_zd_df, missing_mask, profile_enabled,
+        ),
+    )
 
 # =====================================
-# 📤 导出字段表（含漏填标注 + 仅漏填版）
+# 📈 性能分析结果（按阶段汇总 + 明细，可导出 JSON / CSV）
 # =====================================
-yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-
-# 全字段表（含漏填标注）
-wb = Workbook()
-ws = wb.active
-for c_idx, c in enumerate(zd_df_missing.columns, 1): ws.cell(1, c_idx, c)
-for r_idx, row in enumerate(zd_df_missing.itertuples(index=False), 2):
-    for c_idx, v in enumerate(row, 1):
-        ws.cell(r_idx, c_idx, v)
-        if zd_df_missing.columns[c_idx-1] == "漏填检查" and v == "❗ 漏填":
-            ws.cell(r_idx, c_idx).fill = yellow_fill
-
-output_all = BytesIO()
-wb.save(output_all)
-output_all.seek(0)
-st.download_button("📥 下载字段表漏填标注版", output_all, "字段表_漏填标注版.xlsx")
-
-# 仅漏填合同
-zd_df_only_missing = zd_df_missing[zd_df_missing["漏填检查"] == "❗ 漏填"].copy()
-if not zd_df_only_missing.empty:
-    wb2 = Workbook()
-    ws2 = wb2.active
-    for c_idx, c in enumerate(zd_df_only_missing.columns, 1): ws2.cell(1, c_idx, c)
-    for r_idx, row in enumerate(zd_df_only_missing.itertuples(index=False), 2):
-        for c_idx, v in enumerate(row, 1):
-            ws2.cell(r_idx, c_idx, v)
-            if zd_df_only_missing.columns[c_idx-1] == "漏填检查" and v == "❗ 漏填":
-                ws2.cell(r_idx, c_idx).fill = yellow_fill
-    out2 = BytesIO()
-    wb2.save(out2)
-    out2.seek(0)
-    st.download_button("📥 下载仅漏填字段表", out2, "字段表_仅漏填.xlsx")
+if profile_enabled:
+    st.subheader("📈 性能分析")
+    profile_df = profile_frame(profile_records)
+    st.dataframe(
+        profile_df.groupby("stage", sort=False).agg(
+            次数=("seconds", "size"), 总耗时秒=("seconds", "sum"), 最大内存峰值MB=("peak_mb", "max"), 最大保留内存MB=("retained_mb", "max")
+        ).sort_values("总耗时秒", ascending=False),
+        use_container_width=True,
+    )
+    st.dataframe(profile_df, use_container_width=True)
+    st.download_button(
+        "📥 下载性能记录 (JSON)", json.dumps(profile_records, ensure_ascii=False, indent=2), "性能分析.json",
+        mime="application/json",
+    )
+    st.download_button(
+        "📥 下载性能记录 (CSV)", profile_df.to_csv(index=False).encode("utf-8-sig"), "性能分析.csv", mime="text/csv",
+    )
 
 # =====================================
 # ✅ 结束提示
@@ -0,0 +1,190 @@
+# =====================================
+# 命令行批量审核：无需浏览器，对多个月份的文件组执行与网页版相同的检查
+# 用法：
+#   python audit_cli.py 数据目录 -o 输出目录            # 目录下（含子目录）每个包含四个文件的文件夹为一组
+#   python audit_cli.py 1月/ 2月/ 3月/ -o 输出目录 -j 3  # 多组并行
+#   python audit_cli.py a月重卡.xlsx b放款明细.xlsx c字段.xlsx d二次明细.xlsx -o 输出目录
+#   python audit_cli.py 数据目录 -o 输出目录 --bundle zip --compresslevel 1  # 每组只写一个 zip，低压缩级别压缩更快
+# 每组的标注文件写入 输出目录/组名/，全部结果汇总写入 输出目录/summary.json
+# =====================================
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from concurrent.futures import as_completed
+
+from audit_engine import (
+    INPUT_FILE_KEYWORDS, EXPORT_FILE_NAMES, BUNDLE_FORMATS, EXPORT_COMPRESSLEVEL,
+    find_file, make_executor, run_audit, profile_frame, FingerprintStore, ReferenceStore,
+)
+
+# =====================================
+# 📂 文件组发现
+# =====================================
+# 在一批 xlsx 中按文件名关键字找齐四个文件，缺任何一个返回 None（跳过 Excel 临时锁文件 ~$）
+def match_input_files(xlsx_paths):
+    xlsx_paths = [p for p in xlsx_paths if not p.name.startswith("~$")]
+    try:
+        return {file_kw: find_file(xlsx_paths, file_kw) for file_kw in INPUT_FILE_KEYWORDS}
+    except FileNotFoundError:
+        return None
+
+# 把命令行参数整理成文件组 {组名: {文件关键字: 路径}}：
+# 直接给出的 xlsx 文件合为一组；目录按文件夹递归查找，每个找齐四个文件的文件夹为一组
+def discover_month_sets(paths):
+    month_sets = {}
+    loose_files = [Path(p) for p in paths if Path(p).is_file()]
+    if loose_files:
+        files = match_input_files(loose_files)
+        if files is None:
+            raise FileNotFoundError(f"❌ 命令行给出的文件不全，需包含关键词：{'、'.join(INPUT_FILE_KEYWORDS)}")
+        month_sets[files["月重卡"].stem] = files
+
+    for root in (Path(p) for p in paths if Path(p).is_dir()):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            files = match_input_files([Path(dirpath) / f for f in sorted(filenames) if f.endswith(".xlsx")])
+            if files is None:
+                continue
+            name = Path(dirpath).relative_to(root).as_posix()
+            month_sets[root.name if name == "." else f"{root.name}/{name}"] = files
+    return month_sets
+
+# =====================================
+# 🧾 单组审核（在工作进程中运行，直接把结果文件写到磁盘，只返回汇总）
+# =====================================
+def write_output(out_dir, file_name, data, outputs):
+    (out_dir / file_name).write_bytes(data)
+    outputs.append(file_name)
+
+# profile=True 时额外写出 组名/性能分析.csv，并把性能记录放入汇总；
+# incremental=True 时按组名保存比对记录，再次运行只比对变化的行，变化情况放入汇总；
+# chunk_size 不为 None 时月重卡分块流式审核；ref_cache=True 时参考文件走持久化缓存（多组共用同一份参考文件时只解析一次）；
+# bundle 为 "workbook" / "zip" 时全部结果只写一个合并导出文件，compresslevel 为导出 xlsx 的压缩级别
+def audit_month_set(name, files, output_root, profile=False, incremental=False, chunk_size=None, ref_cache=False, bundle=None, compresslevel=None):
+    start = time.time()
+    out_dir = Path(output_root) / name
+    summary = {"name": name, "files": {file_kw: str(path) for file_kw, path in files.items()}}
+    try:
+        audit = run_audit(
+            {file_kw: Path(path).read_bytes() for file_kw, path in files.items()},
+            profile=profile, store=FingerprintStore() if incremental else None, scope=name, chunk_size=chunk_size,
+            ref_store=ReferenceStore() if ref_cache else None, bundle=bundle, compresslevel=compresslevel,
+        )
+    except Exception as e:
+        summary.update(status="error", error=str(e), elapsed=round(time.time() - start, 3))
+        return summary
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    sheets = {}
+    notes = list(audit["notes"])
+    for kw, (result, rendered) in audit["sheets"].items():
+        notes.extend(result["notes"])
+        sheets[kw] = {
+            "checked": result["elapsed"] is not None,
+            "total_errors": result["total_errors"],
+            "error_rows": len(result["error_rows"]),
+            "field_errors": result["field_errors"],
+            "skip_city_manager": result["skip_city_manager"],
+            "changes": result["changes"],
+        }
+        if rendered is None:
+            continue
+        notes.extend(rendered["notes"])
+        if bundle is not None:
+            continue  # 分块流式审核时标注文件已在比对时写出，并已打包进合并导出文件
+        for kind in ("annotated", "errors_only"):
+            if rendered[kind] is not None:
+                write_output(out_dir, EXPORT_FILE_NAMES[kind].format(sheet=kw), rendered[kind], outputs)
+
+    if bundle is not None:
+        write_output(out_dir, BUNDLE_FORMATS[bundle], audit["bundle"], outputs)
+    else:
+        for kind, data in zip(("all", "missing_only"), audit["missing_workbooks"]):
+            if data is not None:
+                write_output(out_dir, EXPORT_FILE_NAMES[kind], data, outputs)
+    if profile:
+        write_output(out_dir, "性能分析.csv", profile_frame(audit["profile"]).to_csv(index=False).encode("utf-8-sig"), outputs)
+        summary["profile"] = audit["profile"]
+
+    summary.update(
+        status="ok",
+        total_errors=audit["total_errors"],
+        missing_contracts=audit["missing_count"],
+        unmatched_contracts=audit["unmatched_contracts"],
+        sheets=sheets,
+        notes=[{"level": level, "message": text} for level, text in notes],
+        output_dir=str(out_dir),
+        outputs=outputs,
+        elapsed=round(time.time() - start, 3),
+    )
+    return summary
+
+# =====================================
+# 🚀 入口
+# =====================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="合同记录表批量审核（命令行版）")
+    parser.add_argument("paths", nargs="+", help="输入目录，或同一组的四个 xlsx 文件")
+    parser.add_argument("-o", "--output", default="audit_output", help="输出目录（默认 audit_output）")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并行处理的文件组数（默认 CPU 核数）")
+    parser.add_argument("--mode", choices=["process", "thread", "serial"], default="process", help="多组的执行方式")
+    parser.add_argument("--profile", action="store_true", help="记录各阶段耗时 / 内存峰值 / 行数")
+    parser.add_argument("--incremental", action="store_true", help="增量比对：只重新比对与上次运行相比有变化的行（记录保存在 .audit_cache/）")
+    parser.add_argument("--ref-cache", action="store_true", help="参考数据缓存：放款明细 / 字段 / 二次明细标准化结果按文件内容保存在 .audit_cache/references/，内容不变时不再解析")
+    parser.add_argument("--chunk-size", type=int, default=None, help="分块流式审核月重卡，每块行数（用于超大文件，峰值内存取决于块大小）")
+    parser.add_argument("--bundle", choices=list(BUNDLE_FORMATS), default=None, help="合并导出：全部结果写成一个工作簿（workbook，不能与 --chunk-size 同用）或一个 zip")
+    parser.add_argument("--compresslevel", type=int, choices=range(10), default=EXPORT_COMPRESSLEVEL, metavar="0-9", help="导出 xlsx 的压缩级别，越低压缩越快、文件越大（默认 6）")
+    args = parser.parse_args(argv)
+    if args.bundle == "workbook" and args.chunk_size:
+        parser.error("--bundle workbook 不能与 --chunk-size 同用（分块流式审核的结果只能打包为 zip）")
+    return args
+
+def print_summary(summary):
+    if summary["status"] == "ok":
+        print(f"✅ {summary['name']}: {summary['total_errors']} 处错误，漏填 {summary['missing_contracts']} 个合同，{len(summary['unmatched_contracts'])} 个合同不在字段表，用时 {summary['elapsed']:.2f} 秒")
+    else:
+        print(f"❌ {summary['name']}: {summary['error']}", file=sys.stderr)
+
+def main(argv=None):
+    args = parse_args(argv)
+    month_sets = discover_month_sets(args.paths)
+    if not month_sets:
+        print("⚠️ 未找到包含全部四个文件的文件组", file=sys.stderr)
+        return 2
+
+    start = time.time()
+    jobs = min(args.jobs or os.cpu_count() or 1, len(month_sets))
+    executor = make_executor(args.mode if jobs > 1 else "serial", max_workers=jobs)
+    summaries = {}
+    options = (args.profile, args.incremental, args.chunk_size, args.ref_cache, args.bundle, args.compresslevel)
+    if executor is None:
+        for name, files in month_sets.items():
+            summaries[name] = audit_month_set(name, files, args.output, *options)
+            print_summary(summaries[name])
+    else:
+        with executor:
+            futures = [executor.submit(audit_month_set, name, files, args.output, *options) for name, files in month_sets.items()]
+            for future in as_completed(futures):
+                summary = future.result()
+                summaries[summary["name"]] = summary
+                print_summary(summary)
+
+    ordered = [summaries[name] for name in month_sets]
+    report = {
+        "elapsed": round(time.time() - start, 3),
+        "month_sets": ordered,
+        "failed": [s["name"] for s in ordered if s["status"] != "ok"],
+    }
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    summary_path = Path(args.output) / "summary.json"
+    summary_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"🎯 共 {len(ordered)} 组，失败 {len(report['failed'])} 组，汇总见 {summary_path}")
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
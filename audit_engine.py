@@ -0,0 +1,2244 @@
+# =====================================
+# 审核引擎：与界面无关的读取、比对与导出逻辑
+# 不依赖 Streamlit，可在线程池 / 进程池的工作进程中运行；界面见 app2.py
+# =====================================
+
+import pandas as pd
+import numpy as np
+import os
+import re
+import json
+import hashlib
+import datetime
+import time
+import queue
+import threading
+import pickle
+import tempfile
+import sqlite3
+import ctypes
+import ctypes.util
+import importlib.util
+import multiprocessing
+from functools import partial, lru_cache
+from itertools import islice
+from contextlib import contextmanager, closing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from openpyxl import Workbook, load_workbook
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+from io import BytesIO
+from pandas.io.parsers import TextParser
+from pandas.tseries.api import guess_datetime_format
+
+try:
+    import pyarrow as pa  # 参考数据持久化缓存（Arrow IPC），未安装时不使用缓存
+except ImportError:
+    pa = None
+
+# =====================================
+# 📋 配置：需检查的sheet、各文件读取规则与对照字段映射
+# =====================================
+# 需检查的月重卡sheet
+sheet_keywords = ["二次", "部分担保", "随州", "驻店客户"]
+
+
+# 对照字段映射表
+# --- VVVV (这是新的，修正的) VVVV ---
+# 格式: {"记录表(主表)的列名": "放款明细(参考表)的列名关键字"}
+mapping_fk = {
+    # 这3个是正确的
+    "授信方": "授信方",     # "授信方" in "授信方"
+    "租赁本金": "租赁本金",  
+    "租赁期限": "租赁期限",
+    
+    # 这4个是修正的
+    "挂车台数": "挂车数量",     # "挂车数量" in "挂车数量"
+    "起租收益率": "XIRR"      # 假设 "费率" 是您想要的 "收益率"。如果不是，请修改为 "XIRR" 或其他
+}
+# --- ^^^^ (修正结束) ^^^^ ---
+
+
+mapping_zd = {"保证金比例": "保证金比例_2", "项目提报人": "提报", "起租时间": "起租日_商", "客户经理": "客户经理_资产", "所属省区": "区域", "主车台数": "主车台数", "城市经理": "城市经理"}
+mapping_ec = {"二次时间": "出本流程时间"}
+
+# 参考表需要读取的列：合同列 + 映射中的参考列，[(列关键字, 是否精确匹配)]，匹配规则同 find_col
+def ref_columns(mapping):
+    return [("合同", False)] + [(ref_kw, main_kw == "城市经理") for main_kw, ref_kw in mapping.items()]
+
+# 漏填检查（find_missing_contracts）用到的字段表列
+MISSING_CHECK_COLUMNS = [("合同", False), ("是否车管家", True), ("提成类型", True)]
+
+# 各文件需要读取的sheet：{文件关键字: [(sheet关键字, 表头行, 读取列), ...]}
+# sheet关键字为 None 表示第一个sheet；读取列为 None 表示读取全部列。
+# 月重卡需整表写回标注文件；参考文件只读比对与漏填检查用到的列
+WORKBOOK_SHEETS = {
+    "月重卡": [(kw, 1, None) for kw in sheet_keywords],  # 第二行为表头
+    "放款明细": [("威田", 0, ref_columns(mapping_fk))],
+    "字段": [("重卡", 0, ref_columns(mapping_zd) + MISSING_CHECK_COLUMNS)],
+    "二次明细": [(None, 0, ref_columns(mapping_ec))],
+}
+# 导出时需要整表读取的文件：字段表漏填标注版写出全部列（只在生成该文件时读取）
+EXPORT_SHEETS = {"字段": [("重卡", 0, None)]}
+
+# 需上传/输入的四个文件（按文件名关键字识别）
+INPUT_FILE_KEYWORDS = list(WORKBOOK_SHEETS)
+
+# Excel 读取引擎：安装了 python-calamine 时使用 calamine（读取快一个数量级），否则使用 openpyxl；
+# 可用环境变量 AUDIT_EXCEL_ENGINE 强制指定
+def excel_engine():
+    engine = os.environ.get("AUDIT_EXCEL_ENGINE")
+    if engine:
+        return engine
+    return "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
+# 合同号标准化的记忆表上限（原始文本 → 标准化合同号）。每月的合同号大多重复出现，
+# 记忆表在服务进程 / 工作进程内跨次审核保留，超过上限时淘汰最久未用的
+CONTRACT_KEY_CACHE_SIZE = 1 << 18
+_FLOAT_TAIL_RE = re.compile(r"\.0$")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+@lru_cache(maxsize=CONTRACT_KEY_CACHE_SIZE)
+def normalize_contract_text(text):
+    # 1. 移除常见的浮点数残留（以防原始数据错误输入）
+    text = _FLOAT_TAIL_RE.sub("", text)
+    # 2. 移除首尾空格、统一转换为大写（处理大小写不一致问题，如 'pazl' vs 'PAZL'）
+    text = text.strip().upper()
+    # 3. 处理全角/半角差异（将常见的全角连接符转为半角）
+    text = text.replace('－', '-')
+    # 4. 处理其他可能的空白字符（例如 tabs, 换行符等）
+    return _WHITESPACE_RE.sub("", text)
+
+def normalize_contract_key(series: pd.Series) -> pd.Series:
+    """
+    对合同号 Series 进行标准化处理，用于安全的 pd.merge 操作。
+    先统一转为字符串（缺失值为 'nan'），只对去重后的值逐个标准化（经记忆表），再按 factorize 编码映射回各行。
+    返回 category 列：标准化后相同的合同号共用一个类别，参考索引只按类别定位一次，再按编码取回各行。
+    """
+    codes, uniques = pd.factorize(series.astype(str))
+    key_codes, keys = pd.factorize(np.array([normalize_contract_text(text) for text in uniques], dtype=object))
+    return pd.Series(pd.Categorical.from_codes(key_codes[codes], keys), index=series.index, name=series.name)
+
+# =====================================
+# 📈 性能分析：按阶段 / 字段记录耗时、内存与行数（默认关闭）
+# =====================================
+# 各阶段的内存按进程常驻内存（RSS）统计：
+#   peak_mb     —— 阶段内常驻内存的最高值比阶段开始时多出的部分，包括阶段结束前已释放的临时数组
+#   retained_mb —— 阶段结束时比开始时多占用的常驻内存，可为负
+# 进程生命周期的峰值（ru_maxrss）只增不减，在长期运行的网页服务 / 复用的工作进程中看不出哪个阶段占内存；
+# 这里在顶层阶段（进程内没有其他阶段在统计）开始时把内核记录的峰值（/proc/self/status 的 VmHWM）重置为当前值
+# （写 /proc/self/clear_refs），之后各阶段开始时各取一次常驻内存与峰值的快照，结束时再读一次峰值：
+# 峰值在阶段内被抬高时，抬高后的峰值就是阶段内的最高值；没有被抬高时（阶段内的最高值不超过此前的峰值），
+# 以阶段开始、结束时的常驻内存中较大者计。嵌套阶段与其他线程的阶段都不会重置外层正在统计的峰值。
+# 仅 Linux 提供，其他平台两列为 None；同一进程内多线程并行的阶段互相计入对方的内存
+PROFILE_COLUMNS = ["stage", "target", "field", "rows", "seconds", "peak_mb", "retained_mb", "pid"]
+
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+_MEMORY_LOCK = threading.Lock()
+_open_stages = []  # 进程内正在统计的阶段：{"start": 开始时的常驻内存, "peak": 开始时的峰值}
+_memory_supported = os.path.exists(PROC_STATUS) and os.path.exists(PROC_CLEAR_REFS)
+
+# glibc 会把释放的小块内存留在进程里复用，之后的分配不再抬高常驻内存；顶层阶段开始计时前先归还给系统，
+# 阶段内的分配才会反映在峰值里（非 glibc 平台跳过）。嵌套阶段不调用，不在外层阶段的计时中引入额外开销
+def _load_malloc_trim():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6").malloc_trim
+    except (OSError, AttributeError):
+        return None
+
+_malloc_trim = _load_malloc_trim() if _memory_supported else None
+
+# 当前常驻内存与上次重置以来的峰值（字节）
+def _rss_and_peak():
+    values = {}
+    with open(PROC_STATUS) as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                name, amount, _ = line.split()
+                values[name] = int(amount) << 10
+    return values["VmRSS:"], values["VmHWM:"]
+
+def _reset_peak():
+    with open(PROC_CLEAR_REFS, "w") as f:
+        f.write("5")
+
+# 阶段开始：返回该阶段的统计项（开始时的常驻内存与峰值快照），不支持时返回 None
+def _memory_stage_start():
+    global _memory_supported
+    if not _memory_supported:
+        return None
+    with _MEMORY_LOCK:
+        try:
+            if not _open_stages:
+                if _malloc_trim is not None:
+                    _malloc_trim(0)
+                _reset_peak()
+            current, peak = _rss_and_peak()
+        except (OSError, KeyError, ValueError):
+            _memory_supported = False  # 如容器中不允许写 clear_refs
+            return None
+        entry = {"start": current, "peak": peak}
+        _open_stages.append(entry)
+        return entry
+
+# 阶段结束：返回 (peak_mb, retained_mb)
+def _memory_stage_end(entry):
+    if entry is None:
+        return None, None
+    with _MEMORY_LOCK:
+        _open_stages[:] = [open_entry for open_entry in _open_stages if open_entry is not entry]
+        try:
+            current, peak = _rss_and_peak()
+        except (OSError, KeyError, ValueError):
+            return None, None
+    highest = peak if peak > entry["peak"] else max(entry["start"], current)
+    return round((highest - entry["start"]) / (1 << 20), 1), round((current - entry["start"]) / (1 << 20), 1)
+
+# 用法：with profiler.stage("merge", target=sheet, rows=n) as record: ...，块内可补写 record["rows"]。
+# enabled=False 时不计时也不记录
+class StageProfiler:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.records = []
+
+    @contextmanager
+    def stage(self, stage, target=None, field=None, rows=None):
+        record = {"stage": stage, "target": target, "field": field, "rows": rows}
+        if not self.enabled:
+            yield record
+            return
+        memory = _memory_stage_start()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            peak_mb, retained_mb = _memory_stage_end(memory)
+            record.update(seconds=round(seconds, 6), peak_mb=peak_mb, retained_mb=retained_mb, pid=os.getpid())
+            self.records.append(record)
+
+# 未开启性能分析时使用的空记录器
+NULL_PROFILER = StageProfiler(enabled=False)
+
+# 性能记录转成表格（列顺序固定，便于显示与导出 CSV）
+def profile_frame(records):
+    return pd.DataFrame(records, columns=PROFILE_COLUMNS)
+
+# =====================================
+# 🧰 工具函数区（文件定位、列名模糊匹配、日期/数值处理）
+# =====================================
+
+# 按关键字查找文件（文件名包含关键字）
+def find_file(files_list, keyword):
+    for f in files_list:
+        if keyword in f.name:
+            return f
+    raise FileNotFoundError(f"❌ 未找到包含关键词「{keyword}」的文件")
+
+# 统一列名格式（去空格、转小写）
+def normalize_colname(c): return str(c).strip().lower()
+
+# 一组名称（列名或sheet名）的索引：名称只归一化一次，按 (关键字, 是否精确) 缓存全部匹配结果
+class NameIndex:
+    def __init__(self, names, normalize):
+        self.names = names
+        self.normalize = normalize
+        self.normalized = [normalize(name) for name in names]
+        self.by_name = {}  # 归一化名称 → 原名称列表（保持原顺序）
+        for name, norm in zip(names, self.normalized):
+            self.by_name.setdefault(norm, []).append(name)
+        self.cache = {}
+
+    # 按原顺序返回全部匹配的名称（exact=True 为归一化后相等，否则为包含关键字）
+    def matches(self, keyword, exact=False):
+        key = (keyword, exact)
+        if key not in self.cache:
+            target = self.normalize(keyword)
+            if exact:
+                self.cache[key] = tuple(self.by_name.get(target, ()))
+            else:
+                self.cache[key] = tuple(name for name, norm in zip(self.names, self.normalized) if target in norm)
+        return self.cache[key]
+
+# 列名索引按表头（列名元组）缓存：同一表头的各次 find_col 共用一个索引
+@lru_cache(maxsize=256)
+def column_index(columns):
+    return NameIndex(columns, normalize_colname)
+
+# sheet名按原样包含匹配（不去空格、不转小写）
+@lru_cache(maxsize=64)
+def sheet_index(sheet_names):
+    return NameIndex(sheet_names, str)
+
+# 关键字匹配到多个名称时的提示：仍使用第一个匹配（与原逻辑一致），但把其余候选显示出来
+def ambiguity_note(where, keyword, matched):
+    names = "、".join(f"「{name}」" for name in matched)
+    return ("warning", f"⚠️ {where}中关键字「{keyword}」匹配到多个：{names}，已使用第一个「{matched[0]}」。")
+
+# 按关键字匹配列名（支持 exact 精确匹配与模糊匹配）；
+# 传入 notes 时，匹配到多列会追加一条提示，where 为提示中的位置描述
+def find_col(df, keyword, exact=False, notes=None, where=""):
+    matched = column_index(tuple(df.columns)).matches(keyword, exact)
+    if not matched:
+        return None
+    if notes is not None and len(matched) > 1:
+        notes.append(ambiguity_note(where, keyword, matched))
+    return matched[0]
+
+# 查找sheet（sheet名包含关键字即可）；notes 同 find_col
+def find_sheet(xls, keyword, notes=None):
+    matched = sheet_index(tuple(xls.sheet_names)).matches(keyword)
+    if not matched:
+        raise ValueError(f"❌ 未找到包含关键词「{keyword}」的sheet")
+    if notes is not None and len(matched) > 1:
+        notes.append(ambiguity_note("工作簿", keyword, matched))
+    return matched[0]
+
+# 读取单个sheet。columns 为 [(列关键字, 是否精确匹配)] 时按 find_col 规则定位所需列，只保留这些列
+# （保持原列顺序，find_col 在结果上的匹配与整表一致）；没有匹配的列时返回没有列的空表。
+# 两种读取引擎都会载入整张sheet的单元格，但列的筛选在同一次解析中完成（usecols 为 ColumnSelector）：
+# 不另读表头，其余列也不会被转换成 DataFrame 列，省下解析与常驻内存。
+# 投影后的表里只剩第一个匹配列，所以多列匹配的提示在这里追加到 notes
+def read_sheet(xls, sheet_name, header, columns=None, notes=None):
+    if columns is None:
+        return xls.parse(sheet_name, header=header)
+    selector = ColumnSelector(columns)
+    df = xls.parse(sheet_name, header=header, usecols=selector)
+    selector.add_notes(notes, f"「{sheet_name}」")
+    return df
+
+# read_excel 的 usecols：pandas 按原列顺序对每个列名（已去重、空表头为 "Unnamed: n"，与整表读取的列名相同）调用一次，
+# 保留每个关键字按 find_col 规则的第一个匹配列，同时记下全部匹配，供多列匹配的提示使用
+class ColumnSelector:
+    def __init__(self, columns):
+        self.columns = columns
+        self.matched = {column: [] for column in columns}
+
+    def __call__(self, name):
+        norm = normalize_colname(name)
+        keep = False
+        for (keyword, exact), matched in self.matched.items():
+            target = normalize_colname(keyword)
+            if norm == target if exact else target in norm:
+                if name not in matched:
+                    matched.append(name)
+                keep |= matched[0] == name
+        return keep
+
+    def add_notes(self, notes, where):
+        if notes is None:
+            return
+        for keyword, exact in self.columns:
+            matched = self.matched[(keyword, exact)]
+            if len(matched) > 1:
+                notes.append(ambiguity_note(where, keyword, matched))
+
+# columns（[(列关键字, 是否精确匹配)]）各自按 find_col 匹配到的列在 df 中的位置（按原列顺序，去重）
+def matched_positions(df, columns, notes=None, where=""):
+    wanted = {find_col(df, keyword, exact=exact, notes=notes, where=where) for keyword, exact in columns} - {None}
+    return [i for i, col in enumerate(df.columns) if col in wanted]
+
+# 紧凑列类型：读入后按列收紧存储，值与逐行比对结果不变。
+# 只含字符串（缺失值为 NaN）且重复较多的文本列（授信方、省区、客户经理、提成类型等）转为 category，
+# 每行只存一个小整数编码，比对时按类别解析一次再按编码取回；整数列无损缩小到能容纳的最小位宽。
+# 金额等浮点列保持 float64：float32 只有约 7 位有效数字，会改变容差比对与写回的数值
+COMPACT_MAX_UNIQUE_RATIO = 0.5
+
+def compact_column(series):
+    if series.dtype.kind in "iu":
+        return pd.to_numeric(series, downcast="integer" if series.dtype.kind == "i" else "unsigned")
+    if series.dtype != object or len(series) == 0:
+        return series
+    values = series.to_numpy()
+    # None 与 NaN 转成 category 后都变成 NaN，而 str(None) 与 str(NaN) 不同，所以只接受 NaN 作缺失值
+    if not all(type(v) is str or (type(v) is float and v != v) for v in values):
+        return series
+    codes, uniques = pd.factorize(values)
+    if len(uniques) > len(values) * COMPACT_MAX_UNIQUE_RATIO:
+        return series
+    return pd.Series(pd.Categorical.from_codes(codes, uniques), index=series.index, name=series.name)
+
+def compact_frame(df):
+    return pd.DataFrame({i: compact_column(df.iloc[:, i]) for i in range(df.shape[1])}, index=df.index).set_axis(df.columns, axis=1)
+
+def is_categorical(values):
+    return isinstance(values.dtype, pd.CategoricalDtype)
+
+# category 列按类别算出的结果按编码取回各行，缺失行（编码 -1）取 fill
+def category_rows(codes, per_category, fill):
+    return np.append(per_category, fill)[codes]
+
+# 一次性解析整个工作簿，读取所需的全部sheet（sheet关键字为 None 时读取第一个sheet），各sheet按 compact_frame 收紧列类型
+# 返回 (frames, errors)：frames 为 {sheet关键字: DataFrame}，未找到的sheet不在其中；errors 为 {sheet关键字: 读取错误}
+# notes 不为 None 时收集sheet名 / 列名匹配到多个的提示
+def parse_workbook(data, sheet_specs, profiler=None, notes=None):
+    profiler = profiler or NULL_PROFILER
+    frames, errors = {}, {}
+    with pd.ExcelFile(BytesIO(data), engine=excel_engine()) as xls:
+        for sheet_kw, header, columns in sheet_specs:
+            try:
+                sheet_name = find_sheet(xls, sheet_kw, notes) if sheet_kw else xls.sheet_names[0]
+            except ValueError:
+                continue
+            try:
+                with profiler.stage("parse", target=sheet_name) as record:
+                    df = read_sheet(xls, sheet_name, header, columns, notes)
+                    record["rows"] = len(df)
+                with profiler.stage("compact", target=sheet_name, rows=len(df)):
+                    frames[sheet_kw] = compact_frame(df)
+            except Exception as e:
+                errors[sheet_kw] = e
+    return frames, errors
+
+# 从 parse_workbook 的解析结果中取出参考文件的指定sheet，缺失或读取失败时抛出 ValueError
+def reference_frame(parsed, file_kw, sheet_kw):
+    frames, errors = parsed[file_kw]
+    if sheet_kw in errors:
+        raise ValueError(f"❌ 读取「{file_kw}」时出错: {errors[sheet_kw]}")
+    if sheet_kw not in frames:
+        raise ValueError(f"❌ 在「{file_kw}」中未找到包含关键词「{sheet_kw}」的sheet")
+    return frames[sheet_kw]
+
+# 统一数值解析（去逗号、转float、处理百分号）
+def normalize_num(val):
+    if pd.isna(val): return None
+    s = str(val).replace(",", "").strip()
+    if s in ["", "-", "nan"]: return None
+    try:
+        if "%" in s: return float(s.replace("%", "")) / 100
+        return float(s)
+    except ValueError:
+        return s
+
+# normalize_num 的向量化版本：去逗号、处理百分号后用 pd.to_numeric 批量解析，
+# pd.to_numeric 解析不了的值再按唯一值用 float() 兜底，保证结果与逐个调用 normalize_num 一致。
+# 返回三个与 series 对齐的 Series：
+#   is_num —— normalize_num 返回数值（含 float("NaN") 这类 NaN 数值）
+#   num    —— 数值结果（其余位置为 NaN）
+#   text   —— 无法解析为数值时返回的字符串（其余位置为 NaN）
+# is_num 为 False 且 text 为 NaN，即 normalize_num 返回 None
+def normalize_num_vec(series):
+    return _apply_float_inference(*normalize_num_raw(series))
+
+# 逐行解析结果（尚未做整列类型推断），每一行的结果只取决于该行的值
+def normalize_num_raw(series):
+    if is_categorical(series):
+        # category 列：每个类别只解析一次，缺失行与 NaN 的结果相同（不是数值也没有文本）
+        codes = series.cat.codes.to_numpy()
+        is_num, num, text = normalize_num_raw(pd.Series(series.cat.categories, dtype=object))
+        return (
+            pd.Series(category_rows(codes, is_num.to_numpy(), False), index=series.index),
+            pd.Series(category_rows(codes, num.to_numpy(), np.nan), index=series.index),
+            pd.Series(category_rows(codes, text.to_numpy(), np.nan), index=series.index),
+        )
+    if series.dtype.kind in "iuf":
+        # 纯数值列：str(val) 再 float() 不会改变数值，直接转换
+        num = series.astype(float)
+        is_num = num.notna()
+        text = pd.Series(np.nan, index=series.index, dtype=object)
+        return is_num, num, text
+
+    # 非 object 列（日期、布尔等）先转成 Python 对象，保证 astype(str) 与逐个 str(val) 一致
+    obj = series if series.dtype == object else series.astype(object)
+    s = obj.astype(str).str.replace(",", "", regex=False).str.strip()
+    empty = obj.isna() | s.isin(["", "-", "nan"])
+    is_pct = s.str.contains("%", regex=False) & ~empty
+    body = s.mask(is_pct, s.str.replace("%", "", regex=False)).mask(empty)
+
+    # pd.to_numeric 负责快速判定哪些值可解析；其快速解析器不保证与 float() 逐位一致，
+    # 数值本身再用 astype(float)（即 Python 的 float 解析）重新转换一次
+    num = pd.to_numeric(body, errors="coerce").astype(float)
+    is_num = num.notna()
+    if is_num.any():
+        num[is_num] = body[is_num].astype(float)
+
+    # pd.to_numeric 不接受但 float() 接受的写法（如 "1_000"、全角数字、"NaN"）逐个唯一值兜底
+    fallback = ~empty & ~is_num
+    if fallback.any():
+        parsed = {}
+        for u in body[fallback].unique():
+            try:
+                parsed[u] = float(u)
+            except ValueError:
+                pass
+        if parsed:
+            fb_values = body[fallback].map(parsed)
+            fb_ok = body[fallback].isin(parsed.keys())
+            num.loc[fb_ok[fb_ok].index] = fb_values[fb_ok]
+            is_num.loc[fb_ok[fb_ok].index] = True
+
+    num = num.where(~is_pct, num / 100)
+    text = s.where(~empty & ~is_num)
+    return is_num, num, text
+
+# 复刻 Series.apply(normalize_num) 的类型推断：结果里没有字符串时整列被推断为 float64，
+# None 变成 NaN，之后按数值（fillna(0)）参与比较。infer 为 None 时按传入的行判断，
+# 只处理部分行时由调用方传入整列的判断结果
+def _apply_float_inference(is_num, num, text, infer=None):
+    if infer is None:
+        infer = bool(is_num.any()) and not text.notna().any()
+    if infer:
+        is_num = pd.Series(True, index=is_num.index)
+    return is_num, num, text
+
+# 与 pd.to_datetime 的格式推断一致：取第一个非空值，为字符串时按它推断格式，推断不出则逐个解析（"mixed"）。
+# 只解析部分行时传入整列的推断结果，保证与整列解析一致；非 object 列不需要推断，返回 None
+NAT_STRINGS = {"NaT", "nat", "NAT", "nan", "NaN", "none", "None"}
+
+def date_format_context(series):
+    if series.dtype != object and not is_categorical(series):
+        return None
+    return date_format_of(first_date_value(series))
+
+# 第一个非空值（跳过缺失值、空字符串与 "NaT" 等字符串），没有时返回 None
+def first_date_value(series):
+    for value in series.to_numpy(dtype=object):
+        if isinstance(value, str):
+            if value and value not in NAT_STRINGS:
+                return value
+        elif not pd.isna(value):
+            return value
+    return None
+
+def date_format_of(value):
+    return (guess_datetime_format(value) or "mixed") if isinstance(value, str) else "mixed"
+
+# 是否按日期比较（字段名含“日期”或“时间”）
+def is_date_field(main_kw):
+    return any(k in main_kw for k in ["日期", "时间"])
+
+# normalize_num 结果转成比较用的字符串（复刻 astype(str).str.strip() 再去掉 ".0" 后缀）
+def num_text_repr(is_num, num, text):
+    out = text.where(~is_num, num.astype(str)).fillna("None")
+    return out.str.replace(r"\.0$", "", regex=True)
+
+# 日期匹配（年/月/日完全一致）
+def same_date_ymd(a, b):
+    try:
+        da = pd.to_datetime(a, errors='coerce')
+        db = pd.to_datetime(b, errors='coerce')
+        if pd.isna(da) or pd.isna(db): return False
+        return (da.year, da.month, da.day) == (db.year, db.month, db.day)
+    except Exception:
+        return False
+def prepare_ref_df(ref_df, mapping, prefix, notes, profiler=None):
+    # notes: 收集提示信息 [(级别, 文本)]，由界面统一显示
+    profiler = profiler or NULL_PROFILER
+    # --- 修正开始 ---
+    
+    # 1. 找到参考表(ref_df)中的“合同”列
+    # 我们使用 find_col，这才是正确的做法
+    contract_col = find_col(ref_df, "合同", notes=notes, where=f"{prefix} 参考表")
+    
+    # 2. 如果在 ref_df 中找不到合同列，则无法继续
+    if not contract_col:
+        notes.append(("warning", f"⚠️ 在 {prefix} 参考表中未找到'合同'列，跳过此数据源。"))
+        return pd.DataFrame(columns=['__KEY__']) # 返回一个空的带key的df
+        
+    std_df = pd.DataFrame()
+    
+    # 3. VVVV 插入归一化函数 VVVV
+    # 使用找到的 contract_col 来应用归一化
+    with profiler.stage("prepare_ref_key", target=prefix, rows=len(ref_df)):
+        std_df['__KEY__'] = normalize_contract_key(ref_df[contract_col])
+    # ^^^^ 插入归一化函数 ^^^^
+    
+    # --- 修正结束 ---
+    # 4. 提取并重命名所有需要的字段（列名匹配方式与转换见比对计划的 FieldRule，如租赁期限 年 -> 月）
+    for rule in compile_comparison_plan({prefix: mapping}):
+        ref_col_name = find_col(ref_df, rule.ref_kw, exact=rule.exact, notes=notes, where=f"{prefix} 参考表")
+        
+        if ref_col_name:
+            with profiler.stage("prepare_ref_field", target=prefix, field=rule.main_kw, rows=len(ref_df)):
+                # 获取原始数据 Series
+                s_ref_raw = ref_df[ref_col_name]
+                if rule.ref_scale is not None:
+                    values = pd.to_numeric(s_ref_raw, errors='coerce')
+                    # 整数列解析时可能已压缩为 int8 / int16（见 compact_column），先还原为 int64 再换算，否则会溢出
+                    if values.dtype.kind in "iu":
+                        values = values.astype(np.int64)
+                    std_df[rule.ref_col] = values * rule.ref_scale
+                else:
+                    # 无转换，直接赋值
+                    std_df[rule.ref_col] = s_ref_raw
+        else:
+            notes.append(("warning", f"⚠️ 在 {prefix} 参考表中未找到列 (main: '{rule.main_kw}', ref: '{rule.ref_kw}')"))
+
+    # 5. 效仿原始逻辑：只取第一个匹配项 (这部分逻辑保持不变)
+    with profiler.stage("prepare_ref_dedup", target=prefix, rows=len(std_df)):
+        std_df = std_df.drop_duplicates(subset=['__KEY__'], keep='first')
+    return std_df
+
+# =====================================
+# 🧮 比对计划：映射与比对规则只编译一次，各sheet按字段类型分组批量比对
+# =====================================
+# 视为空值的字符串：比对时两边都为空不算错误；城市经理参考值为空时跳过该行
+EMPTY_STRINGS = ["", "nan", "None"]
+SKIP_EMPTY_STRINGS = ["", "-", "nan", "none", "null"]
+
+# 数值容差 (tol, inclusive)：差值 > tol 算错误，inclusive 时差值 >= tol 算错误
+def numeric_tolerance(main_kw):
+    if main_kw == "保证金比例":
+        return 0.00500001, False # 保证金比例容错
+    if "租赁期限" in main_kw: # 匹配 "租赁期限" 和 "租赁期限月"
+        return 1.0, True # 忽略小于 1.0 个月的差距 (即：差异 >= 1.0 才算错误)
+    return 1e-6, False # 其他数值字段，使用标准微小容错
+
+# 一个对照字段的全部比对规则
+class FieldRule:
+    def __init__(self, prefix, main_kw, ref_kw):
+        self.prefix, self.main_kw, self.ref_kw = prefix, main_kw, ref_kw
+        self.field_id = f"{prefix}.{main_kw}"
+        self.ref_col = f"ref_{prefix}_{main_kw}"
+        self.exact = (main_kw == "城市经理")         # 城市经理需要精确匹配列名
+        self.skip_empty_ref = (main_kw == "城市经理") # 参考值为空时跳过该行
+        self.kind = "date" if is_date_field(main_kw) else "value"
+        tol, inclusive = numeric_tolerance(main_kw)
+        # 统一成 "差值 > threshold"：inclusive 时取 tol 之下最近的浮点数
+        self.threshold = np.nextafter(tol, -np.inf) if inclusive else tol
+        # 参考列的转换：放款明细的租赁期限单位为年，× 12 换算成月
+        self.ref_scale = 12 if (prefix, main_kw) == ("fk", "租赁期限") else None
+
+# 把 {前缀: 映射} 编译成比对计划（按映射顺序的 FieldRule 列表）
+def compile_comparison_plan(mappings):
+    return [FieldRule(prefix, main_kw, ref_kw) for prefix, mapping in mappings.items() for main_kw, ref_kw in mapping.items()]
+
+COMPARISON_PLAN = compile_comparison_plan({'fk': mapping_fk, 'zd': mapping_zd, 'ec': mapping_ec})
+
+# 按主表字段名取规则（compare_series_vec 等只给出字段名的调用方使用）；不在计划中的字段按默认规则
+def rule_for(main_kw):
+    return next((rule for rule in COMPARISON_PLAN if rule.main_kw == main_kw), None) or FieldRule("", main_kw, main_kw)
+
+# 把计划绑定到一张主表：返回 [(规则, 主表列名)]，跳过主表缺列、参考表缺列或参考表为空的字段
+def bind_plan(main_df, ref_index, notes=None, where=""):
+    bound = []
+    for rule in COMPARISON_PLAN:
+        if not ref_index.has_source(rule.prefix):
+            continue
+        main_col = find_col(main_df, rule.main_kw, exact=rule.exact, notes=notes, where=where)
+        if main_col and rule.ref_col in ref_index:
+            bound.append((rule, main_col))
+    return bound
+
+# 空值判断（NaN 或去空格后属于 strings）
+def empty_mask(series, stripped, strings):
+    return (pd.isna(series) | stripped.isin(strings)).to_numpy()
+
+# 一个字段逐行的比对操作数（与主表行对齐的 NumPy 数组），由 evaluate_operands 按类型分组批量比对。
+# context 传入整列层面的解析参数，只比对部分行时结果与整列比对一致：
+#   "main_format"/"ref_format" 为日期格式（缺省时按本列推断），"main_dates"/"ref_dates" 为已解析的 parse_date_days 结果，
+#   "main_num"/"ref_num" 为已做整列类型推断的 normalize_num_vec 结果
+def field_operands(rule, s_main, s_ref, context=None):
+    context = context or {}
+    ref_stripped = s_ref.astype(str).str.strip()
+    main_is_na = empty_mask(s_main, s_main.astype(str).str.strip(), EMPTY_STRINGS)
+    ops = {
+        # 两者都为空（NaN, "", "None"等），不算错误；参考值是物理 NaN（合同不在参考表）且主表不为空时忽略
+        "ignore": (main_is_na & empty_mask(s_ref, ref_stripped, EMPTY_STRINGS)) | (s_ref.isna().to_numpy() & ~main_is_na),
+        "skip": empty_mask(s_ref, ref_stripped, SKIP_EMPTY_STRINGS) if rule.skip_empty_ref else np.zeros(len(s_ref), dtype=bool),
+    }
+
+    if rule.kind == "date":
+        main_valid, ops["main_days"] = context.get("main_dates") or parse_date_days(
+            s_main, context["main_format"] if "main_format" in context else date_format_context(s_main))
+        ref_valid, ops["ref_days"] = context.get("ref_dates") or parse_date_days(
+            s_ref, context["ref_format"] if "ref_format" in context else date_format_context(s_ref))
+        ops["valid"] = main_valid & ref_valid
+        return ops
+
+    main_is_num, main_num, main_text = context.get("main_num") or normalize_num_vec(s_main)
+    ref_is_num, ref_num, ref_text = context.get("ref_num") or normalize_num_vec(s_ref)
+    # normalize_num 结果为空：None、NaN 数值或字符串 "None"
+    main_is_na_norm = (main_is_num & main_num.isna()) | (~main_is_num & (main_text.isna() | main_text.eq("None")))
+    ref_is_na_norm = (ref_is_num & ref_num.isna()) | (~ref_is_num & (ref_text.isna() | ref_text.eq("None")))
+    both_are_num = main_is_num & ref_is_num
+    ops["ignore"] |= (main_is_na_norm & ref_is_na_norm).to_numpy()
+    ops["both_num"] = both_are_num.to_numpy()
+    ops["main_num"] = main_num.fillna(0).to_numpy(dtype=float) # fillna(0) for safety
+    ops["ref_num"] = ref_num.fillna(0).to_numpy(dtype=float)
+
+    # 文本比较（不都是数值的行）：逐行比较字符串，结果按行写回
+    text_errors = np.zeros(len(s_main), dtype=bool)
+    not_num_mask = ~both_are_num
+    if not_num_mask.any():
+        str_main = num_text_repr(main_is_num[not_num_mask], main_num[not_num_mask], main_text[not_num_mask])
+        str_ref = num_text_repr(ref_is_num[not_num_mask], ref_num[not_num_mask], ref_text[not_num_mask])
+        text_errors[not_num_mask.to_numpy()] = (str_main != str_ref).to_numpy()
+    ops["text_errors"] = text_errors
+    return ops
+
+# 日期 → 日历日序号（只比较年/月/日，与 .dt.date 一致；带时区的取当地日期）
+def date_days(dates):
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy().astype("datetime64[D]").view(np.int64)
+
+# 按给定格式解析日期列（与 pd.to_datetime(series, errors='coerce', format=fmt) 逐行一致），返回 (是否有效, 日历日序号)。
+# 格式固定后逐个值独立解析，所以 object 列只解析去重后的字符串，再按 factorize 编码映射回各行；
+# 非字符串值（datetime、Excel 序列号等）单独转换，不与字符串混在一起去重；category 列直接按类别解析
+def parse_date_days(series, fmt):
+    if is_categorical(series):
+        codes = series.cat.codes.to_numpy()
+        valid, days = parse_date_days(pd.Series(series.cat.categories, dtype=object), fmt)
+        return category_rows(codes, valid, False), category_rows(codes, days, 0)
+    if series.dtype != object:
+        dates = pd.to_datetime(series, errors='coerce', format=fmt)
+        return dates.notna().to_numpy(), date_days(dates)
+    values = series.to_numpy()
+    is_str = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+    valid = np.zeros(len(values), dtype=bool)
+    days = np.zeros(len(values), dtype=np.int64)
+    if is_str.any():
+        codes, uniques = pd.factorize(values[is_str])
+        dates = pd.to_datetime(pd.Series(uniques, dtype=object), errors='coerce', format=fmt)
+        valid[is_str] = dates.notna().to_numpy()[codes]
+        days[is_str] = date_days(dates)[codes]
+    if not is_str.all():
+        dates = pd.to_datetime(pd.Series(values[~is_str], dtype=object), errors='coerce', format=fmt)
+        valid[~is_str] = dates.notna().to_numpy()
+        days[~is_str] = date_days(dates)
+    return valid, days
+
+# 按类型分组批量比对：同类字段的操作数拼成（行 × 字段）矩阵，每组只做一次 NumPy 运算。
+# 返回与 rules 顺序一致的错误矩阵（没有字段时为 n_rows × 0）；apply_skip=False 时不排除城市经理的跳过行（compare_series_vec 使用）
+def evaluate_operands(rules, operands, apply_skip=True, n_rows=None):
+    n = len(operands[0]["ignore"]) if operands else (n_rows or 0)
+    errors = np.zeros((n, len(rules)), dtype=bool)
+    for kind in ("value", "date"):
+        cols = [i for i, rule in enumerate(rules) if rule.kind == kind]
+        if not cols:
+            continue
+        group = [operands[i] for i in cols]
+        stack = lambda key: np.column_stack([ops[key] for ops in group])
+        if kind == "date":
+            found = stack("valid") & (stack("main_days") != stack("ref_days"))
+        else:
+            thresholds = np.array([rules[i].threshold for i in cols])
+            num_errors = np.abs(stack("main_num") - stack("ref_num")) > thresholds
+            found = np.where(stack("both_num"), num_errors, stack("text_errors"))
+        found &= ~stack("ignore")
+        if apply_skip:
+            found &= ~stack("skip")
+        errors[:, cols] = found
+    return errors
+
+def compare_series_vec(s_main, s_ref, main_kw, context=None):
+    """
+    向量化比较两个Series，复刻原始的 compare_fields_and_mark 逻辑。
+    返回一个布尔Series，True表示存在差异。
+    (V2：增加对 merge 失败 (NaN) 的静默跳过)
+    (V3：context 传入整列层面的解析参数，见 field_operands)
+    (V4：规则取自比对计划，单个字段按 field_operands + evaluate_operands 比对；不含城市经理的跳过逻辑)
+    """
+    rule = rule_for(main_kw)
+    errors = evaluate_operands([rule], [field_operands(rule, s_main, s_ref, context)], apply_skip=False)
+    return pd.Series(errors[:, 0], index=s_main.index)
+
+# =====================================
+# 🔗 参考索引：三张标准化参考表按合同号只建一次索引，各sheet按位置取列，代替每张sheet三次整表 merge
+# =====================================
+class RefIndex:
+    def __init__(self, ref_dfs_std_dict):
+        frames = {prefix: df for prefix, df in ref_dfs_std_dict.items() if not df.empty}
+        # 所有参考表合同号的并集（各表 __KEY__ 已去重），查找走哈希索引
+        self.keys = pd.Index(pd.unique(pd.concat([df['__KEY__'].astype(object) for df in frames.values()]))) if frames else pd.Index([])
+        # 每张参考表：并集中第 i 个合同号在该表中的行号，-1 表示该表没有这个合同
+        self.rows = {prefix: pd.Index(df['__KEY__'].astype(object)).get_indexer(self.keys) for prefix, df in frames.items()}
+        # 参考列（ref_{prefix}_{字段}）所在的参考表与原始列，取列时不做类型转换
+        self.columns = {
+            col: (prefix, df[col].array if isinstance(df[col].dtype, pd.api.extensions.ExtensionDtype) else df[col].to_numpy())
+            for prefix, df in frames.items() for col in df.columns if col != '__KEY__'
+        }
+        self.row_hashes = None
+        self.parsed_dates = {}  # (参考列, 日期格式) → 整列的 parse_date_days 结果
+
+    def __contains__(self, ref_col):
+        return ref_col in self.columns
+
+    def has_source(self, prefix):
+        return prefix in self.rows
+
+    # 主表合同号 → 在合同号并集中的位置，-1 表示所有参考表都没有该合同。
+    # normalize_contract_key 的 category 结果只查找各类别，再按编码取回各行
+    def locate(self, keys):
+        if is_categorical(keys):
+            return category_rows(keys.cat.codes.to_numpy(), self.keys.get_indexer(keys.cat.categories), -1)
+        return self.keys.get_indexer(keys)
+
+    # 按 locate 的结果取出与主表行对齐的参考列；未匹配的行填缺失值，类型变化与左连接 merge 一致
+    def column(self, ref_col, positions, index):
+        prefix, values = self.columns[ref_col]
+        rows = np.where(positions >= 0, self.rows[prefix][positions], -1)
+        return pd.Series(pd.api.extensions.take(values, rows, allow_fill=True), index=index, name=ref_col)
+
+    # 与主表行对齐的参考日期 (是否有效, 日历日序号)，与 parse_date_days(self.column(...), fmt) 一致。
+    # object / category 列按 (列, 格式) 整列只解析一次，四张sheet按行号取用；其他类型的列对齐后类型可能变化，返回 None 由调用方直接解析
+    def date_days(self, ref_col, positions, fmt):
+        prefix, values = self.columns[ref_col]
+        if values.dtype != object and not is_categorical(values):
+            return None
+        parsed = self.parsed_dates.get((ref_col, fmt))
+        if parsed is None:
+            parsed = self.parsed_dates[(ref_col, fmt)] = parse_date_days(pd.Series(values, dtype=values.dtype), fmt)
+        rows = np.where(positions >= 0, self.rows[prefix][positions], -1)
+        valid, days = parsed
+        return np.where(rows >= 0, valid[rows], False), np.where(rows >= 0, days[rows], 0)
+
+    # 按整列推断的格式预先解析日期参考列（分发给工作进程前算好，各sheet对齐后推断出的格式通常与整列相同）
+    def prepare_dates(self):
+        for ref_col, (prefix, values) in self.columns.items():
+            if is_date_field(ref_col) and (values.dtype == object or is_categorical(values)):
+                self.date_days(ref_col, np.zeros(0, dtype=np.intp), date_format_of(first_date_value(pd.Series(values, dtype=values.dtype))))
+
+    # 每张参考表逐行的内容指纹（仅增量比对需要，首次使用时计算；分发给工作进程前先算好，避免各进程重复计算）
+    def prepare_fingerprints(self):
+        if self.row_hashes is None:
+            self.row_hashes = {}
+            for prefix in self.rows:
+                df = pd.DataFrame({col: values for col, (p, values) in self.columns.items() if p == prefix})
+                self.row_hashes[prefix] = row_fingerprints(df, list(df.columns), [c for c in df.columns if is_date_field(c)])
+
+    # 与主表行对齐的参考内容指纹：各参考表对应行的指纹（没有该合同时为 0）合成一个
+    def fingerprints(self, positions):
+        self.prepare_fingerprints()
+        parts = {}
+        for prefix, hashes in self.row_hashes.items():
+            if not len(hashes):
+                continue  # 该参考表没有参考列
+            rows = np.where(positions >= 0, self.rows[prefix][positions], -1)
+            parts[prefix] = np.where(rows >= 0, hashes[rows], np.uint64(0))
+        if not parts:
+            return np.zeros(len(positions), dtype=np.uint64)
+        return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+# =====================================
+# 🔁 增量比对：按合同保存每行的内容指纹与比对结果（SQLite），重新上传修改后的文件时只比对有变化的行
+# =====================================
+# 比对规则变化时递增，旧记录自动作废
+FINGERPRINT_VERSION = 2
+# 持久化缓存目录，可用环境变量 AUDIT_CACHE_DIR 指定
+AUDIT_CACHE_DIR = os.environ.get("AUDIT_CACHE_DIR", ".audit_cache")
+# 指纹库记录总大小上限（MB），超过时删除最久未更新的记录，可用环境变量 AUDIT_FINGERPRINT_MB 指定
+FINGERPRINT_MAX_BYTES = int(os.environ.get("AUDIT_FINGERPRINT_MB", "256")) << 20
+
+# 每个 (范围, sheet) 一条记录：字段计划（JSON）+ 按合同号逐行的数组（npz）。
+# 逐行插入十万行要近一秒，整块读写只需几毫秒
+FINGERPRINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheet_fingerprints (
+    scope TEXT, sheet TEXT, version INTEGER, plan TEXT, rows BLOB, updated REAL,
+    PRIMARY KEY (scope, sheet)
+);
+"""
+FINGERPRINT_COLUMNS = ["key", "occ", "main_hash", "ref_hash", "err_mask", "skip", "kinds"]
+# kinds 每个字段占 4 位存于 int64，字段数超过上限时不做增量比对
+MAX_INCREMENTAL_FIELDS = 15
+
+# 逐行内容指纹（uint64），按列的原始类型计算（列类型变化时整列指纹都会变，需重新比对，偏保守）。
+# object 列中值的字符串形式相同、类型不同（如日期对象与日期字符串）时哈希相同，日期字段的解析结果却可能不同，
+# typed_columns 中的 object 列额外计入值的类型
+def row_fingerprints(df, columns, typed_columns=()):
+    parts = [df[c] for c in columns]
+    parts += [df[c].map(lambda v: type(v).__name__) for c in typed_columns if df[c].dtype == object]
+    if not parts:
+        return np.zeros(len(df), dtype=np.uint64)
+    frame = pd.concat(parts, axis=1, keys=range(len(parts)))
+    # categorize=False：按唯一值分类哈希时会对唯一值重新推断类型，同一个值的哈希会随整列其他内容变化
+    return pd.util.hash_pandas_object(frame, index=False, categorize=False).to_numpy()
+
+# 数值/文本字段每行的解析类别（4 位）：主表是数值、主表是文本、参考是数值、参考是文本。
+# 整列类型推断（_apply_float_inference）只取决于这些位，未变化的行沿用上次保存的值即可得出整列结论
+def field_kinds(raw_main, raw_ref):
+    return (
+        raw_main[0].to_numpy(dtype=np.int64)
+        | raw_main[2].notna().to_numpy(dtype=np.int64) << 1
+        | raw_ref[0].to_numpy(dtype=np.int64) << 2
+        | raw_ref[2].notna().to_numpy(dtype=np.int64) << 3
+    )
+
+# 指纹库只保存文件路径，可传给工作进程，各自打开连接；多个进程同时写入由 SQLite 加锁（WAL 模式）。
+# 每次保存后按总大小淘汰最久未更新的记录（见 evict）
+class FingerprintStore:
+    def __init__(self, path=None, max_bytes=FINGERPRINT_MAX_BYTES):
+        self.path = path or os.path.join(AUDIT_CACHE_DIR, "fingerprints.sqlite")
+        self.max_bytes = max_bytes
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # 只在建库时生效：删除记录后可把空间还给文件系统
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(FINGERPRINT_SCHEMA)
+        return conn
+
+    # 返回 (字段计划, 各行记录 DataFrame)；没有记录或版本不符时返回 ({}, None)
+    def load(self, scope, sheet):
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT plan, rows FROM sheet_fingerprints WHERE scope=? AND sheet=? AND version=?",
+                (scope, sheet, FINGERPRINT_VERSION),
+            ).fetchone()
+        if row is None:
+            return {}, None
+        with np.load(BytesIO(row[1]), allow_pickle=False) as arrays:
+            rows = pd.DataFrame({col: arrays[col] for col in FINGERPRINT_COLUMNS})
+        return json.loads(row[0]), rows
+
+    # 整块替换该 sheet 的记录
+    def save(self, scope, sheet, plan, rows):
+        buffer = BytesIO()
+        arrays = {col: rows[col].to_numpy() for col in FINGERPRINT_COLUMNS}
+        arrays["key"] = arrays["key"].astype(str)
+        np.savez(buffer, **arrays)
+        with closing(self.connect()) as conn:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sheet_fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+                    (scope, sheet, FINGERPRINT_VERSION, json.dumps(plan, ensure_ascii=False), buffer.getvalue(), time.time()),
+                )
+                evicted = self.evict(conn, keep=(scope, sheet))
+            if evicted:
+                conn.execute("PRAGMA incremental_vacuum")
+
+    # 删除旧版本的记录；其余记录总大小超过 max_bytes 时按更新时间从旧到新删除，keep（刚保存的记录）不删除。
+    # 返回删除的记录数
+    def evict(self, conn, keep=None):
+        evicted = conn.execute("DELETE FROM sheet_fingerprints WHERE version != ?", (FINGERPRINT_VERSION,)).rowcount
+        entries = conn.execute(
+            "SELECT scope, sheet, LENGTH(plan) + LENGTH(rows) FROM sheet_fingerprints ORDER BY updated"
+        ).fetchall()
+        total = sum(size for _, _, size in entries)
+        for scope, sheet, size in entries:
+            if total <= self.max_bytes:
+                break
+            if (scope, sheet) == keep:
+                continue
+            conn.execute("DELETE FROM sheet_fingerprints WHERE scope=? AND sheet=?", (scope, sheet))
+            total -= size
+            evicted += 1
+        return evicted
+
+# 单张sheet的增量比对状态。行按 (合同号, 该合同号在表中第几次出现) 识别，与行的位置无关；
+# 主表行指纹（所有待比对列）与参考行指纹都没变的行沿用上次每个字段的比对结果。
+# 有两项结论取决于整列而不是单行：数值/文本字段的整列类型推断、日期字段的解析格式。
+# 两者（连同日期列的类型）都作为字段上下文保存，上下文变化时该字段整列重新比对，保证结果与全量比对完全一致
+class IncrementalSheet:
+    # bound 为 bind_plan 绑定到本表的 [(规则, 主表列名)]
+    def __init__(self, store, scope, sheet_keyword, main_df, main_keys, ref_index, positions, bound):
+        self.store, self.scope, self.sheet = store, scope, sheet_keyword
+        self.index = main_df.index
+        self.ref_index, self.positions = ref_index, positions
+        compared = list(dict.fromkeys(col for _, col in bound))
+        typed = list(dict.fromkeys(col for rule, col in bound if rule.kind == "date"))
+        self.main_hash = row_fingerprints(main_df, compared, typed).view(np.int64)
+        self.ref_hash = ref_index.fingerprints(positions).view(np.int64)
+
+        self.keys = main_keys.to_numpy(dtype=object, na_value="")
+        self.occ = pd.Series(self.keys).groupby(self.keys, sort=False).cumcount().to_numpy()
+
+        self.prev_plan, prev = store.load(scope, sheet_keyword)
+        n = len(main_df)
+        self.prev_rows = 0 if prev is None else len(prev)
+        if prev is None or prev.empty:
+            pos = np.full(n, -1)
+            prev = pd.DataFrame(0, index=[0], columns=["main_hash", "ref_hash", "err_mask", "skip", "kinds"])
+        else:
+            prev_ids = pd.MultiIndex.from_arrays([prev["key"], prev["occ"]])
+            pos = prev_ids.get_indexer(pd.MultiIndex.from_arrays([self.keys, self.occ]))
+        self.matched = pos >= 0
+        prev_col = lambda col: np.where(self.matched, prev[col].to_numpy(dtype=np.int64)[pos], 0)
+        self.prev_err, self.prev_skip, self.prev_kinds = prev_col("err_mask"), prev_col("skip"), prev_col("kinds")
+        self.unchanged = self.matched & (prev_col("main_hash") == self.main_hash) & (prev_col("ref_hash") == self.ref_hash)
+
+        self.plan = {}
+        self.err_mask = np.zeros(n, dtype=np.int64)
+        self.skip = np.zeros(n, dtype=np.int64)
+        self.kinds = np.zeros(n, dtype=np.int64)
+        self.recomputed = np.zeros(n, dtype=bool)
+        self.fields = []  # add 登记、等待 evaluate 比对的字段
+
+    # 登记一个字段：确定沿用上次结果的行与字段上下文，比对在 evaluate 中对全部字段一次完成
+    def add(self, rule, main_col, s_main, s_ref):
+        prev = self.prev_plan.get(rule.field_id)
+        reuse = self.unchanged if prev is not None and prev["main_col"] == main_col else np.zeros(len(self.index), dtype=bool)
+        field = {
+            "rule": rule, "main_col": main_col, "s_main": s_main, "s_ref": s_ref,
+            "bit": len(self.fields), "prev_bit": prev["bit"] if prev is not None else 0, "raw": None,
+        }
+
+        if rule.kind == "date":
+            context = {
+                "main_dtype": str(s_main.dtype), "ref_dtype": str(s_ref.dtype),
+                "main_format": date_format_context(s_main), "ref_format": date_format_context(s_ref),
+            }
+            if prev is None or prev["context"] != context:
+                reuse = np.zeros_like(reuse)
+        else:
+            todo = ~reuse
+            raw_main, raw_ref = normalize_num_raw(s_main[todo]), normalize_num_raw(s_ref[todo])
+            kinds = (self.prev_kinds >> (4 * field["prev_bit"])) & 0xF
+            kinds[todo] = field_kinds(raw_main, raw_ref)
+            context = {
+                "main_float": bool((kinds & 1).any()) and not (kinds & 2).any(),
+                "ref_float": bool((kinds & 4).any()) and not (kinds & 8).any(),
+            }
+            if reuse.any() and prev["context"] != context:
+                # 整列类型推断结论变了：沿用的行也要按新结论重新比对
+                reuse = np.zeros_like(reuse)
+            else:
+                field["raw"] = (todo, raw_main, raw_ref)
+            self.kinds |= kinds << (4 * field["bit"])
+        field.update(reuse=reuse, context=context)
+        self.fields.append(field)
+        self.plan[rule.field_id] = {"main_col": main_col, "bit": field["bit"], "context": context}
+
+    # 比对已登记的全部字段：任一字段需要重新比对的行（各字段的并集）按类型分组一次批量比对，
+    # 其余行沿用上次结果（并集中可沿用的行重新比对，结果与沿用相同）。
+    # 返回与全量比对相同的错误矩阵（行 × 字段）与各字段的跳过行（布尔数组，字段不跳过空参考值时为 None）
+    def evaluate(self):
+        n = len(self.index)
+        rows = np.zeros(n, dtype=bool)
+        for field in self.fields:
+            rows |= ~field["reuse"]
+        operands = []
+        if rows.any():
+            for field in self.fields:
+                rule, s_main, s_ref = field["rule"], field["s_main"][rows], field["s_ref"][rows]
+                if rule.kind == "date":
+                    # 参考日期取整列只解析一次的结果（见 RefIndex.date_days），按行取出
+                    compare_context = dict(field["context"])
+                    ref_dates = self.ref_index.date_days(rule.ref_col, self.positions[rows], field["context"]["ref_format"])
+                    if ref_dates is not None:
+                        compare_context["ref_dates"] = ref_dates
+                else:
+                    todo, raw_main, raw_ref = field["raw"] or (None, None, None)
+                    if todo is None or not np.array_equal(todo, rows):
+                        raw_main, raw_ref = normalize_num_raw(s_main), normalize_num_raw(s_ref)
+                    compare_context = {
+                        "main_num": _apply_float_inference(*raw_main, infer=field["context"]["main_float"]),
+                        "ref_num": _apply_float_inference(*raw_ref, infer=field["context"]["ref_float"]),
+                    }
+                operands.append(field_operands(rule, s_main, s_ref, compare_context))
+            found = evaluate_operands([field["rule"] for field in self.fields], operands)
+
+        error_matrix = np.zeros((n, len(self.fields)), dtype=bool)
+        skips = []
+        for i, field in enumerate(self.fields):
+            reuse = field["reuse"]
+            errors = ((self.prev_err >> field["prev_bit"]) & 1).astype(bool) & reuse
+            skip = self.prev_skip.astype(bool) & reuse if field["rule"].skip_empty_ref else None
+            if operands:
+                errors[rows] = found[:, i]
+                if skip is not None:
+                    skip[rows] = operands[i]["skip"]
+            if skip is not None:
+                self.skip = skip.astype(np.int64)
+            error_matrix[:, i] = errors
+            self.err_mask |= errors.astype(np.int64) << field["bit"]
+            skips.append(skip)
+        self.recomputed = rows
+        self.fields = []
+        return error_matrix, skips
+
+    # 保存本次结果，返回与上次相比的变化：行数统计、错误增减、有变化的合同号
+    def finish(self):
+        rows = pd.DataFrame({
+            "key": self.keys, "occ": self.occ, "main_hash": self.main_hash, "ref_hash": self.ref_hash,
+            "err_mask": self.err_mask, "skip": self.skip, "kinds": self.kinds,
+        })
+        self.store.save(self.scope, self.sheet, self.plan, rows)
+
+        fixed = introduced = 0
+        for field_id, field in self.plan.items():
+            now = ((self.err_mask >> field["bit"]) & 1).astype(bool)
+            prev = self.prev_plan.get(field_id)
+            before = ((self.prev_err >> prev["bit"]) & 1).astype(bool) & self.matched if prev else np.zeros_like(now)
+            fixed += int((before & ~now).sum())
+            introduced += int((now & ~before).sum())
+        changed = ~self.unchanged
+        return {
+            "previous": bool(self.prev_plan),
+            "rows": len(rows),
+            "reused": int((~self.recomputed).sum()),
+            "recomputed": int(self.recomputed.sum()),
+            "new": int((~self.matched).sum()),
+            "changed": int((self.matched & changed).sum()),
+            "removed": int(self.prev_rows - self.matched.sum()),
+            "fixed_errors": fixed,
+            "new_errors": introduced,
+            "changed_contracts": sorted(set(self.keys[changed]) - {""}),
+        }
+
+# 增量比对的提示信息
+def incremental_note(sheet_keyword, changes):
+    if not changes["previous"]:
+        return ("info", f"🔁 「{sheet_keyword}」已建立增量比对记录（{changes['rows']} 行），下次上传修改后的文件时只比对变化的行。")
+    return ("info", (
+        f"🔁 「{sheet_keyword}」增量比对：沿用 {changes['reused']} 行，重新比对 {changes['recomputed']} 行"
+        f"（新增 {changes['new']}、修改 {changes['changed']}、删除 {changes['removed']}）；"
+        f"与上次相比修正 {changes['fixed_errors']} 处错误，新增 {changes['new_errors']} 处错误。"
+    ))
+
+# =====================================
+# 🧮 单sheet检查函数 (向量化版)
+# =====================================
+# 单sheet检查结果的初始内容
+def empty_sheet_result(sheet_keyword):
+    return {
+        "sheet": sheet_keyword,
+        "total_errors": 0,
+        "elapsed": None,           # None 表示该sheet被跳过
+        "skip_city_manager": 0,
+        "contracts_seen": set(),
+        "contract_col": None,
+        "error_matrix": None,      # 布尔矩阵（行 × 比对字段），True 为该行该字段有错误；分块流式审核时不保留
+        "error_fields": [],        # 矩阵各列对应的字段（"fk.租赁本金" 等）
+        "error_columns": [],       # 矩阵各列对应的主表列名
+        "field_errors": {},        # 各字段的错误数
+        "error_rows": [],          # 有错误的原始行号
+        "notes": [],
+        "changes": None,           # 增量比对时与上次相比的变化
+    }
+
+# 只做比对计算，不调用 st：提示信息放入结果的 notes，由界面统一显示；
+# progress(比例, 文本) 为可选的进度回调，profiler 为可选的 StageProfiler
+def check_one_sheet(sheet_keyword, main_sheets, ref_index, progress=None, profiler=None, store=None, scope=""):
+    start_time = time.time()
+    profiler = profiler or NULL_PROFILER
+    frames, read_errors = main_sheets
+    result = empty_sheet_result(sheet_keyword)
+    notes = result["notes"]
+
+    # 1. 取出目标sheet（已在 parse_workbook 中按第二行为表头读取）
+    if sheet_keyword in read_errors:
+        notes.append(("error", f"❌ 读取「{sheet_keyword}」时出错: {read_errors[sheet_keyword]}"))
+        return result
+    if sheet_keyword not in frames:
+        notes.append(("warning", f"⚠️ 未找到包含「{sheet_keyword}」的sheet，跳过。"))
+        return result
+    main_df = frames[sheet_keyword]
+        
+    if main_df.empty:
+        notes.append(("warning", f"⚠️ 「{sheet_keyword}」为空，跳过。"))
+        return result
+
+    # 2. 查找合同号列
+    where = f"「{sheet_keyword}」"
+    contract_col_main = find_col(main_df, "合同", notes=notes, where=where)
+    if not contract_col_main:
+        notes.append(("error", f"❌ 在「{sheet_keyword}」中未找到合同列。"))
+        return result
+
+   # 4. 创建标准合并Key
+    # 注意：main_df 是共享的解析结果，不能原地修改；比对结果直接使用 main_df 的原始索引（用于 openpyxl 定位）
+    with profiler.stage("main_key", target=sheet_keyword, rows=len(main_df)):
+        main_keys = normalize_contract_key(main_df[contract_col_main])
+    
+    # 获取本表所有合同号（用于统计等）
+    contracts_seen = set(main_keys[main_df[contract_col_main].notna()])
+
+    # 5. 在参考索引中一次性定位本表所有合同（代替逐表 merge，不复制主表）
+    with profiler.stage("align", target=sheet_keyword, rows=len(main_df)):
+        positions = ref_index.locate(main_keys)
+
+    # 6. 比对计划绑定到本表（主表列名只查找一次）
+    bound = bind_plan(main_df, ref_index, notes, where)
+
+    # 增量比对：读取上次保存的行指纹与比对结果
+    tracker = None
+    if store is not None and len(COMPARISON_PLAN) <= MAX_INCREMENTAL_FIELDS:
+        with profiler.stage("fingerprint", target=sheet_keyword, rows=len(main_df)):
+            tracker = IncrementalSheet(store, scope, sheet_keyword, main_df, main_keys, ref_index, positions, bound)
+    
+    skip_city_manager = 0
+    operands = []    # 全量比对：各字段的比对操作数，最后按类型分组批量比对
+
+    # 7. === 逐字段解析（整列类型推断 / 日期格式按列进行） ===
+    for rule, main_col in bound:
+        if progress:
+            progress(COMPARISON_PLAN.index(rule) / len(COMPARISON_PLAN), f"检查「{sheet_keyword}」: {rule.prefix} - {rule.main_kw}...")
+
+        with profiler.stage("compare", target=sheet_keyword, field=rule.field_id, rows=len(main_df)):
+            s_main = main_df[main_col]
+            s_ref = ref_index.column(rule.ref_col, positions, main_df.index)
+
+            if tracker is not None:
+                # 增量比对：只登记字段，有变化的行在下面与其他字段一起比对，其余沿用上次结果
+                tracker.add(rule, main_col, s_main, s_ref)
+            else:
+                context = {}
+                if rule.kind == "date":
+                    context["ref_dates"] = ref_index.date_days(rule.ref_col, positions, date_format_context(s_ref))
+                operands.append(field_operands(rule, s_main, s_ref, context))
+                skip_city_manager += operands[-1]["skip"].sum()
+        result["error_fields"].append(rule.field_id)
+        result["error_columns"].append(main_col)
+
+    # 8. 错误矩阵（行 × 比对字段，行顺序与 main_df 一致）
+    with profiler.stage("evaluate", target=sheet_keyword, rows=len(main_df)):
+        if tracker is None:
+            error_matrix = evaluate_operands([rule for rule, _ in bound], operands, n_rows=len(main_df))
+        else:
+            error_matrix, skips = tracker.evaluate()
+            skip_city_manager += sum(skip.sum() for skip in skips if skip is not None)
+
+    if tracker is not None:
+        with profiler.stage("fingerprint_save", target=sheet_keyword, rows=len(main_df)):
+            result["changes"] = tracker.finish()
+        notes.append(incremental_note(sheet_keyword, result["changes"]))
+
+    if progress:
+        progress(1.0, f"「{sheet_keyword}」比对完成，正在生成标注文件...")
+
+    result.update(
+        error_matrix=error_matrix,
+        field_errors=dict(zip(result["error_fields"], error_matrix.sum(axis=0).tolist())),
+        total_errors=int(error_matrix.sum()),
+        skip_city_manager=int(skip_city_manager),
+        contracts_seen=contracts_seen,
+        contract_col=contract_col_main,
+        error_rows=main_df.index[error_matrix.any(axis=1)].tolist(),
+        elapsed=time.time() - start_time,
+    )
+    return result
+
+# =====================================
+# 📤 Excel 流式导出工具（openpyxl write-only 模式，直接写入内存）
+# =====================================
+RED_FILL = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+YELLOW_FILL = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+
+# 与 pandas to_excel 的表头样式一致（加粗、细边框、居中）
+_thin = Side(style="thin")
+HEADER_FONT = Font(bold=True)
+HEADER_BORDER = Border(left=_thin, right=_thin, top=_thin, bottom=_thin)
+HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
+
+# 生成带样式的 write-only 单元格
+def styled_cell(ws, value, fill=None, font=None, border=None, alignment=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if fill is not None: cell.fill = fill
+    if font is not None: cell.font = font
+    if border is not None: cell.border = border
+    if alignment is not None: cell.alignment = alignment
+    return cell
+
+# 按块把 DataFrame 转成 (行索引, 行值) 逐行输出，缺失值转为 None（与 to_excel 一致）；
+# 每次只转换一个块，内存占用与总行数无关。checkpoint 为可选的取消检查点（见 run_audit），每块之前调用一次
+def iter_frame_rows(df, chunk_size=5000, checkpoint=None):
+    for start in range(0, len(df), chunk_size):
+        if checkpoint:
+            checkpoint()
+        block = df.iloc[start:start + chunk_size]
+        columns = [block.iloc[:, j].to_numpy(dtype=object, na_value=None) for j in range(block.shape[1])]
+        yield from zip(block.index, zip(*columns))
+
+# 将 DataFrame 逐行流式写入 write-only 工作表：
+# error_matrix 为与 df 行对齐的错误矩阵（行 × 字段），col_positions 为各字段在 df 中的列位置，出错单元格标红；
+# mark_col 不为 None 时出错行的该列（合同号）标黄；checkpoint 见 iter_frame_rows
+def stream_rows_with_fills(ws, df, error_matrix, col_positions, mark_col=None, checkpoint=None):
+    row_has_error = error_matrix.any(axis=1)
+    for i, (row_idx, values) in enumerate(iter_frame_rows(df, checkpoint=checkpoint)):
+        if not row_has_error[i]:
+            ws.append(values)
+            continue
+        row = list(values)
+        for c in set(col_positions[error_matrix[i]].tolist()):
+            row[c] = styled_cell(ws, row[c], fill=RED_FILL)
+        if mark_col is not None:
+            row[mark_col] = styled_cell(ws, row[mark_col], fill=YELLOW_FILL)
+        ws.append(row)
+
+# 保存 write-only 工作簿为字节串。compresslevel 为 zlib 压缩级别（0-9），None 时与 wb.save 相同（默认级别 6）；
+# wb.save 不能指定压缩级别，指定时自行创建 zip 交给 ExcelWriter 写出
+def workbook_bytes(wb, compresslevel=None):
+    output = BytesIO()
+    if compresslevel is None:
+        wb.save(output)
+    else:
+        if not wb.worksheets:
+            wb.create_sheet()
+        ExcelWriter(wb, ZipFile(output, "w", ZIP_DEFLATED, allowZip64=True, compresslevel=compresslevel)).save()
+    return output.getvalue()
+
+# =====================================
+# 📤 单sheet标注文件生成（审核标注版 + 仅错误行版）
+# =====================================
+# 单个标注文件，数据与红/黄标注在一次流式写入中完成，全程不落盘：
+# kind 为 "annotated"（审核标注版）或 "errors_only"（仅错误行版，没有出错行时返回 None）
+SHEET_EXPORTS = ("annotated", "errors_only")
+# 各导出文件的文件名（{sheet} 为 sheet关键字），网页版、命令行与 zip 打包共用
+EXPORT_FILE_NAMES = {
+    "annotated": "记录表_{sheet}_审核标注版.xlsx",
+    "errors_only": "记录表_{sheet}_仅错误行_标红.xlsx",
+    "all": "字段表_漏填标注版.xlsx",
+    "missing_only": "字段表_仅漏填.xlsx",
+}
+
+# 把本sheet的一个标注版本写入 write-only 工作表 ws（单独的文件与合并导出的工作簿共用）；仅错误行版没有出错行时不写入。
+# checkpoint 见 iter_frame_rows
+def write_sheet_export(ws, main_df, result, kind, checkpoint=None):
+    error_matrix = result["error_matrix"]
+
+    # 原始列名到列位置(0-based)的映射，错误矩阵各列对应的列位置
+    original_cols_list = list(main_df.columns)
+    col_name_to_pos = {name: i for i, name in enumerate(original_cols_list)}
+    col_positions = np.array([col_name_to_pos[col] for col in result["error_columns"]], dtype=np.intp)
+
+    if kind == "annotated":
+        # 审核标注版：表头 + 空行（保留原始表头空行）+ 数据，出错单元格标红、出错行的合同号标黄
+        ws.append([
+            styled_cell(ws, name, font=HEADER_FONT, border=HEADER_BORDER, alignment=HEADER_ALIGNMENT)
+            for name in original_cols_list
+        ])
+        ws.append([])
+        stream_rows_with_fills(ws, main_df, error_matrix, col_positions, col_name_to_pos.get(result["contract_col"]), checkpoint)
+        return
+
+    # 仅含错误行的文件 (带标红)
+    error_positions = np.flatnonzero(error_matrix.any(axis=1))
+    ws.append(original_cols_list)
+    stream_rows_with_fills(ws, main_df.iloc[error_positions], error_matrix[error_positions], col_positions, checkpoint=checkpoint)
+
+# compresslevel 见 workbook_bytes，checkpoint 见 iter_frame_rows
+def render_sheet_workbook(main_df, result, kind, profiler=None, compresslevel=None, checkpoint=None):
+    profiler = profiler or NULL_PROFILER
+    error_count = int(result["error_matrix"].any(axis=1).sum())
+    if kind == "errors_only" and not error_count:
+        return None
+    with profiler.stage(f"export_{kind}", target=result["sheet"], rows=len(main_df) if kind == "annotated" else error_count):
+        wb = Workbook(write_only=True)
+        write_sheet_export(wb.create_sheet("Sheet1" if kind == "annotated" else "Sheet"), main_df, result, kind, checkpoint)
+        return workbook_bytes(wb, compresslevel)
+
+# 一次生成本sheet的两个标注文件
+def render_sheet_workbooks(main_df, result, profiler=None, compresslevel=None, checkpoint=None):
+    start_time = time.time()
+    rendered = {"annotated": None, "errors_only": None, "notes": [], "elapsed": None}
+    rendered["annotated"] = render_sheet_workbook(main_df, result, "annotated", profiler, compresslevel, checkpoint)
+    try:
+        rendered["errors_only"] = render_sheet_workbook(main_df, result, "errors_only", profiler, compresslevel, checkpoint)
+    except Exception as e:
+        rendered["notes"].append(("error", f"❌ 生成“仅错误行”文件时出错: {e}"))
+    rendered["elapsed"] = time.time() - start_time
+    return rendered
+
+# =====================================
+# 🕵️ 漏填检查：跳过“是否车管家=是”与“提成类型=联合租赁/驻店”
+# =====================================
+# 字段表与记录表（月重卡）合同号的双向比对，返回 (missing_mask, unmatched)：
+#   missing_mask —— 与 zd_df 行对齐的布尔数组，True 表示该合同在记录表中未出现
+#   unmatched    —— 记录表中出现、字段表中没有的合同号（标准化后，已排序）
+# 字段表合同号同样经 normalize_contract_key 标准化（与参考索引合并时一致，大小写 / 全角差异不再误报），空合同号不参与。
+# 两边合同号拼在一起只做一次 factorize，按编码标记各自出现过的合同，两个方向的差集都直接由编码数组得到
+def find_missing_contracts(zd_df, contract_col_zd, contracts_seen_all_sheets):
+    field_keys = normalize_contract_key(zd_df[contract_col_zd]).to_numpy(dtype=object)
+    present = zd_df[contract_col_zd].notna().to_numpy() & (field_keys != "")
+    field_keys = field_keys[present]
+    seen_keys = np.fromiter(contracts_seen_all_sheets, dtype=object, count=len(contracts_seen_all_sheets))
+    seen_keys = seen_keys[seen_keys != ""]
+
+    codes, uniques = pd.factorize(np.concatenate([field_keys, seen_keys]))
+    field_codes, seen_codes = codes[:len(field_keys)], codes[len(field_keys):]
+    in_field = np.zeros(len(uniques), dtype=bool)
+    in_field[field_codes] = True
+    in_seen = np.zeros(len(uniques), dtype=bool)
+    in_seen[seen_codes] = True
+
+    missing_contracts_mask = np.zeros(len(zd_df), dtype=bool)
+    missing_contracts_mask[present] = ~in_seen[field_codes]
+
+    col_car_manager = find_col(zd_df, "是否车管家", exact=True)
+    col_bonus_type = find_col(zd_df, "提成类型", exact=True)
+    # 跳过“车管家=是”
+    if col_car_manager:
+        missing_contracts_mask &= ~(zd_df[col_car_manager].astype(str).str.strip().str.lower() == "是").to_numpy()
+    # 跳过“联合租赁/驻店”
+    if col_bonus_type:
+        missing_contracts_mask &= ~zd_df[col_bonus_type].astype(str).str.strip().isin(["联合租赁", "驻店"]).to_numpy()
+    return missing_contracts_mask, sorted(uniques[in_seen & ~in_field])
+
+# =====================================
+# 📤 导出字段表（含漏填标注 + 仅漏填版）
+# =====================================
+# 批量导出：一次遍历 df，把整行同时写入多个 write-only 工作表，并在标记列写入 flag_value（带填充）。
+# 标记列位置只解析一次：df 已有该列时原位覆盖，否则追加在末尾。
+# targets 为 [(ws, 行筛选布尔数组)]，筛选数组为 None 表示写入全部行；checkpoint 见 iter_frame_rows
+def write_flagged_rows(df, flag_mask, flag_col, flag_value, fill, targets, checkpoint=None):
+    header = list(df.columns)
+    if flag_col in header:
+        flag_pos = header.index(flag_col)
+    else:
+        flag_pos = len(header)
+        header.append(flag_col)
+    for ws, _ in targets:
+        ws.append(header)
+
+    for pos, (_, values) in enumerate(iter_frame_rows(df, checkpoint=checkpoint)):
+        flagged = flag_mask[pos]
+        for ws, rows_mask in targets:
+            if rows_mask is not None and not rows_mask[pos]:
+                continue
+            row = list(values)
+            cell = styled_cell(ws, flag_value, fill=fill) if flagged else None
+            if flag_pos == len(row):
+                row.append(cell)
+            else:
+                row[flag_pos] = cell
+            ws.append(row)
+
+# 字段表写出漏填标注：targets 为 [(ws, 导出类型)]，各工作表在同一次遍历中写出
+def write_missing_exports(zd_df, missing_mask, targets, checkpoint=None):
+    write_flagged_rows(zd_df, missing_mask, "漏填检查", "❗ 漏填", YELLOW_FILL, [
+        (ws, None if kind == "all" else missing_mask) for ws, kind in targets
+    ], checkpoint)
+
+# 单个字段表导出文件：kind 为 "all"（全字段表，含漏填标注）或 "missing_only"（仅漏填合同，没有漏填时返回 None）
+MISSING_EXPORTS = ("all", "missing_only")
+
+def render_missing_workbook(zd_df, missing_mask, kind, profiler=None, compresslevel=None):
+    profiler = profiler or NULL_PROFILER
+    if kind == "missing_only" and not missing_mask.any():
+        return None
+    wb = Workbook(write_only=True)
+    with profiler.stage("export_missing", target="字段", rows=len(zd_df) if kind == "all" else int(missing_mask.sum())):
+        write_missing_exports(zd_df, missing_mask, [(wb.create_sheet("Sheet"), kind)])
+        return workbook_bytes(wb, compresslevel)
+
+# 两个导出文件在同一次遍历中写出，返回 (全字段表字节, 仅漏填字节)；没有漏填合同时后者为 None。checkpoint 见 iter_frame_rows
+def render_missing_workbooks(zd_df, missing_mask, profiler=None, compresslevel=None, checkpoint=None):
+    profiler = profiler or NULL_PROFILER
+    # 全字段表（含漏填标注）
+    wb = Workbook(write_only=True)
+    targets = [(wb.create_sheet("Sheet"), "all")]
+
+    # 仅漏填合同：与全字段表在同一次遍历中写出
+    wb2 = None
+    if missing_mask.any():
+        wb2 = Workbook(write_only=True)
+        targets.append((wb2.create_sheet("Sheet"), "missing_only"))
+
+    with profiler.stage("export_missing", target="字段", rows=len(zd_df)):
+        write_missing_exports(zd_df, missing_mask, targets, checkpoint)
+        return workbook_bytes(wb, compresslevel), (workbook_bytes(wb2, compresslevel) if wb2 is not None else None)
+
+# =====================================
+# 📦 合并导出：全部结果一次写出为一个工作簿或一个 zip，只需下载一次
+# =====================================
+# "workbook"：一个工作簿，每张sheet的审核标注版 / 仅错误行版与字段表的两个版本各占一个工作表，
+# 红 / 黄填充在同一工作簿中只登记一次；"zip"：各导出文件打包在一起，文件名与单独下载时相同
+BUNDLE_FORMATS = {"workbook": "审核结果汇总.xlsx", "zip": "审核结果.zip"}
+# 合并工作簿中各工作表的名称（Excel 限 31 个字符）
+BUNDLE_SHEET_TITLES = {
+    "annotated": "{sheet}_审核标注版",
+    "errors_only": "{sheet}_仅错误行",
+    "all": "字段表_漏填标注版",
+    "missing_only": "字段表_仅漏填",
+}
+# 导出 xlsx 的压缩级别（zlib 0-9，越低压缩越快、文件越大），None 为默认级别 6；可用环境变量 AUDIT_EXPORT_COMPRESSLEVEL 指定
+EXPORT_COMPRESSLEVEL = int(os.environ["AUDIT_EXPORT_COMPRESSLEVEL"]) if os.environ.get("AUDIT_EXPORT_COMPRESSLEVEL") else None
+
+# 分块流式审核不保留错误矩阵，只能把比对时已写出的标注文件打包为 zip；格式不可用时抛出 ValueError
+def validate_bundle_format(fmt, streamed=False):
+    if fmt not in BUNDLE_FORMATS:
+        raise ValueError(f"❌ 不支持的合并导出格式: {fmt}")
+    if fmt == "workbook" and streamed:
+        raise ValueError("❌ 分块流式审核的结果只能打包为 zip，不能合并为一个工作簿")
+
+# sheets 为 run_sheet_audits 的结果 {sheet关键字: (result, rendered)}，main_frames 为月重卡各sheet的 DataFrame
+# （分块流式审核时为 None）；zd_df 为整表读取的字段表。已写出的标注文件（rendered）直接打包，其余按比对结果生成。
+# 返回合并导出文件的字节串，compresslevel 见 workbook_bytes，checkpoint 见 iter_frame_rows
+def render_export_bundle(sheets, main_frames, zd_df, missing_mask, fmt="workbook", compresslevel=None, profiler=None, checkpoint=None):
+    profiler = profiler or NULL_PROFILER
+    validate_bundle_format(fmt, streamed=main_frames is None)
+    checked = {kw: (result, rendered) for kw, (result, rendered) in sheets.items() if result["elapsed"] is not None}
+
+    with profiler.stage("export_bundle", target=fmt, rows=len(zd_df) + sum(len(main_frames[kw]) for kw in checked) if main_frames else None):
+        if fmt == "workbook":
+            wb = Workbook(write_only=True)
+            for kw, (result, _) in checked.items():
+                for kind in SHEET_EXPORTS:
+                    if kind == "annotated" or result["error_rows"]:
+                        write_sheet_export(wb.create_sheet(BUNDLE_SHEET_TITLES[kind].format(sheet=kw)), main_frames[kw], result, kind, checkpoint)
+            missing_kinds = MISSING_EXPORTS if missing_mask.any() else MISSING_EXPORTS[:1]
+            write_missing_exports(zd_df, missing_mask, [(wb.create_sheet(BUNDLE_SHEET_TITLES[kind]), kind) for kind in missing_kinds], checkpoint)
+            return workbook_bytes(wb, compresslevel)
+
+        # zip：每个文件生成后立即写入压缩包，不同时保留全部文件；xlsx 本身已压缩，包内不再压缩
+        output = BytesIO()
+        with ZipFile(output, "w", ZIP_STORED, allowZip64=True) as archive:
+            for kw, (result, rendered) in checked.items():
+                for kind in SHEET_EXPORTS:
+                    data = rendered[kind] if rendered is not None else render_sheet_workbook(
+                        main_frames[kw], result, kind, compresslevel=compresslevel, checkpoint=checkpoint)
+                    if data is not None:
+                        archive.writestr(EXPORT_FILE_NAMES[kind].format(sheet=kw), data)
+            for kind, data in zip(MISSING_EXPORTS, render_missing_workbooks(zd_df, missing_mask, compresslevel=compresslevel, checkpoint=checkpoint)):
+                if data is not None:
+                    archive.writestr(EXPORT_FILE_NAMES[kind], data)
+        return output.getvalue()
+
+# =====================================
+# 🌊 分块流式审核：超大月重卡sheet按行块读取、比对，标注行直接流式写入 write-only 工作簿，
+# 峰值内存取决于块大小而不是sheet大小
+# =====================================
+STREAM_CHUNK_SIZE = 20000
+
+# 与 pandas 用 openpyxl 读取 xlsx 时的单元格转换一致：空单元格为 ""，错误值为 NaN，整数值的浮点数转为 int
+def excel_cell_value(cell):
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        val = int(cell.value)
+        return val if val == cell.value else float(cell.value)
+    return cell.value
+
+# 逐行读取 read-only 工作表并去掉行尾空单元格（与 pandas 一致）；
+# 全空行先计数，后面还有数据时才输出，sheet 末尾的空行丢弃
+def iter_sheet_rows(ws):
+    blank_rows = 0
+    for row in ws.rows:
+        values = [excel_cell_value(cell) for cell in row]
+        while values and values[-1] == "":
+            values.pop()
+        if not values:
+            blank_rows += 1
+            continue
+        for _ in range(blank_rows):
+            yield []
+        blank_rows = 0
+        yield values
+
+# 表头行转列名：重复列名加 ".1"、空列名为 "Unnamed: 列号"，与 pd.read_excel 一致
+def header_columns(header_row, width):
+    return TextParser([header_row + [""] * (width - len(header_row))], header=0, skip_blank_lines=False).read().columns
+
+INT_LITERAL = re.compile(r"\s*[+-]?\d+\s*")
+INT64_MAX = np.iinfo(np.int64).max
+BOOL_LITERALS = frozenset(["True", "TRUE", "true", "False", "FALSE", "false"])
+
+# 单元格原始值在 pandas 类型推断中的类别。一列的推断结果（数值 / 布尔 / 日期 / 保持原值）只取决于出现过哪些类别及其先后：
+# 值的类型、是否缺失、所在块推断出的类型（inferred_kind，区分如 "True" 与 "1.0"），文本能否转成数值（numeric）、
+# 是否为整数字面量、布尔字面量、正负、是否超出 int64，数值的正负、是否超出 int64、
+# 是否等于 0 / 1（解析器按值去重，True 与 1 相等，整列取先出现的那个）
+def value_class(value, missing, inferred_kind, numeric):
+    kind = type(value)
+    if missing:
+        return (kind, True)
+    if kind is str:
+        return (kind, inferred_kind, numeric, INT_LITERAL.fullmatch(value) is not None, value in BOOL_LITERALS,
+                value.lstrip().startswith("-"), len(value.strip()) > 18)
+    if kind is int:
+        return (kind, inferred_kind, value < 0, value > INT64_MAX, value in (0, 1))
+    if kind is float:
+        return (kind, inferred_kind, value in (0, 1))
+    return (kind, inferred_kind)
+
+# 单列值按 pandas 读取 Excel 时的同一解析器推断类型
+def parse_column(values):
+    return TextParser([[value] for value in values], names=[0], header=None, skip_blank_lines=False).read()[0]
+
+# 月重卡单个sheet的分块读取。read() 解析 xlsx、逐块暂存到临时文件（只保留一块在内存），返回已读取的行数；
+# replay() 再按块重放，此时已知整表最大列宽与各列的整列类型，结果与整表读取相同：
+#   超出表头宽度的行补出 "Unnamed" 列；
+#   pandas 按整列推断类型，只看一块会不同（如前几千行只有数字样文本的文本列、带前导零的纯数字合同号会被转成数值），
+#   所以各块按原值（dtype=object）与推断后的值各存一份，并按类别记下各列出现过的值（见 value_class，按首次出现的顺序），
+#   整列类型用同一解析器对这些代表值推断得出，重放时每块按整列类型取值（整列为 object 时取原值）；
+#   含布尔值 / 布尔字面量的列，布尔转换与 True / 1 去重取决于整列，这种列每块前面加上代表值重新推断
+# read-only 模式打开工作簿时会为每个sheet确定尺寸，文件没有尺寸信息时要把sheet完整扫描一遍，故只打开一次
+class SheetSpool:
+    def __init__(self, data, sheet_keyword, header, chunk_size=STREAM_CHUNK_SIZE):
+        self.header, self.chunk_size = header, chunk_size
+        self._wb = load_workbook(BytesIO(data), read_only=True, data_only=True, keep_links=False)
+        self.sheet_matches = sheet_index(tuple(self._wb.sheetnames)).matches(sheet_keyword)
+        self.sheet_name = self.sheet_matches[0] if self.sheet_matches else None
+        self.columns = None
+        self.width = 0
+        self.rows = 0
+        self._min_width = None  # 各块中最窄的列宽：更宽的列在较窄的块中全为缺失值
+        self._samples = {}      # 列号 → {值的类别: 代表值}
+        self._dtypes = None
+        self._reparse = {}      # 列号 → 需要连同代表值重新推断的列的代表值
+        self._file = tempfile.TemporaryFile()
+
+    # 解析并暂存各块，每块之后返回已读取的总行数
+    def read(self):
+        ws = self._wb[self.sheet_name]
+        ws.reset_dimensions()
+        rows = iter_sheet_rows(ws)
+        header_row = next(islice(rows, self.header, None), [])
+        self.columns = header_columns(header_row, len(header_row))
+        self.width = len(self.columns)
+        while True:
+            block = list(islice(rows, self.chunk_size))
+            if not block:
+                break
+            width = max([len(self.columns)] + [len(row) for row in block])
+            block = [row + [""] * (width - len(row)) for row in block]
+            parse = lambda **kw: TextParser(block, names=list(range(width)), header=None, skip_blank_lines=False, **kw).read()
+            raw, inferred = parse(dtype=object), parse()
+            self.collect_samples(raw, inferred)
+            # 本块推断为 object 的列整列也是 object（含布尔值的列另行重新推断），不必保存推断结果
+            inferred = inferred[[pos for pos in inferred.columns if inferred[pos].dtype != object]]
+            pickle.dump((self.rows, raw, inferred), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.width = max(self.width, width)
+            self._min_width = width if self._min_width is None else min(self._min_width, width)
+            self.rows += len(raw)
+            yield self.rows
+
+    # 记下本块各列出现过的值类别；文本能否转成数值与解析器同样按 pandas 的数值转换判断
+    def collect_samples(self, raw, inferred):
+        for pos in raw.columns:
+            samples = self._samples.setdefault(pos, {})
+            inferred_kind = inferred[pos].dtype.kind
+            numeric = pd.to_numeric(raw[pos], errors="coerce").notna().to_numpy()
+            for value, missing, is_numeric in zip(raw[pos].to_numpy(), inferred[pos].isna().to_numpy(), numeric):
+                samples.setdefault(value_class(value, missing, inferred_kind, is_numeric), value)
+
+    # 各列的整列类型：代表值（较窄的块中该列为缺失值，另加一个空值）按 pandas 同一解析器推断
+    def column_dtypes(self):
+        if self._dtypes is None:
+            self._dtypes = []
+            for pos in range(self.width):
+                classes = self._samples.get(pos, {})
+                samples = list(classes.values())
+                if pos >= self._min_width:
+                    samples.append("")
+                dtype = parse_column(samples).dtype
+                if any(key[0] is bool or (key[0] is str and key[1] is not True and key[4]) for key in classes):
+                    self._reparse[pos] = samples
+                self._dtypes.append(dtype)
+        return self._dtypes
+
+    # 按块重放完整列宽、整列类型的 DataFrame
+    def replay(self):
+        columns = header_columns(list(self.columns), self.width) if self.width > len(self.columns) else self.columns
+        dtypes = self.column_dtypes()
+        self._file.seek(0)
+        while True:
+            try:
+                start, raw, inferred = pickle.load(self._file)
+            except EOFError:
+                break
+            data = {}
+            for pos, dtype in enumerate(dtypes):
+                if pos >= raw.shape[1]:
+                    data[pos] = pd.Series(np.nan, index=raw.index, dtype=object if dtype == object else float).astype(dtype)
+                elif pos in self._reparse:
+                    samples = self._reparse[pos]
+                    values = parse_column(samples + list(raw[pos])).iloc[len(samples):]
+                    data[pos] = values.set_axis(raw.index).astype(dtype)
+                elif dtype == object:
+                    data[pos] = raw[pos]
+                else:
+                    data[pos] = inferred[pos].astype(dtype)
+            df = pd.DataFrame(data)
+            df.columns = columns
+            df.index = pd.RangeIndex(start, start + len(df))
+            yield df
+
+    def close(self):
+        self._wb.close()
+        self._file.close()
+
+# 分块比对时整列层面的比对上下文（见 IncrementalSheet）：比对前重放一遍逐块累积，比对时每块都按整列的结论比对
+class StreamFieldContext:
+    def __init__(self, rule):
+        self.is_date = rule.kind == "date"
+        self.first = [None, None]  # 日期字段：主表 / 参考列的第一个非空值
+        self.kinds = 0             # 数值/文本字段：所有行 field_kinds 的并集
+
+    def update(self, s_main, s_ref):
+        if self.is_date:
+            for i, series in enumerate((s_main, s_ref)):
+                if self.first[i] is None:
+                    self.first[i] = first_date_value(series)
+        else:
+            self.kinds |= int(np.bitwise_or.reduce(field_kinds(normalize_num_raw(s_main), normalize_num_raw(s_ref)), initial=0))
+
+    # 一块数据的 field_operands 上下文
+    def context(self, s_main, s_ref):
+        if self.is_date:
+            return {"main_format": date_format_of(self.first[0]), "ref_format": date_format_of(self.first[1])}
+        return {
+            "main_num": _apply_float_inference(*normalize_num_raw(s_main), infer=bool(self.kinds & 1) and not self.kinds & 2),
+            "ref_num": _apply_float_inference(*normalize_num_raw(s_ref), infer=bool(self.kinds & 4) and not self.kinds & 8),
+        }
+
+# 分块流式审核单个sheet，返回值与 audit_sheet_job 相同。第一遍读取并暂存各块、确定整列类型，
+# 重放一遍收集整列上下文与合同号，再重放一遍逐块比对并把标注行直接写入审核标注版 / 仅错误行版，比对结果与整表审核一致。
+# 按合同保存的增量比对记录需要整表，分块模式下不使用 store；compresslevel 见 workbook_bytes
+def stream_sheet_job(sheet_keyword, data, ref_index, progress=None, profile=False, store=None, scope="", chunk_size=STREAM_CHUNK_SIZE, compresslevel=None):
+    start_time = time.time()
+    profiler = StageProfiler(enabled=profile)
+    result = empty_sheet_result(sheet_keyword)
+    result["profile"] = profiler.records
+    notes = result["notes"]
+    header = next(h for kw, h, _ in WORKBOOK_SHEETS["月重卡"] if kw == sheet_keyword)
+
+    try:
+        spool = SheetSpool(data, sheet_keyword, header, chunk_size)
+    except Exception as e:
+        notes.append(("error", f"❌ 读取「{sheet_keyword}」时出错: {e}"))
+        return result, None
+    if spool.sheet_name is None:
+        spool.close()
+        notes.append(("warning", f"⚠️ 未找到包含「{sheet_keyword}」的sheet，跳过。"))
+        return result, None
+    if len(spool.sheet_matches) > 1:
+        notes.append(ambiguity_note("工作簿", sheet_keyword, spool.sheet_matches))
+
+    with closing(spool):
+        # 1. 第一遍：读取并暂存各块，确定整列类型
+        with profiler.stage("stream_read", target=sheet_keyword) as record:
+            for rows in spool.read():
+                if progress:
+                    progress(0.0, f"读取「{sheet_keyword}」: 已读取 {rows} 行...")
+            record["rows"] = spool.rows
+
+        if spool.columns is not None and spool.rows == 0:
+            notes.append(("warning", f"⚠️ 「{sheet_keyword}」为空，跳过。"))
+            return result, None
+        where = f"「{sheet_keyword}」"
+        header_df = pd.DataFrame(columns=spool.columns)
+        contract_col_main = find_col(header_df, "合同", notes=notes, where=where)
+        if not contract_col_main:
+            notes.append(("error", f"❌ 在「{sheet_keyword}」中未找到合同列。"))
+            return result, None
+        fields = [(rule, main_col, StreamFieldContext(rule)) for rule, main_col in bind_plan(header_df, ref_index, notes, where)]
+        result["error_fields"] = [rule.field_id for rule, _, _ in fields]
+        result["error_columns"] = [main_col for _, main_col, _ in fields]
+
+        # 2. 按整列类型重放一遍：收集合同号，累积整列上下文
+        with profiler.stage("stream_context", target=sheet_keyword, rows=spool.rows):
+            for df in spool.replay():
+                main_keys = normalize_contract_key(df[contract_col_main])
+                result["contracts_seen"].update(main_keys[df[contract_col_main].notna()])
+                positions = ref_index.locate(main_keys)
+                for rule, main_col, context in fields:
+                    context.update(df[main_col], ref_index.column(rule.ref_col, positions, df.index))
+
+        # 3. 再重放一遍：逐块比对，出错单元格标红、出错行的合同号标黄，直接写入两个 write-only 工作簿
+        rendered = {"annotated": None, "errors_only": None, "notes": [], "elapsed": None}
+        col_name_to_pos = {name: i for i, name in enumerate(spool.columns)}
+        col_positions = np.array([col_name_to_pos[col] for col in result["error_columns"]], dtype=np.intp)
+        field_counts = np.zeros(len(fields), dtype=np.int64)
+        skip_city_manager = done = 0
+        with profiler.stage("stream_check", target=sheet_keyword, rows=spool.rows):
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("Sheet1")
+            wb_errors = ws_errors = None
+            for df in spool.replay():
+                if done == 0:
+                    ws.append([
+                        styled_cell(ws, name, font=HEADER_FONT, border=HEADER_BORDER, alignment=HEADER_ALIGNMENT)
+                        for name in df.columns
+                    ])
+                    ws.append([])
+                positions = ref_index.locate(normalize_contract_key(df[contract_col_main]))
+                operands = []
+                for rule, main_col, context in fields:
+                    s_main = df[main_col]
+                    s_ref = ref_index.column(rule.ref_col, positions, df.index)
+                    chunk_context = context.context(s_main, s_ref)
+                    if rule.kind == "date" and s_ref.dtype == object:
+                        chunk_context["ref_dates"] = ref_index.date_days(rule.ref_col, positions, chunk_context["ref_format"])
+                    operands.append(field_operands(rule, s_main, s_ref, chunk_context))
+                    skip_city_manager += operands[-1]["skip"].sum()
+                # 本块的错误矩阵，只累计计数与出错行号，不保留整表矩阵
+                chunk_matrix = evaluate_operands([rule for rule, _, _ in fields], operands, n_rows=len(df))
+                field_counts += chunk_matrix.sum(axis=0)
+                stream_rows_with_fills(ws, df, chunk_matrix, col_positions, mark_col=col_name_to_pos.get(contract_col_main))
+                error_positions = np.flatnonzero(chunk_matrix.any(axis=1))
+                if len(error_positions):
+                    if ws_errors is None:
+                        wb_errors = Workbook(write_only=True)
+                        ws_errors = wb_errors.create_sheet("Sheet")
+                        ws_errors.append(list(df.columns))
+                    stream_rows_with_fills(ws_errors, df.iloc[error_positions], chunk_matrix[error_positions], col_positions)
+                    result["error_rows"].extend(df.index[error_positions].tolist())
+                done += len(df)
+                if progress:
+                    progress(done / spool.rows, f"检查「{sheet_keyword}」: 已比对 {done} / {spool.rows} 行...")
+
+    result.update(
+        field_errors=dict(zip(result["error_fields"], field_counts.tolist())),
+        total_errors=int(field_counts.sum()),
+        skip_city_manager=int(skip_city_manager),
+        contract_col=contract_col_main,
+        elapsed=time.time() - start_time,
+    )
+    if store is not None:
+        notes.append(("info", f"ℹ️ 「{sheet_keyword}」为分块流式审核，未使用增量比对。"))
+
+    save_start = time.time()
+    with profiler.stage("export_annotated", target=sheet_keyword, rows=spool.rows):
+        rendered["annotated"] = workbook_bytes(wb, compresslevel)
+    if wb_errors is not None:
+        try:
+            with profiler.stage("export_errors_only", target=sheet_keyword, rows=len(result["error_rows"])):
+                rendered["errors_only"] = workbook_bytes(wb_errors, compresslevel)
+        except Exception as e:
+            rendered["notes"].append(("error", f"❌ 生成“仅错误行”文件时出错: {e}"))
+    rendered["elapsed"] = time.time() - save_start
+    return result, rendered
+
+# =====================================
+# ⚡ 多sheet并行执行
+# =====================================
+# 单个sheet的完整任务：比对 + 生成标注文件；progress(比例, 文本) 为可选的进度回调。
+# profile=True 时各阶段的性能记录放在 result["profile"]，随结果一起从工作进程返回；
+# store 为 FingerprintStore 时做增量比对，scope 区分不同来源的文件（如文件名）；
+# render=False 时不生成标注文件（rendered 为 None），需要时再由 render_sheet_workbook 按比对结果生成；compresslevel 见 workbook_bytes
+def audit_sheet_job(sheet_keyword, main_sheets, ref_index, progress=None, profile=False, store=None, scope="", render=True, compresslevel=None):
+    profiler = StageProfiler(enabled=profile)
+    with profiler.stage("check_sheet", target=sheet_keyword) as record:
+        result = check_one_sheet(sheet_keyword, main_sheets, ref_index, progress, profiler, store, scope)
+        record["rows"] = len(main_sheets[0].get(sheet_keyword, ()))
+    rendered = None
+    if render and result["elapsed"] is not None:
+        # 写出标注文件时每块行上报一次进度（后台任务借此检查是否已取消）
+        checkpoint = partial(progress, 1.0, f"「{sheet_keyword}」正在生成标注文件...") if progress else None
+        rendered = render_sheet_workbooks(main_sheets[0][sheet_keyword], result, profiler, compresslevel, checkpoint)
+    result["profile"] = profiler.records
+    return result, rendered
+
+# 工作线程/进程中的进度回调：放入队列，由调用线程转发给界面
+def _report_to_queue(progress_queue, sheet_keyword, fraction, text):
+    progress_queue.put((sheet_keyword, fraction, text))
+
+# 从整本月重卡的解析结果中取出单个sheet的部分，避免把其他sheet传给工作进程
+def sheet_subset(main_sheets, sheet_keyword):
+    frames, errors = main_sheets
+    return (
+        {k: v for k, v in frames.items() if k == sheet_keyword},
+        {k: v for k, v in errors.items() if k == sheet_keyword},
+    )
+
+# 创建执行器：mode 为 "process"（多进程）、"thread"（多线程）或 "serial"（返回 None，串行执行）。
+# 多进程使用 spawn 方式启动；子进程按 __main__ 的 __spec__ 导入主模块，网页版把它指向 audit_worker，不会执行界面脚本
+def make_executor(mode, max_workers=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    if mode == "process":
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+    if mode == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    return None
+
+# 并行审核多张sheet，按 sheet_keywords 的顺序返回 {sheet关键字: (result, rendered)}。
+# 工作线程/进程不接触界面；on_progress(sheet关键字, 比例, 文本) 始终在调用线程中执行
+# chunk_size 不为 None 时 main_sheets 为月重卡 xlsx 字节，各sheet按 chunk_size 行一块分块流式审核（标注文件在比对时写出）；
+# 否则 render=False 时只比对，不生成标注文件；compresslevel 为标注文件的压缩级别（见 workbook_bytes）
+def run_sheet_audits(sheet_keywords, main_sheets, ref_index, executor=None, on_progress=None, profile=False, store=None, scope="", chunk_size=None, render=True, compresslevel=None):
+    if chunk_size:
+        job = partial(stream_sheet_job, chunk_size=chunk_size, compresslevel=compresslevel)
+        payload = lambda kw: main_sheets
+    else:
+        job = partial(audit_sheet_job, render=render, compresslevel=compresslevel)
+        payload = partial(sheet_subset, main_sheets)
+        if store is not None:
+            ref_index.prepare_fingerprints()
+    if executor is None:
+        return {
+            kw: job(kw, main_sheets, ref_index, partial(on_progress, kw) if on_progress else None, profile, store, scope)
+            for kw in sheet_keywords
+        }
+
+    manager = None
+    if isinstance(executor, ProcessPoolExecutor):
+        # 跨进程传递进度需要 Manager 队列
+        manager = multiprocessing.get_context("spawn").Manager()
+        progress_queue = manager.Queue()
+    else:
+        progress_queue = queue.Queue()
+
+    try:
+        futures = {
+            executor.submit(
+                job, kw, payload(kw), ref_index,
+                partial(_report_to_queue, progress_queue, kw), profile, store, scope,
+            ): kw
+            for kw in sheet_keywords
+        }
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            # 把工作进程上报的进度转发给界面
+            while True:
+                try:
+                    kw, fraction, text = progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if on_progress:
+                    on_progress(kw, fraction, text)
+        by_kw = {kw: future.result() for future, kw in futures.items()}
+    finally:
+        if manager is not None:
+            manager.shutdown()
+    return {kw: by_kw[kw] for kw in sheet_keywords}
+
+# =====================================
+# 🧩 完整审核流程（无界面，供命令行 / 批处理调用）
+# =====================================
+# 标准化三张参考表，notes 收集 (级别, 提示)
+def prepare_refs(fk_df, zd_df, ec_df, notes, profiler=None):
+    return {
+        'fk': prepare_ref_df(fk_df, mapping_fk, 'fk', notes, profiler),
+        'zd': prepare_ref_df(zd_df, mapping_zd, 'zd', notes, profiler),
+        'ec': prepare_ref_df(ec_df, mapping_ec, 'ec', notes, profiler),
+    }
+
+# 由标准化参考表建立参考索引（每组参考文件只建一次，供四张sheet共用）
+def build_ref_index(ref_dfs_std_dict, profiler=None):
+    profiler = profiler or NULL_PROFILER
+    with profiler.stage("build_ref_index", rows=sum(len(df) for df in ref_dfs_std_dict.values())):
+        ref_index = RefIndex(ref_dfs_std_dict)
+    with profiler.stage("parse_ref_dates"):
+        ref_index.prepare_dates()
+    return ref_index
+
+# =====================================
+# 🗃️ 参考数据持久化缓存：放款明细 / 字段 / 二次明细变化远少于月重卡，标准化后的参考表（及漏填检查用到的字段表列、
+# 漏填标注导出用的整表字段表）按文件内容哈希 + 读取与映射规则保存为 Arrow IPC 文件；再次上传同一文件时只计算哈希并内存映射读取，不再解析 Excel
+# =====================================
+# 缓存文件格式或标准化逻辑变化时递增，旧缓存自动作废（映射 / 读取列变化已包含在缓存键中）
+REF_CACHE_VERSION = 4
+# 缓存目录总大小上限（MB），超过时淘汰最久未用的缓存文件，可用环境变量 AUDIT_REF_CACHE_MB 指定
+REF_CACHE_MAX_BYTES = int(os.environ.get("AUDIT_REF_CACHE_MB", "512")) << 20
+
+# 参考文件：{前缀: (文件关键字, sheet关键字, 字段映射)}
+REFERENCE_SOURCES = {
+    "fk": ("放款明细", "威田", mapping_fk),
+    "zd": ("字段", "重卡", mapping_zd),
+    "ec": ("二次明细", None, mapping_ec),
+}
+# object 列（Excel 混合类型）按值的 Python 类型拆成几列保存：类型编号 + 字符串 / 浮点 / 整数 / 时间子列，
+# 读回时每个值的类型与取值都与原列一致。列中出现其他类型（或带时区的时间）时该表不缓存
+ARROW_VALUE_TYPES = [
+    type(None), str, float, int, bool, datetime.datetime, pd.Timestamp,
+    datetime.date, datetime.time, datetime.timedelta, type(pd.NaT),
+]
+ARROW_TYPE_CODES = {t: code for code, t in enumerate(ARROW_VALUE_TYPES)}
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+# 无法无损保存为 Arrow 的列
+class UnsupportedColumn(Exception):
+    pass
+
+# 时间类值 → 整数（datetime: 微秒，Timestamp: 纳秒，date: 序数日，time: 当日微秒，timedelta: 微秒）
+def time_to_int(value):
+    kind = type(value)
+    if kind is datetime.timedelta:
+        return value // MICROSECOND
+    if kind is datetime.date:
+        return value.toordinal()
+    if value.tzinfo is not None:
+        raise UnsupportedColumn("带时区的时间")
+    if kind is pd.Timestamp:
+        return value.value
+    if kind is datetime.time:
+        return (datetime.datetime.combine(EPOCH, value) - EPOCH) // MICROSECOND
+    return (value - EPOCH) // MICROSECOND
+
+def int_to_time(kind, value):
+    if kind is datetime.timedelta:
+        return value * MICROSECOND
+    if kind is datetime.date:
+        return datetime.date.fromordinal(value)
+    if kind is pd.Timestamp:
+        return pd.Timestamp(value)
+    if kind is datetime.time:
+        return (EPOCH + value * MICROSECOND).time()
+    return EPOCH + value * MICROSECOND
+
+# 一列 → {字段名: Arrow 数组} 与列描述（写入 schema 元数据）
+def encode_column(name, values):
+    if is_categorical(values):
+        # 紧凑列类型的 category 列（类别都是字符串）按 Arrow 字典数组保存，读回仍是 category
+        if not all(type(v) is str for v in values.categories):
+            raise UnsupportedColumn("非字符串类别")
+        indices = pa.array(values.codes, mask=values.codes < 0)
+        return {name: pa.DictionaryArray.from_arrays(indices, pa.array(values.categories.to_numpy(), type=pa.string()))}, "category"
+    if values.dtype.kind in "biuf":
+        return {name: pa.array(values)}, "native"
+    if values.dtype.kind in "mM":
+        return {name: pa.array(values.view(np.int64))}, str(values.dtype)
+    if values.dtype != object:
+        raise UnsupportedColumn(str(values.dtype))
+    tags = np.fromiter((ARROW_TYPE_CODES.get(type(v), -1) for v in values), dtype=np.int8, count=len(values))
+    if (tags < 0).any():
+        raise UnsupportedColumn(type(values[np.argmax(tags < 0)]).__name__)
+    arrays = {f"{name}.tag": pa.array(tags)}
+    is_str = tags == ARROW_TYPE_CODES[str]
+    if is_str.any():
+        arrays[f"{name}.str"] = pa.array(np.where(is_str, values, None), type=pa.string())
+    is_float = tags == ARROW_TYPE_CODES[float]
+    if is_float.any():
+        arrays[f"{name}.float"] = pa.array(np.where(is_float, values, 0.0).astype(np.float64))
+    is_int = (tags == ARROW_TYPE_CODES[int]) | (tags == ARROW_TYPE_CODES[bool])
+    if is_int.any():
+        ints = np.zeros(len(values), dtype=np.int64)
+        try:
+            ints[is_int] = values[is_int].astype(np.int64)
+        except OverflowError:
+            raise UnsupportedColumn("超出 int64 的整数")
+        arrays[f"{name}.int"] = pa.array(ints)
+    is_time = tags >= ARROW_TYPE_CODES[datetime.datetime]
+    is_time &= tags != ARROW_TYPE_CODES[type(pd.NaT)]
+    if is_time.any():
+        times = np.zeros(len(values), dtype=np.int64)
+        times[is_time] = [time_to_int(v) for v in values[is_time]]
+        arrays[f"{name}.time"] = pa.array(times)
+    return arrays, "mixed"
+
+def decode_column(table, name, encoding):
+    if encoding == "category":
+        column = table.column(name).combine_chunks()
+        return pd.Categorical.from_codes(column.indices.fill_null(-1).to_numpy(), column.dictionary.to_numpy(zero_copy_only=False))
+    if encoding == "native":
+        return table.column(name).to_numpy()
+    if encoding != "mixed":
+        return table.column(name).to_numpy().view(np.dtype(encoding))
+    tags = table.column(f"{name}.tag").to_numpy()
+    values = np.full(len(tags), None, dtype=object)
+    for code in np.unique(tags).tolist():
+        kind, mask = ARROW_VALUE_TYPES[code], tags == code
+        if kind is str:
+            values[mask] = table.column(f"{name}.str").to_numpy(zero_copy_only=False)[mask]
+        elif kind is float:
+            values[mask] = table.column(f"{name}.float").to_numpy()[mask].tolist()
+        elif kind is int:
+            values[mask] = table.column(f"{name}.int").to_numpy()[mask].tolist()
+        elif kind is bool:
+            values[mask] = (table.column(f"{name}.int").to_numpy()[mask] != 0).tolist()
+        elif kind is type(pd.NaT):
+            values[mask] = pd.NaT
+        elif kind is not type(None):
+            times = table.column(f"{name}.time").to_numpy()[mask].tolist()
+            values[mask] = pd.Series([int_to_time(kind, v) for v in times], dtype=object).to_numpy()
+    return values
+
+# DataFrame（含行索引）→ Arrow 表；列名、各列编码方式与 extra 一起写入 schema 元数据
+def frame_to_arrow(df, extra=None):
+    arrays, columns = {}, []
+    for i, (name, dtype, values) in enumerate(
+        [("__index__", df.index.dtype, df.index.to_numpy())] + [(col, df[col].dtype, df[col].array if is_categorical(df[col]) else df[col].to_numpy()) for col in df.columns]
+    ):
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype) and not isinstance(dtype, pd.CategoricalDtype) or isinstance(df.index, pd.MultiIndex):
+            raise UnsupportedColumn(str(dtype))
+        encoded, encoding = encode_column(f"c{i}", values)
+        arrays.update(encoded)
+        columns.append([name, encoding])
+    if any(not isinstance(name, str) for name, _ in columns):
+        raise UnsupportedColumn("非字符串列名")
+    meta = {"version": REF_CACHE_VERSION, "columns": columns, **(extra or {})}
+    return pa.table(arrays).replace_schema_metadata({"audit": json.dumps(meta, ensure_ascii=False)})
+
+def arrow_to_frame(table):
+    meta = json.loads(table.schema.metadata[b"audit"])
+    (_, index_encoding), *columns = meta["columns"]
+    df = pd.DataFrame(
+        {name: decode_column(table, f"c{i}", encoding) for i, (name, encoding) in enumerate(columns, 1)},
+        index=decode_column(table, "c0", index_encoding),
+    )
+    return df, meta
+
+# 按参考文件缓存的标准化结果：每个文件一组 Arrow IPC 文件（标准化参考表，字段表另有漏填检查列与整表字段表），
+# 缓存键由文件内容哈希、读取规则、字段映射与 REF_CACHE_VERSION 决定；命中时更新访问时间，写入后按总大小淘汰
+class ReferenceStore:
+    def __init__(self, path=None, max_bytes=REF_CACHE_MAX_BYTES):
+        self.path = path or os.path.join(AUDIT_CACHE_DIR, "references")
+        self.max_bytes = max_bytes
+
+    def key(self, prefix, digest):
+        file_kw, _, mapping = REFERENCE_SOURCES[prefix]
+        rules = [WORKBOOK_SHEETS[file_kw], EXPORT_SHEETS.get(file_kw), mapping, MISSING_CHECK_COLUMNS if prefix == "zd" else None]
+        plan = json.dumps([REF_CACHE_VERSION, prefix, digest, rules], ensure_ascii=False)
+        return hashlib.sha256(plan.encode("utf-8")).hexdigest()
+
+    def file(self, key, name):
+        return os.path.join(self.path, f"{key}.{name}.arrow")
+
+    # 返回 ({名称: DataFrame}, 提示信息)；未缓存或缓存文件损坏时返回 None
+    def load(self, prefix, digest, names):
+        if pa is None:
+            return None
+        key = self.key(prefix, digest)
+        frames, notes = {}, []
+        try:
+            for name in names:
+                path = self.file(key, name)
+                with pa.memory_map(path) as source:
+                    frames[name], meta = arrow_to_frame(pa.ipc.open_file(source).read_all())
+                notes.extend(tuple(note) for note in meta.get("notes", []))
+                os.utime(path)
+        except (OSError, pa.ArrowException, KeyError, ValueError):
+            return None
+        return frames, notes
+
+    # 保存一个参考文件的标准化结果；有无法保存的列时不缓存，返回 False
+    def save(self, prefix, digest, frames, notes):
+        if pa is None:
+            return False
+        key = self.key(prefix, digest)
+        try:
+            tables = {
+                name: frame_to_arrow(df, {"notes": notes if i == 0 else []})
+                for i, (name, df) in enumerate(frames.items())
+            }
+        except UnsupportedColumn:
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        for name, table in tables.items():
+            # 先写临时文件再替换，其他进程不会读到写了一半的缓存
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp, self.file(key, name))
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        self.evict()
+        return True
+
+    # 缓存文件总大小超过 max_bytes 时按访问时间从旧到新删除
+    def evict(self):
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(".arrow"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+# 文件内容哈希（与界面上传文件的缓存键一致）
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+# 读取并标准化三个参考文件，返回 {"std": {前缀: 标准化参考表}, "missing_frame": 漏填检查用的字段表列, "zd_frame": 整表字段表}。
+# store 不为 None 时先按文件内容哈希查持久化缓存，命中的文件不解析 Excel；digests 为已算好的 {文件关键字: 哈希}；
+# parsed 为调用方已解析好的 {文件关键字: parse_workbook 结果}，未解析的文件在这里解析。
+# export=True 时字段表按 EXPORT_SHEETS 整表读取（标准化时直接使用），整表也存入缓存，"zd_frame" 供漏填标注导出使用；
+# 否则 "zd_frame" 为 None。参考文件缺少所需sheet或读取失败时抛出 ValueError
+def load_references(file_data, store=None, digests=None, parsed=None, profiler=None, notes=None, checkpoint=None, export=False):
+    profiler = profiler or NULL_PROFILER
+    notes = notes if notes is not None else []
+    digests, parsed = digests or {}, parsed or {}
+    refs = {"std": {}, "missing_frame": None, "zd_frame": None}
+    for prefix, (file_kw, sheet_kw, mapping) in REFERENCE_SOURCES.items():
+        names = ["std"]
+        if prefix == "zd":
+            names += ["missing", "export"] if export else ["missing"]
+        digest = None
+        if store is not None:
+            with profiler.stage("ref_cache_load", target=file_kw) as record:
+                digest = digests.get(file_kw) or content_digest(file_data[file_kw])
+                cached = store.load(prefix, digest, names)
+                record["rows"] = None if cached is None else len(cached[0]["std"])
+            if cached is not None:
+                frames, file_notes = cached
+                refs["std"][prefix] = frames["std"]
+                if prefix == "zd":
+                    refs["missing_frame"], refs["zd_frame"] = frames["missing"], frames.get("export")
+                notes.extend(file_notes)
+                continue
+
+        file_notes = []
+        if file_kw not in parsed:
+            if checkpoint:
+                checkpoint(f"正在读取「{file_kw}」...")
+            specs = EXPORT_SHEETS if export and file_kw in EXPORT_SHEETS else WORKBOOK_SHEETS
+            parsed[file_kw] = parse_workbook(file_data[file_kw], specs[file_kw], profiler, file_notes)
+        ref_df = reference_frame(parsed, file_kw, sheet_kw)
+        frames = {"std": prepare_ref_df(ref_df, mapping, prefix, file_notes, profiler)}
+        if prefix == "zd":
+            frames["missing"] = ref_df.iloc[:, matched_positions(ref_df, MISSING_CHECK_COLUMNS)]
+            refs["missing_frame"] = frames["missing"]
+            if export:
+                frames["export"] = refs["zd_frame"] = ref_df
+        refs["std"][prefix] = frames["std"]
+        notes.extend(file_notes)
+        if store is not None:
+            with profiler.stage("ref_cache_save", target=file_kw, rows=len(frames["std"])):
+                store.save(prefix, digest, frames, file_notes)
+    return refs
+
+# 对一组文件（{文件关键字: xlsx 字节}）执行与界面相同的全部检查：四张sheet比对 + 字段表漏填检查。
+# 返回 {"notes", "sheets": {sheet关键字: (result, rendered)}, "total_errors", "missing_count", "unmatched_contracts",
+# "missing_workbooks", "bundle", "bundle_format", "profile"}，
+# profile=True 时 "profile" 为全部阶段的性能记录；store / scope 见 audit_sheet_job；
+# chunk_size 不为 None 时月重卡不整表读取，各sheet分块流式审核（见 stream_sheet_job）；
+# ref_store 不为 None 时参考数据走持久化缓存（见 load_references）；
+# bundle 为 BUNDLE_FORMATS 中的格式时全部结果写成一个合并导出文件放在 "bundle"，不再单独生成各文件（"missing_workbooks" 为 None）；
+# compresslevel 为导出 xlsx 的压缩级别（见 workbook_bytes）；
+# checkpoint(text=None) 在各阶段之间以及导出文件每块行之前调用（text 为即将开始的阶段说明），
+# 抛出异常即中止本次审核，后台任务借此在比对之外的阶段也能及时取消（见 audit_jobs）
+def run_audit(file_data, executor=None, on_progress=None, profile=False, store=None, scope="", chunk_size=None, ref_store=None, bundle=None, compresslevel=None, checkpoint=None):
+    if bundle is not None:
+        validate_bundle_format(bundle, streamed=bool(chunk_size))
+    checkpoint = checkpoint or (lambda text=None: None)
+    profiler = StageProfiler(enabled=profile)
+    notes = []
+    # 参考文件先查缓存（命中时连漏填导出用的整表字段表也不解析），未命中时字段表整表读取一次，标准化与导出共用
+    parsed = {}
+    refs = load_references(file_data, ref_store, parsed=parsed, profiler=profiler, notes=notes, checkpoint=checkpoint, export=True)
+    zd_df = refs["zd_frame"]
+    if not chunk_size:
+        checkpoint("正在读取「月重卡」...")
+        parsed["月重卡"] = parse_workbook(file_data["月重卡"], WORKBOOK_SHEETS["月重卡"], profiler, notes)
+
+    checkpoint("正在建立参考数据索引...")
+    ref_index = build_ref_index(refs["std"], profiler)
+    checkpoint()
+    main_sheets = file_data["月重卡"] if chunk_size else parsed["月重卡"]
+    sheets = run_sheet_audits(
+        sheet_keywords, main_sheets, ref_index, executor, on_progress, profile, store, scope, chunk_size,
+        render=bundle is None, compresslevel=compresslevel,
+    )
+
+    contracts_seen_all_sheets = set()
+    for result, _ in sheets.values():
+        contracts_seen_all_sheets.update(result["contracts_seen"])
+        profiler.records.extend(result["profile"])
+    missing_frame = refs["missing_frame"]
+    checkpoint("正在检查字段表漏填...")
+    with profiler.stage("find_missing", target="字段", rows=len(missing_frame)):
+        missing_mask, unmatched = find_missing_contracts(missing_frame, find_col(missing_frame, "合同"), contracts_seen_all_sheets)
+    missing_workbooks = bundle_data = None
+    if bundle is None:
+        checkpoint("正在生成漏填标注文件...")
+        missing_workbooks = render_missing_workbooks(zd_df, missing_mask, profiler, compresslevel, checkpoint)
+    else:
+        checkpoint("正在生成合并导出文件...")
+        bundle_data = render_export_bundle(
+            sheets, None if chunk_size else parsed["月重卡"][0], zd_df, missing_mask, bundle, compresslevel, profiler, checkpoint)
+
+    return {
+        "notes": notes,
+        "sheets": sheets,
+        "total_errors": sum(result["total_errors"] for result, _ in sheets.values()),
+        "missing_count": int(missing_mask.sum()),
+        "unmatched_contracts": unmatched,
+        "missing_workbooks": missing_workbooks,
+        "bundle": bundle_data,
+        "bundle_format": bundle,
+        "profile": profiler.records,
+    }
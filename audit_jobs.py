@@ -0,0 +1,179 @@
+# =====================================
+# 后台审核任务队列：界面提交一组文件后立即返回，审核在本地工作池（进程或线程）中运行
+# 每个任务有任务号、实时进度（沿用比对阶段逐字段的进度上报）、可取消；
+# 结果保存在有上限的存储中，下载过的任务优先被淘汰。不依赖 Streamlit，界面见 app2.py
+# =====================================
+
+import time
+import queue
+import uuid
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor
+
+from audit_engine import sheet_keywords, make_executor, run_audit
+
+# 任务状态及显示名称
+JOB_STATUS = {"queued": "排队中", "running": "运行中", "done": "已完成", "failed": "失败", "cancelled": "已取消"}
+# 同时运行的任务数、保留的已结束任务数
+JOB_WORKERS = 2
+JOB_MAX_RESULTS = 8
+
+# 任务被取消：在下一次进度上报或阶段检查点时抛出，中止 run_audit
+class JobCancelled(Exception):
+    pass
+
+# 在工作进程/线程中执行一个任务。进度与开始事件放入 channel，由提交方在查询时汇总；
+# cancelled 为共享的 {任务号: True}，每次上报进度前以及 run_audit 的各阶段检查点检查，任务被取消时抛出 JobCancelled。
+# 单个工作簿的解析不可中断，取消最迟在当前文件读完后生效；不直接终止工作进程，以免影响共用进程池的其他任务
+def _run_job(job_id, file_data, options, channel, cancelled):
+    if job_id in cancelled:
+        raise JobCancelled()
+    channel.put((job_id, "running", None))
+
+    def on_progress(kw, fraction, text):
+        if job_id in cancelled:
+            raise JobCancelled()
+        channel.put((job_id, "progress", (kw, fraction, text)))
+
+    def checkpoint(text=None):
+        if job_id in cancelled:
+            raise JobCancelled()
+        if text:
+            channel.put((job_id, "stage", text))
+
+    return run_audit(file_data, on_progress=on_progress, checkpoint=checkpoint, **options)
+
+class AuditJobQueue:
+    # mode 为 "process"（多进程，默认）或 "thread"；max_workers 为同时运行的任务数，
+    # max_results 为保留结果的已结束任务数（运行中 / 排队中的任务不计入也不会被淘汰）
+    def __init__(self, mode="process", max_workers=JOB_WORKERS, max_results=JOB_MAX_RESULTS):
+        self.mode, self.max_workers, self.max_results = mode, max_workers, max_results
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # 任务号 → 任务记录（按提交顺序）
+        self._futures = {}
+        self._manager = None
+        if mode == "process":
+            # 跨进程上报进度、传递取消标记需要 Manager
+            self._manager = multiprocessing.get_context("spawn").Manager()
+            self._channel, self._cancelled = self._manager.Queue(), self._manager.dict()
+        else:
+            self._channel, self._cancelled = queue.Queue(), {}
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        return make_executor("process" if self.mode == "process" else "thread", self.max_workers)
+
+    # 提交一组文件（{文件关键字: xlsx 字节}），options 原样传给 run_audit（profile / store / scope / chunk_size / ref_store / bundle / compresslevel），返回任务号
+    def submit(self, name, file_data, **options):
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id, "name": name, "status": "queued", "progress": {}, "text": "排队中...",
+                "submitted": time.time(), "started": None, "finished": None,
+                "result": None, "error": None, "downloaded": False,
+            }
+        try:
+            future = self._submit(job_id, file_data, options)
+        except BrokenExecutor:
+            # 工作进程异常退出后执行器不可再用，换一个新的重新提交
+            self._executor = self._new_executor()
+            future = self._submit(job_id, file_data, options)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _submit(self, job_id, file_data, options):
+        return self._executor.submit(_run_job, job_id, file_data, options, self._channel, self._cancelled)
+
+    # 任务结束（完成 / 失败 / 取消）时由执行器回调
+    def _finish(self, job_id, future):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            self._futures.pop(job_id, None)
+            if job is None:
+                return
+            job["finished"] = time.time()
+            if future.cancelled():
+                job["status"] = "cancelled"
+            elif isinstance(future.exception(), JobCancelled):
+                job["status"] = "cancelled"
+            elif future.exception() is not None:
+                job["status"], job["error"] = "failed", f"{type(future.exception()).__name__}: {future.exception()}"
+            else:
+                job["status"], job["result"] = "done", future.result()
+            self._evict()
+
+    # 已结束任务超过 max_results 时淘汰：先淘汰已下载或没有结果（失败 / 取消）的，再淘汰未下载的；同类按提交顺序
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished"] is not None]
+        ordered = sorted(finished, key=lambda j: self._jobs[j]["status"] == "done" and not self._jobs[j]["downloaded"])
+        for job_id in ordered[:max(len(finished) - self.max_results, 0)]:
+            del self._jobs[job_id]
+            self._cancelled.pop(job_id, None)
+
+    # 把工作进程/线程上报的开始与进度事件汇总到任务记录
+    def _drain(self):
+        while True:
+            try:
+                job_id, kind, payload = self._channel.get_nowait()
+            except queue.Empty:
+                return
+            job = self._jobs.get(job_id)
+            if job is None or job["finished"] is not None:
+                continue
+            if kind == "running":
+                job["status"], job["started"], job["text"] = "running", time.time(), "读取文件..."
+            elif kind == "stage":
+                job["text"] = payload
+            else:
+                kw, fraction, text = payload
+                job["progress"][kw] = fraction
+                job["text"] = text
+
+    # 取消任务：排队中的直接撤销，运行中的在下一次进度上报或阶段检查点中止；已结束的任务返回 False
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["finished"] is not None:
+                return False
+            self._cancelled[job_id] = True
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return True
+
+    # 任务状态快照（不含结果），job_ids 为 None 时返回全部任务；已淘汰的任务不在其中。
+    # fraction 为各sheet进度的平均值
+    def snapshot(self, job_ids=None):
+        with self._lock:
+            self._drain()
+            ids = self._jobs if job_ids is None else [j for j in job_ids if j in self._jobs]
+            return [
+                {
+                    **{k: v for k, v in self._jobs[j].items() if k not in ("result", "progress")},
+                    "fraction": sum(self._jobs[j]["progress"].values()) / len(sheet_keywords),
+                }
+                for j in ids
+            ]
+
+    # 已完成任务的 run_audit 结果；未完成或已淘汰时返回 None
+    def result(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job["result"] if job is not None else None
+
+    # 标记任务结果已下载（淘汰时优先）
+    def mark_downloaded(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]["downloaded"] = True
+
+    def shutdown(self):
+        for job_id in list(self._futures):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
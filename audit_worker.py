@@ -0,0 +1,8 @@
+# =====================================
+# 多进程工作进程的入口模块。spawn 出的子进程启动时按父进程 __main__ 的 __spec__ 重新导入主模块：
+# 网页版（app2.py）把自己的 __spec__ 指向本模块，子进程导入的是这里而不是 Streamlit 界面脚本，
+# 不会重新执行界面，也不需要在启动工作进程时替换父进程的 sys.modules["__main__"]
+# =====================================
+
+# 工作进程启动时即导入审核逻辑，第一个任务不再等待导入
+import audit_engine
@@ -0,0 +1,402 @@
+# =====================================
+# 性能基准：生成模拟的 月重卡 / 放款明细 / 字段 / 二次明细 文件，分阶段计时
+# 用法：
+#   python bench_audit.py                                  # 默认 1k、10k 合同
+#   python bench_audit.py --sizes 1000 10000 100000 500000 -o bench_results.json
+#   python bench_audit.py --compare 上次的bench_results.json  # 与上次结果对比，找出变慢的阶段
+# 生成的数据缓存在 .bench_data/（按规模与随机种子区分），结果写入 JSON 便于跨版本比较
+# =====================================
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import openpyxl
+from openpyxl import Workbook
+
+from audit_engine import (
+    INPUT_FILE_KEYWORDS, WORKBOOK_SHEETS, EXPORT_SHEETS, sheet_keywords, mapping_fk, mapping_zd, mapping_ec,
+    find_col, parse_workbook, reference_frame, prepare_ref_df, normalize_contract_key,
+    normalize_num_vec, compare_series_vec, check_one_sheet, render_sheet_workbooks,
+    find_missing_contracts, render_missing_workbooks, excel_engine, RefIndex, normalize_contract_text,
+    date_days, date_format_context, load_references, ReferenceStore, compact_frame, is_categorical, render_export_bundle,
+)
+
+# =====================================
+# 🧪 模拟数据生成
+# =====================================
+# 月重卡各sheet名（含关键字即可匹配），合同按此顺序分配到各sheet
+MAIN_SHEET_NAMES = ["二次", "部分担保", "随州", "驻店客户"]
+MAIN_COLUMNS = [
+    "序号", "合同编号", "授信方", "租赁本金", "租赁期限", "挂车台数", "起租收益率",
+    "保证金比例", "项目提报人", "起租时间", "客户经理", "所属省区", "主车台数", "城市经理", "二次时间",
+]
+ERROR_RATE = 0.02        # 注入差异的单元格比例
+MISSING_RATE = 0.03      # 字段表中未出现在记录表里的合同比例
+ZD_EXTRA_COLUMNS = 20    # 字段表的其他列（导出时会整行写出）
+
+def generate_frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = np.array([f"PAZL{2024000000 + i}" for i in range(n)], dtype=object)
+    start = datetime(2024, 1, 1)
+    lease_start = np.array([start + timedelta(days=int(d)) for d in rng.integers(0, 300, n)], dtype=object)
+    second_time = np.array([datetime(2024, 6, 1) + timedelta(days=int(d)) for d in rng.integers(0, 100, n)], dtype=object)
+
+    fk = pd.DataFrame({
+        "合同编号": keys,
+        "授信方": rng.choice(["平安银行", "工商银行", "建设银行"], n),
+        "租赁本金": rng.integers(100000, 900000, n) + rng.choice([0, 0.5], n),
+        "租赁期限": rng.choice([1, 2, 3], n),
+        "挂车数量": rng.integers(0, 5, n),
+        "XIRR": rng.choice(["8.5%", "9%", "10.2%"], n),
+    })
+    zd = pd.DataFrame({
+        "合同号": keys,
+        "保证金比例_2": rng.choice([0.1, 0.15, 0.2], n),
+        "项目提报人": rng.choice(["张三", "李四", "王五"], n),
+        "起租日_商": lease_start,
+        "客户经理_资产": rng.choice(["赵六", "钱七"], n),
+        "所属区域": rng.choice(["湖北", "河南", "湖南"], n),
+        "主车台数": rng.integers(1, 4, n),
+        "城市经理": rng.choice(["孙八", "周九", "", None], n),
+        "是否车管家": rng.choice(["是", "否"], n, p=[0.1, 0.9]),
+        "提成类型": rng.choice(["普通", "驻店", "联合租赁"], n, p=[0.8, 0.1, 0.1]),
+    })
+    for i in range(ZD_EXTRA_COLUMNS):
+        zd[f"其他字段{i}"] = rng.integers(0, 1000, n)
+    ec = pd.DataFrame({
+        "合同编号": keys,
+        "出本流程时间": [d.strftime("%Y/%m/%d") for d in second_time],
+    })
+
+    # 记录表：与参考表一致，再按比例注入差异；合同号混入大小写/空格差异
+    main = pd.DataFrame({
+        "序号": np.arange(1, n + 1),
+        "合同编号": [f" {k.lower()}" if i % 17 == 0 else k for i, k in enumerate(keys)],
+        "授信方": fk["授信方"],
+        "租赁本金": fk["租赁本金"],
+        "租赁期限": fk["租赁期限"] * 12,
+        "挂车台数": fk["挂车数量"],
+        "起租收益率": fk["XIRR"].str.rstrip("%").astype(float) / 100,
+        "保证金比例": zd["保证金比例_2"],
+        "项目提报人": zd["项目提报人"],
+        "起租时间": zd["起租日_商"],
+        "客户经理": zd["客户经理_资产"],
+        "所属省区": zd["所属区域"],
+        "主车台数": zd["主车台数"],
+        "城市经理": zd["城市经理"].fillna("孙八").replace("", "周九"),
+        "二次时间": second_time,
+    }, columns=MAIN_COLUMNS)
+    inject = rng.random((n, len(MAIN_COLUMNS))) < ERROR_RATE
+    for j, col in enumerate(MAIN_COLUMNS[2:], 2):
+        rows = np.flatnonzero(inject[:, j])
+        if main[col].dtype.kind in "if":
+            main.loc[rows, col] = main.loc[rows, col] + 3
+        elif col in ("起租时间", "二次时间"):
+            main.loc[rows, col] = main.loc[rows, col] + timedelta(days=2)
+        else:
+            main.loc[rows, col] = "差异"
+
+    # 一部分合同不写入记录表，用于漏填检查
+    main = main.iloc[: int(n * (1 - MISSING_RATE))]
+    return {"月重卡": main, "放款明细": fk, "字段": zd, "二次明细": ec}
+
+def cell_value(v):
+    if v is None or (isinstance(v, float) and np.isnan(v)):
+        return None
+    return v.item() if isinstance(v, np.generic) else v
+
+# write-only 写出：sheets 为 [(sheet名, DataFrame, 表头前的标题行数)]
+def write_workbook(path, sheets):
+    wb = Workbook(write_only=True)
+    for name, df, title_rows in sheets:
+        ws = wb.create_sheet(name)
+        for _ in range(title_rows):
+            ws.append([f"{name} 明细"])
+        ws.append(list(df.columns))
+        for row in df.itertuples(index=False, name=None):
+            ws.append([cell_value(v) for v in row])
+    wb.save(path)
+
+# 生成一组四个文件（已存在则直接复用），返回 {文件关键字: 路径}
+def generate_month_set(n, data_dir, seed=0):
+    out_dir = Path(data_dir) / f"n{n}_seed{seed}"
+    paths = {file_kw: out_dir / f"{file_kw}.xlsx" for file_kw in INPUT_FILE_KEYWORDS}
+    if all(p.exists() for p in paths.values()):
+        return paths
+    out_dir.mkdir(parents=True, exist_ok=True)
+    frames = generate_frames(n, seed)
+    main = frames["月重卡"]
+    parts = np.array_split(np.arange(len(main)), len(MAIN_SHEET_NAMES))
+    # 月重卡：标题行 + 第二行为表头
+    write_workbook(paths["月重卡"], [(name, main.iloc[p], 1) for name, p in zip(MAIN_SHEET_NAMES, parts)])
+    write_workbook(paths["放款明细"], [("威田数据", frames["放款明细"], 0)])
+    write_workbook(paths["字段"], [("轻卡", pd.DataFrame({"合同号": []}), 0), ("重卡", frames["字段"], 0)])
+    write_workbook(paths["二次明细"], [("Sheet1", frames["二次明细"], 0)])
+    return paths
+
+# =====================================
+# ⏱️ 分阶段计时
+# =====================================
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    # 执行 func 并记录耗时（秒）与处理行数；重复执行时保留最短耗时
+    def run(self, name, func, *args, rows=None, **kwargs):
+        start = time.perf_counter()
+        value = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        entry = self.stages.get(name)
+        if entry is None or seconds < entry["seconds"]:
+            self.stages[name] = {"seconds": round(seconds, 6), "rows": rows}
+        return value
+
+    def add(self, name, seconds, rows=None):
+        entry = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+        entry["seconds"] = round(entry["seconds"] + seconds, 6)
+        entry["rows"] = (entry["rows"] or 0) + (rows or 0)
+
+# 比对字段的类型，与 compare_series_vec 的分支一致：日期 / 数值 / 文本
+def field_kind(main_kw, s_main):
+    if any(k in main_kw for k in ["日期", "时间"]):
+        return "date"
+    is_num, _, _ = normalize_num_vec(s_main)
+    return "numeric" if is_num.mean() >= 0.5 else "text"
+
+# 复刻 check_one_sheet 的合并步骤（在参考索引中定位合同并取出全部参考列），单独计时合并与逐字段比对；
+# 阶段名仍为 merge/，便于与旧版本结果对比
+def merge_for_sheet(main_df, ref_index):
+    contract_col = find_col(main_df, "合同")
+    positions = ref_index.locate(normalize_contract_key(main_df[contract_col]))
+    return {ref_col: ref_index.column(ref_col, positions, main_df.index) for ref_col in ref_index.columns}
+
+def bench_compare(timer, main_df, merged):
+    mappings_all = {"fk": mapping_fk, "zd": mapping_zd, "ec": mapping_ec}
+    for prefix, mapping in mappings_all.items():
+        for main_kw in mapping:
+            main_col = find_col(main_df, main_kw, exact=(main_kw == "城市经理"))
+            ref_col = f"ref_{prefix}_{main_kw}"
+            if not main_col or ref_col not in merged:
+                continue
+            s_main, s_ref = main_df[main_col], merged[ref_col]
+            start = time.perf_counter()
+            compare_series_vec(s_main, s_ref, main_kw)
+            seconds = time.perf_counter() - start
+            timer.add(f"compare/{field_kind(main_kw, s_main)}", seconds, len(main_df))
+            timer.add(f"compare_field/{prefix}.{main_kw}", seconds, len(main_df))
+
+# 改为单次遍历去重值之前的 normalize_contract_key（逐列五次 str / 正则处理），用于对比耗时与核对结果
+def legacy_normalize_contract_key(series):
+    s = series.astype(str)
+    s = s.str.replace(r"\.0$", "", regex=True)
+    s = s.str.strip()
+    s = s.str.upper()
+    s = s.str.replace('－', '-', regex=False)
+    return s.str.replace(r'\s+', '', regex=True)
+
+# 合同号标准化：旧版 / 新版首次（清空记忆表）/ 新版再次（记忆表命中），结果必须与旧版完全一致
+def bench_contract_keys(timer, contract_series):
+    rows = sum(len(s) for s in contract_series)
+    legacy = timer.run("contract_key/legacy", lambda: [legacy_normalize_contract_key(s) for s in contract_series], rows=rows)
+    normalize_contract_text.cache_clear()
+    timer.run("contract_key/cold", lambda: [normalize_contract_key(s) for s in contract_series], rows=rows)
+    fused = timer.run("contract_key/warm", lambda: [normalize_contract_key(s) for s in contract_series], rows=rows)
+    for old, new in zip(legacy, fused):
+        if not old.equals(new.astype(object)):
+            raise AssertionError("normalize_contract_key 与旧版结果不一致")
+
+# 参考日期列：旧版每张sheet对齐后整列 to_datetime / 新版按 (列, 格式) 解析一次后按行号取用，结果必须一致
+def bench_ref_dates(timer, main_dfs, ref_index):
+    aligned = []
+    for main_df in main_dfs:
+        positions = ref_index.locate(normalize_contract_key(main_df[find_col(main_df, "合同")]))
+        for ref_col in ref_index.columns:
+            if any(k in ref_col for k in ("日期", "时间")):
+                aligned.append((ref_col, positions, ref_index.column(ref_col, positions, main_df.index)))
+    rows = sum(len(p) for _, p, _ in aligned)
+
+    def legacy():
+        return [(dates.notna().to_numpy(), date_days(dates)) for dates in (pd.to_datetime(s, errors='coerce') for _, _, s in aligned)]
+
+    def memo():
+        return [ref_index.date_days(ref_col, positions, date_format_context(s)) for ref_col, positions, s in aligned]
+
+    old = timer.run("ref_dates/legacy", legacy, rows=rows)
+    ref_index.parsed_dates.clear()
+    timer.run("ref_dates/cold", memo, rows=rows)
+    new = timer.run("ref_dates/warm", memo, rows=rows)
+    for (old_valid, old_days), parsed in zip(old, new):
+        if parsed is not None and not (np.array_equal(old_valid, parsed[0]) and np.array_equal(old_days[old_valid], parsed[1][old_valid])):
+            raise AssertionError("参考日期解析与旧版结果不一致")
+
+# 参考数据：不用缓存（解析 Excel + 标准化）/ 缓存未命中（另加写入）/ 命中（哈希 + 内存映射读取），结果必须一致
+def bench_ref_cache(timer, data):
+    ref_data = {file_kw: data[file_kw] for file_kw in ("放款明细", "字段", "二次明细")}
+    rows = sum(len(b) for b in ref_data.values())
+    with tempfile.TemporaryDirectory() as cache_dir:
+        store = ReferenceStore(cache_dir)
+        parsed = timer.run("ref_cache/none", load_references, ref_data, rows=rows)
+        timer.run("ref_cache/cold", load_references, ref_data, store, rows=rows)
+        cached = timer.run("ref_cache/warm", load_references, ref_data, store, rows=rows)
+    for prefix, df in parsed["std"].items():
+        if not df.reset_index(drop=True).equals(cached["std"][prefix].reset_index(drop=True)):
+            raise AssertionError(f"参考数据缓存与解析结果不一致：{prefix}")
+
+# 解析结果还原成紧凑前的列类型（category → object，整数 → int64）
+def loosen_frame(df):
+    dtypes = {col: object for col in df.columns if is_categorical(df[col])}
+    dtypes.update({col: np.int64 for col in df.columns if df[col].dtype.kind == "i"})
+    return df.astype(dtypes)
+
+# 紧凑列类型：计时 compact_frame，并记录解析结果紧凑前后的内存（MB）
+def bench_compact(timer, frames):
+    loose = [loosen_frame(df) for df in frames]
+    compacted = timer.run("compact/frames", lambda: [compact_frame(df) for df in loose], rows=sum(len(df) for df in loose))
+    memory_mb = lambda dfs: round(sum(df.memory_usage(index=True, deep=True).sum() for df in dfs) / 2**20, 3)
+    return {"object": memory_mb(loose), "compact": memory_mb(compacted)}
+
+def bench_size(n, data_dir, repeat=1, seed=0):
+    gen_start = time.perf_counter()
+    paths = generate_month_set(n, data_dir, seed)
+    gen_seconds = time.perf_counter() - gen_start
+    data = {file_kw: p.read_bytes() for file_kw, p in paths.items()}
+
+    timer = StageTimer()
+    for _ in range(repeat):
+        parsed = {
+            file_kw: timer.run(f"parse/{file_kw}", parse_workbook, data[file_kw], WORKBOOK_SHEETS[file_kw])
+            for file_kw in INPUT_FILE_KEYWORDS
+        }
+        refs = {
+            "fk": (reference_frame(parsed, "放款明细", "威田"), mapping_fk),
+            "zd": (reference_frame(parsed, "字段", "重卡"), mapping_zd),
+            "ec": (reference_frame(parsed, "二次明细", None), mapping_ec),
+        }
+        notes = []
+        ref_dfs_std_dict = {
+            prefix: timer.run(f"prepare_ref_df/{prefix}", prepare_ref_df, df, mapping, prefix, notes, rows=len(df))
+            for prefix, (df, mapping) in refs.items()
+        }
+        ref_index = timer.run("build_ref_index", RefIndex, ref_dfs_std_dict)
+        bench_contract_keys(timer, [df[find_col(df, "合同")] for df, _ in refs.values()] + [
+            df[find_col(df, "合同")] for df in parsed["月重卡"][0].values()
+        ])
+        bench_ref_dates(timer, list(parsed["月重卡"][0].values()), ref_index)
+        bench_ref_cache(timer, data)
+        frame_memory_mb = bench_compact(timer, list(parsed["月重卡"][0].values()) + [df for df, _ in refs.values()])
+
+        compare_timer = StageTimer()
+        contracts_seen = set()
+        sheet_results = {}
+        for kw in sheet_keywords:
+            main_df = parsed["月重卡"][0][kw]
+            merged = timer.run(f"merge/{kw}", merge_for_sheet, main_df, ref_index, rows=len(main_df))
+            bench_compare(compare_timer, main_df, merged)
+            result = timer.run(f"check_one_sheet/{kw}", check_one_sheet, kw, parsed["月重卡"], ref_index, rows=len(main_df))
+            contracts_seen.update(result["contracts_seen"])
+            sheet_results[kw] = (result, None)
+            timer.run(f"export_sheet/{kw}", render_sheet_workbooks, main_df, result, rows=len(main_df))
+        for name, entry in compare_timer.stages.items():
+            if name not in timer.stages or entry["seconds"] < timer.stages[name]["seconds"]:
+                timer.stages[name] = entry
+
+        zd_df = refs["zd"][0]
+        missing_mask, _ = timer.run(
+            "missing/find", find_missing_contracts, zd_df, find_col(zd_df, "合同"), contracts_seen, rows=len(zd_df)
+        )
+        # 漏填标注版写出整张字段表，导出前整表读取
+        zd_full = reference_frame(
+            {"字段": timer.run("parse/字段_export", parse_workbook, data["字段"], EXPORT_SHEETS["字段"])}, "字段", "重卡"
+        )
+        timer.run("export_missing", render_missing_workbooks, zd_full, missing_mask, rows=len(zd_full))
+        # 合并导出（与上面分别导出的结果相同，不计入合计）
+        bundle_rows = len(zd_full) + sum(len(df) for df in parsed["月重卡"][0].values())
+        for name, fmt, level in (("workbook", "workbook", None), ("zip", "zip", None), ("zip_level1", "zip", 1)):
+            timer.run(
+                f"export_bundle/{name}", render_export_bundle, sheet_results, parsed["月重卡"][0], zd_full, missing_mask,
+                fmt, level, rows=bundle_rows,
+            )
+
+    return {
+        "contracts": n,
+        "generate_seconds": round(gen_seconds, 3),
+        "file_bytes": {file_kw: len(b) for file_kw, b in data.items()},
+        "stages": timer.stages,
+        "frame_memory_mb": frame_memory_mb,
+        "total_seconds": round(sum(
+            e["seconds"] for name, e in timer.stages.items() if not name.startswith(("compare", "merge/", "contract_key/", "ref_dates/", "ref_cache/", "compact/", "export_bundle/"))
+        ), 6),
+    }
+
+# =====================================
+# 📊 结果输出与对比
+# =====================================
+def environment_info():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "openpyxl": openpyxl.__version__,
+        "excel_engine": excel_engine(),
+    }
+
+def print_run(run, previous=None):
+    print(f"\n📏 {run['contracts']} 个合同（合计 {run['total_seconds']:.3f} 秒）")
+    memory = run.get("frame_memory_mb")
+    if memory:
+        print(f"  解析结果内存：object {memory['object']:.1f} MB → 紧凑 {memory['compact']:.1f} MB")
+    for name, entry in run["stages"].items():
+        line = f"  {name:<36}{entry['seconds']:>10.4f} 秒"
+        old = (previous or {}).get(name)
+        if old and old["seconds"] > 0:
+            ratio = entry["seconds"] / old["seconds"]
+            line += f"   ×{ratio:.2f}" + ("  ⚠️" if ratio > 1.2 else "")
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="审核流程性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="合同数量（可多个）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个规模重复次数，取最短耗时")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=".bench_data", help="模拟数据缓存目录")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args(argv)
+
+    previous = {}
+    if args.compare:
+        for run in json.loads(Path(args.compare).read_text(encoding="utf-8"))["runs"]:
+            previous[run["contracts"]] = run["stages"]
+
+    runs = []
+    for n in args.sizes:
+        run = bench_size(n, args.data_dir, args.repeat, args.seed)
+        print_run(run, previous.get(n))
+        runs.append(run)
+
+    report = {"environment": environment_info(), "repeat": args.repeat, "seed": args.seed, "runs": runs}
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n✅ 结果已写入 {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
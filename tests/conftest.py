@@ -0,0 +1,15 @@
+# 测试直接导入仓库根目录下的模块（audit_engine、bench_audit 等）；模拟数据沿用 bench_audit 的生成器
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from bench_audit import generate_month_set
+
+# 一组模拟的四个文件 {文件关键字: xlsx 字节}（合同数较少，整个测试会话共用）
+@pytest.fixture(scope="session")
+def month_files(tmp_path_factory):
+    paths = generate_month_set(240, tmp_path_factory.mktemp("data"), seed=1)
+    return {file_kw: path.read_bytes() for file_kw, path in paths.items()}
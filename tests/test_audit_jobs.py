@@ -0,0 +1,59 @@
+# =====================================
+# 后台任务的取消：run_audit 在比对之外的阶段（读取文件、建索引、漏填检查、导出）也要经过检查点，
+# 任务被取消后在下一个检查点中止，而不是跑完全部导出
+# =====================================
+
+import time
+
+import pytest
+
+from audit_engine import run_audit
+from audit_jobs import AuditJobQueue
+
+pytestmark = [pytest.mark.filterwarnings("ignore::UserWarning"), pytest.mark.filterwarnings("ignore::FutureWarning")]
+
+class Stop(Exception):
+    pass
+
+# 记录检查点的阶段说明，遇到 stop_at 时抛出
+def recording_checkpoint(texts, stop_at=None):
+    def checkpoint(text=None):
+        texts.append(text)
+        if stop_at is not None and text == stop_at:
+            raise Stop()
+    return checkpoint
+
+def test_checkpoints_cover_every_stage(month_files):
+    texts = []
+    run_audit(month_files, checkpoint=recording_checkpoint(texts))
+    stages = [text for text in texts if text]
+    assert stages[:4] == ["正在读取「放款明细」...", "正在读取「字段」...", "正在读取「二次明细」...", "正在读取「月重卡」..."]
+    assert "正在建立参考数据索引..." in stages
+    assert stages.index("正在检查字段表漏填...") < stages.index("正在生成漏填标注文件...")
+    # 导出时每块行之前还有不带说明的检查点
+    assert texts.index("正在生成漏填标注文件...") < len(texts) - 1
+
+@pytest.mark.parametrize("bundle, stage", [(None, "正在生成漏填标注文件..."), ("workbook", "正在生成合并导出文件...")])
+def test_checkpoint_aborts_exports(month_files, bundle, stage):
+    texts = []
+    with pytest.raises(Stop):
+        run_audit(month_files, bundle=bundle, checkpoint=recording_checkpoint(texts, stop_at=stage))
+    assert texts[-1] == stage
+
+def test_cancel_while_rendering_stops_job(month_files):
+    jobs = AuditJobQueue(mode="thread", max_workers=1)
+    try:
+        job_id = jobs.submit("t", month_files)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            job = jobs.snapshot([job_id])[0]
+            if job["status"] == "running":
+                break
+            time.sleep(0.01)
+        assert jobs.cancel(job_id)
+        while time.time() < deadline and jobs.snapshot([job_id])[0]["status"] == "running":
+            time.sleep(0.05)
+        assert jobs.snapshot([job_id])[0]["status"] == "cancelled"
+        assert jobs.result(job_id) is None
+    finally:
+        jobs.shutdown()
@@ -0,0 +1,28 @@
+# =====================================
+# 解析时的列压缩（compact_frame）不能改变比对结果：压缩为 int8 的参考列参与换算（租赁期限 年 -> 月）时不能溢出
+# =====================================
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import compact_frame, compare_series_vec, mapping_fk, prepare_ref_df
+
+def fk_reference(terms):
+    return pd.DataFrame({
+        "合同号": [f"PAZL{i:06d}" for i in range(len(terms))],
+        "租赁期限": np.array(terms, dtype=np.int64),
+    })
+
+def test_scaled_reference_column_does_not_overflow():
+    ref_df = compact_frame(fk_reference([11, 10, 3, 127]))
+    assert ref_df["租赁期限"].dtype == np.int8
+    std_df = prepare_ref_df(ref_df, mapping_fk, "fk", [])
+    assert std_df["ref_fk_租赁期限"].tolist() == [132, 120, 36, 1524]
+    assert std_df["ref_fk_租赁期限"].dtype == np.int64
+
+# 放款明细 租赁期限 11 年与月重卡 132 个月一致，不报错
+def test_scaled_reference_matches_main_months():
+    std_df = prepare_ref_df(compact_frame(fk_reference([11, 11])), mapping_fk, "fk", [])
+    main = compact_frame(pd.DataFrame({"租赁期限": [132, 131]}))["租赁期限"]
+    errors = compare_series_vec(main, std_df["ref_fk_租赁期限"], "租赁期限")
+    assert errors.tolist() == [False, True]
@@ -0,0 +1,170 @@
+# =====================================
+# compare_series_vec 与原实现（逐个 normalize_num + apply 类型判断、pd.to_datetime 整列解析）的一致性：
+# 随机生成混合类型的主表 / 参考列对，逐行比较两种实现的结果；另有保证金比例、租赁期限容差边界的固定用例
+# =====================================
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from audit_engine import compare_series_vec, compact_column
+
+# 原实现整列 pd.to_datetime 推断不出格式、object 列 fillna 的提示与本测试无关
+pytestmark = [pytest.mark.filterwarnings("ignore::UserWarning"), pytest.mark.filterwarnings("ignore::FutureWarning")]
+
+# -------------------------------------
+# 原实现（冻结副本，不随引擎修改）
+# -------------------------------------
+def legacy_normalize_num(val):
+    if pd.isna(val): return None
+    s = str(val).replace(",", "").strip()
+    if s in ["", "-", "nan"]: return None
+    try:
+        if "%" in s: return float(s.replace("%", "")) / 100
+        return float(s)
+    except ValueError:
+        return s
+
+def legacy_compare_series_vec(s_main, s_ref, main_kw):
+    merge_failed_mask = s_ref.isna()
+    main_is_na = pd.isna(s_main) | (s_main.astype(str).str.strip().isin(["", "nan", "None"]))
+    ref_is_na = pd.isna(s_ref) | (s_ref.astype(str).str.strip().isin(["", "nan", "None"]))
+    both_are_na = main_is_na & ref_is_na
+
+    if any(k in main_kw for k in ["日期", "时间"]):
+        d_main = pd.to_datetime(s_main, errors='coerce')
+        d_ref = pd.to_datetime(s_ref, errors='coerce')
+        errors = d_main.notna() & d_ref.notna() & (d_main.dt.date != d_ref.dt.date)
+    else:
+        s_main_norm = s_main.apply(legacy_normalize_num)
+        s_ref_norm = s_ref.apply(legacy_normalize_num)
+        main_is_na_norm = pd.isna(s_main_norm) | (s_main_norm.astype(str).str.strip().isin(["", "nan", "None"]))
+        ref_is_na_norm = pd.isna(s_ref_norm) | (s_ref_norm.astype(str).str.strip().isin(["", "nan", "None"]))
+        both_are_na_norm = main_is_na_norm & ref_is_na_norm
+
+        is_num_main = s_main_norm.apply(lambda x: isinstance(x, (int, float)))
+        is_num_ref = s_ref_norm.apply(lambda x: isinstance(x, (int, float)))
+        both_are_num = is_num_main & is_num_ref
+        errors = pd.Series(False, index=s_main.index)
+
+        if both_are_num.any():
+            num_main = s_main_norm[both_are_num].fillna(0)
+            num_ref = s_ref_norm[both_are_num].fillna(0)
+            diff = (num_main - num_ref).abs()
+            if main_kw == "保证金比例":
+                num_errors = (diff > 0.00500001)
+            elif "租赁期限" in main_kw:
+                num_errors = (diff >= 1.0)
+            else:
+                num_errors = (diff > 1e-6)
+            errors.loc[both_are_num] = num_errors
+
+        not_num_mask = ~both_are_num
+        if not_num_mask.any():
+            str_main = s_main_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+            str_ref = s_ref_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+            errors.loc[not_num_mask] = (str_main != str_ref)
+        errors = errors & ~both_are_na_norm
+
+    final_errors = errors & ~both_are_na
+    return final_errors & ~(merge_failed_mask & ~main_is_na)
+
+# -------------------------------------
+# 随机数据
+# -------------------------------------
+VALUE_FIELDS = ["租赁本金", "保证金比例", "租赁期限", "授信方"]
+DATE_FIELDS = ["起租时间", "二次时间"]
+
+# 数值 / 文本字段的候选值：数字、带逗号 / 百分号 / 空格的数字串、全角数字、空值与各种空字符串、普通文本
+VALUE_POOL = [
+    0, 1, 12, 13, 24, 100000, 0.1, 0.105, 0.1050001, 0.15, 1.5, 12.0, 12.5, 11.999, -3,
+    "12", "12.0", " 12 ", "1,234.5", "1234.5", "10%", "10.2%", "0.1", "8.5%", "１２", "1_000", "NaN", "nan",
+    "", " ", "-", "None", "null", None, np.nan, "平安银行", "工商银行", "abc", "12个月", True,
+]
+# 日期字段的候选值：同一列内按一种字符串格式出现（与 Excel 中常见情况一致），混入日期对象、空值与无法解析的文本
+DATE_FORMATS = ["%Y/%m/%d", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y%m%d", "%d/%m/%Y"]
+
+def random_value_series(rng, n, numeric_only=False):
+    if numeric_only:
+        return pd.Series(rng.choice([0.1, 0.105, 12.0, 13.0, 24.0, 100000.5, np.nan], n))
+    return pd.Series([VALUE_POOL[i] for i in rng.integers(len(VALUE_POOL), size=n)], dtype=object)
+
+def random_date_series(rng, n):
+    fmt = DATE_FORMATS[rng.integers(len(DATE_FORMATS))]
+    base = datetime.datetime(2024, 1, 1)
+    values = []
+    for _ in range(n):
+        day = base + datetime.timedelta(days=int(rng.integers(0, 40)), hours=int(rng.integers(0, 24)))
+        kind = rng.integers(8)
+        if kind < 4:
+            values.append(day.strftime(fmt))
+        elif kind == 4:
+            values.append(day)
+        elif kind == 5:
+            values.append(pd.Timestamp(day))
+        elif kind == 6:
+            values.append(None if rng.integers(2) else "")
+        else:
+            values.append("abc")
+    return pd.Series(values, dtype=object)
+
+def assert_same(s_main, s_ref, main_kw):
+    expected = legacy_compare_series_vec(s_main, s_ref, main_kw)
+    actual = compare_series_vec(s_main, s_ref, main_kw)
+    mismatched = np.flatnonzero(expected.to_numpy() != actual.to_numpy())
+    assert not len(mismatched), [(s_main.iloc[i], s_ref.iloc[i], bool(expected.iloc[i])) for i in mismatched[:5]]
+
+@pytest.mark.parametrize("main_kw", VALUE_FIELDS)
+@pytest.mark.parametrize("seed", range(25))
+def test_value_fields_match_legacy(main_kw, seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 60))
+    s_main = random_value_series(rng, n, numeric_only=seed % 5 == 0)
+    s_ref = random_value_series(rng, n, numeric_only=seed % 7 == 0)
+    assert_same(s_main, s_ref, main_kw)
+
+@pytest.mark.parametrize("main_kw", DATE_FIELDS)
+@pytest.mark.parametrize("seed", range(25))
+def test_date_fields_match_legacy(main_kw, seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 60))
+    assert_same(random_date_series(rng, n), random_date_series(rng, n), main_kw)
+
+# 紧凑列类型（category / 缩小位宽的整数）与原始列的比对结果相同
+@pytest.mark.parametrize("main_kw", VALUE_FIELDS + DATE_FIELDS)
+@pytest.mark.parametrize("seed", range(10))
+def test_compact_columns_match_legacy(main_kw, seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(20, 80))
+    if main_kw in DATE_FIELDS:
+        s_main, s_ref = random_date_series(rng, n), random_date_series(rng, n)
+    else:
+        pool = ["平安银行", "工商银行", "12", "10%", "", np.nan]
+        s_main = pd.Series([pool[i] for i in rng.integers(len(pool), size=n)], dtype=object)
+        s_ref = pd.Series(rng.integers(0, 30, n))
+    expected = legacy_compare_series_vec(s_main, s_ref, main_kw)
+    actual = compare_series_vec(compact_column(s_main), compact_column(s_ref), main_kw)
+    assert expected.tolist() == actual.tolist()
+
+# -------------------------------------
+# 容差边界
+# -------------------------------------
+@pytest.mark.parametrize("main, ref", [
+    (0.1, 0.105), (0.1, 0.10500001), (0.1, 0.1050001), (0.1, 0.095), (0.2, 0.19499999),
+    ("10%", 0.105), ("10%", "10.5%"), ("10.6%", 0.1), (0, 0.005), (0, 0.0050001),
+])
+def test_margin_ratio_tolerance_boundary(main, ref):
+    assert_same(pd.Series([main], dtype=object), pd.Series([ref], dtype=object), "保证金比例")
+
+@pytest.mark.parametrize("main, ref", [
+    (12, 13), (13, 12), (12, 12.999999), (12, 11.0000001), (12.0, 13.0), ("12", 13), ("12", "13.0"),
+    (24, 25.0), (0.5, 1.5), (12, 12), (36, 35),
+])
+def test_lease_term_tolerance_boundary(main, ref):
+    s_main, s_ref = pd.Series([main], dtype=object), pd.Series([ref], dtype=object)
+    assert_same(s_main, s_ref, "租赁期限")
+    # 差值恰好为 1.0 算错误
+    if abs(float(main) - float(ref)) == 1.0:
+        assert compare_series_vec(s_main, s_ref, "租赁期限").iloc[0]
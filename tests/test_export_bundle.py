@@ -0,0 +1,103 @@
+# =====================================
+# 合并导出（render_export_bundle）：工作簿与 zip 两种格式的内容与单独导出的各文件一致（单元格值与红 / 黄填充），
+# 压缩级别按 compresslevel 生效，分块流式审核不接受合并工作簿
+# =====================================
+
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import pytest
+from openpyxl import load_workbook
+
+from audit_engine import (
+    BUNDLE_SHEET_TITLES, EXPORT_FILE_NAMES, MISSING_EXPORTS, SHEET_EXPORTS, run_audit, validate_bundle_format,
+)
+
+pytestmark = [pytest.mark.filterwarnings("ignore::UserWarning"), pytest.mark.filterwarnings("ignore::FutureWarning")]
+
+# 工作表各单元格的 (值, 填充色)，去掉行尾空单元格
+def sheet_cells(ws):
+    rows = []
+    for row in ws.iter_rows():
+        values = [(c.value, c.fill.fgColor.rgb if c.fill is not None and c.fill.fill_type else None) for c in row]
+        while values and values[-1] == (None, None):
+            values.pop()
+        rows.append(values)
+    return rows
+
+def workbook_cells(data):
+    return sheet_cells(load_workbook(BytesIO(data)).active)
+
+# 单独导出的各文件：{(导出类型, sheet关键字): 字节}，没有生成的文件不在其中
+def separate_exports(result):
+    exports = {}
+    for kw, (_, rendered) in result["sheets"].items():
+        if rendered is None:
+            continue
+        for kind in SHEET_EXPORTS:
+            if rendered[kind] is not None:
+                exports[(kind, kw)] = rendered[kind]
+    for kind, data in zip(MISSING_EXPORTS, result["missing_workbooks"]):
+        if data is not None:
+            exports[(kind, None)] = data
+    return exports
+
+@pytest.fixture(scope="module")
+def separate(month_files):
+    return separate_exports(run_audit(month_files))
+
+def test_workbook_bundle_matches_separate_exports(month_files, separate):
+    result = run_audit(month_files, bundle="workbook")
+    assert result["bundle_format"] == "workbook" and result["missing_workbooks"] is None
+    wb = load_workbook(BytesIO(result["bundle"]))
+    expected = {BUNDLE_SHEET_TITLES[kind].format(sheet=kw): data for (kind, kw), data in separate.items()}
+    assert sorted(wb.sheetnames) == sorted(expected)
+    for title, data in expected.items():
+        assert sheet_cells(wb[title]) == workbook_cells(data), title
+
+def test_zip_bundle_matches_separate_exports(month_files, separate):
+    result = run_audit(month_files, bundle="zip")
+    with ZipFile(BytesIO(result["bundle"])) as archive:
+        expected = {EXPORT_FILE_NAMES[kind].format(sheet=kw): data for (kind, kw), data in separate.items()}
+        assert sorted(archive.namelist()) == sorted(expected)
+        for name, data in expected.items():
+            assert workbook_cells(archive.read(name)) == workbook_cells(data), name
+
+# 级别 0 时 xlsx 内各部件只按 deflate 格式存储、不压缩；默认级别的文件更小
+def test_compresslevel_is_honoured(month_files):
+    level0 = run_audit(month_files, bundle="workbook", compresslevel=0)["bundle"]
+    default = run_audit(month_files, bundle="workbook")["bundle"]
+    with ZipFile(BytesIO(level0)) as archive:
+        infos = archive.infolist()
+        assert all(info.compress_type == ZIP_DEFLATED for info in infos)
+        assert all(info.compress_size >= info.file_size for info in infos)
+    assert len(default) < len(level0)
+    assert workbook_cells(level0) == workbook_cells(default)
+
+    with ZipFile(BytesIO(run_audit(month_files, bundle="zip", compresslevel=0)["bundle"])) as archive:
+        for name in archive.namelist():
+            with ZipFile(BytesIO(archive.read(name))) as xlsx:
+                assert all(info.compress_size >= info.file_size for info in xlsx.infolist()), name
+
+def test_invalid_bundle_is_rejected(month_files):
+    with pytest.raises(ValueError):
+        validate_bundle_format("workbook", streamed=True)
+    with pytest.raises(ValueError):
+        validate_bundle_format("tar")
+    validate_bundle_format("zip", streamed=True)
+
+    texts = []
+    with pytest.raises(ValueError):
+        run_audit(month_files, chunk_size=50, bundle="workbook", checkpoint=lambda text=None: texts.append(text))
+    assert texts == []  # 在读取任何文件之前拒绝
+    with pytest.raises(ValueError):
+        run_audit(month_files, bundle="tar")
+
+def test_streamed_zip_bundle_packs_streamed_exports(month_files):
+    streamed = run_audit(month_files, chunk_size=50)
+    result = run_audit(month_files, chunk_size=50, bundle="zip")
+    with ZipFile(BytesIO(result["bundle"])) as archive:
+        expected = {EXPORT_FILE_NAMES[kind].format(sheet=kw): data for (kind, kw), data in separate_exports(streamed).items()}
+        assert sorted(archive.namelist()) == sorted(expected)
+        for name, data in expected.items():
+            assert workbook_cells(archive.read(name)) == workbook_cells(data), name
@@ -0,0 +1,140 @@
+# =====================================
+# 增量比对与全量比对的一致性：同一组文件反复随机修改单元格、删除 / 插入 / 重复 / 打乱行、修改参考表，
+# 每一轮带指纹库的 check_one_sheet 都要与不带指纹库的结果完全一致；另有指纹库淘汰与范围隔离的用例
+# =====================================
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import audit_engine
+from audit_engine import (
+    INPUT_FILE_KEYWORDS, WORKBOOK_SHEETS, sheet_keywords, mapping_fk, mapping_zd, mapping_ec,
+    FingerprintStore, RefIndex, check_one_sheet, find_col, parse_workbook, prepare_refs, reference_frame,
+)
+
+RESULT_KEYS = ("total_errors", "skip_city_manager", "contracts_seen", "error_fields", "error_columns", "field_errors", "error_rows")
+REFERENCES = {"fk": ("放款明细", "威田"), "zd": ("字段", "重卡"), "ec": ("二次明细", None)}
+
+# 随机改写 n 个单元格：空值、文本、数值变化、日期字符串 / 日期对象、同值改为字符串
+def mutate(df, rng, cols, n):
+    df = df.copy()
+    for _ in range(n):
+        col = cols[rng.integers(len(cols))]
+        i = rng.integers(len(df))
+        value = df.iat[i, df.columns.get_loc(col)]
+        new = [
+            np.nan, "abc", value * 1.5 if isinstance(value, (int, float)) and not pd.isna(value) else 123.0,
+            "2024/03/05", str(value), pd.Timestamp("2023-01-01"),
+        ][rng.integers(6)]
+        if df[col].dtype != object:
+            df[col] = df[col].astype(object)
+        df.iat[i, df.columns.get_loc(col)] = new
+    return df
+
+def compared_columns(df):
+    cols = [find_col(df, kw) for mapping in (mapping_fk, mapping_zd, mapping_ec) for kw in mapping]
+    return [c for c in cols if c]
+
+@pytest.fixture(scope="module")
+def parsed(month_files):
+    return {file_kw: parse_workbook(month_files[file_kw], WORKBOOK_SHEETS[file_kw]) for file_kw in INPUT_FILE_KEYWORDS}
+
+def assert_same_result(full, incremental, where):
+    for key in RESULT_KEYS:
+        assert full[key] == incremental[key], (where, key)
+    assert np.array_equal(full["error_matrix"], incremental["error_matrix"]), where
+
+def test_incremental_matches_full_under_random_edits(parsed, tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"))
+    refs = {prefix: reference_frame(parsed, file_kw, sheet_kw) for prefix, (file_kw, sheet_kw) in REFERENCES.items()}
+    frames, errors = parsed["月重卡"]
+    rng = np.random.default_rng(0)
+    for round_no in range(12):
+        if round_no:
+            mutated = {}
+            for kw, df in frames.items():
+                df = mutate(df, rng, compared_columns(df), int(rng.integers(0, 8)))
+                if round_no % 3 == 0:
+                    df = df.drop(df.index[rng.choice(len(df), 2, replace=False)])   # 删除行
+                if round_no % 4 == 0:
+                    df = pd.concat([df, df.iloc[:2]]).reset_index(drop=True)      # 追加重复合同
+                if round_no % 5 == 0:
+                    df = df.sample(frac=1, random_state=round_no).reset_index(drop=True)  # 打乱行顺序
+                mutated[kw] = df
+            frames = mutated
+            if round_no % 2 == 0:
+                prefix = list(refs)[rng.integers(len(refs))]
+                refs[prefix] = mutate(refs[prefix], rng, list(refs[prefix].columns[1:]), 4)
+        ref_index = RefIndex(prepare_refs(refs["fk"], refs["zd"], refs["ec"], []))
+        for kw in sheet_keywords:
+            full = check_one_sheet(kw, (frames, errors), ref_index)
+            incremental = check_one_sheet(kw, (frames, errors), ref_index, store=store, scope="月重卡.xlsx")
+            assert_same_result(full, incremental, (round_no, kw))
+            changes = incremental["changes"]
+            assert changes["reused"] + changes["recomputed"] == len(frames[kw])
+            if round_no == 0:
+                assert not changes["previous"]
+
+# 内容未变时全部沿用；只改一个单元格时只重新比对该行
+def test_unchanged_rows_are_reused(parsed, tmp_path, monkeypatch):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"))
+    ref_index = RefIndex(prepare_refs(*(reference_frame(parsed, f, s) for f, s in REFERENCES.values()), []))
+    frames, errors = parsed["月重卡"]
+    kw = sheet_keywords[0]
+    check_one_sheet(kw, (frames, errors), ref_index, store=store, scope="a")
+    again = check_one_sheet(kw, (frames, errors), ref_index, store=store, scope="a")
+    assert again["changes"]["recomputed"] == 0
+
+    df = frames[kw].copy()
+    col = find_col(df, "租赁本金")  # 浮点列，改值不改变列类型（列类型变化时整列都要重新比对）
+    df.iat[5, df.columns.get_loc(col)] = -1.0
+    # 有变化的行所有字段一起批量比对，每张sheet只调用一次 evaluate_operands
+    calls = []
+    evaluate = audit_engine.evaluate_operands
+    monkeypatch.setattr(audit_engine, "evaluate_operands", lambda rules, *args, **kwargs: calls.append(len(rules)) or evaluate(rules, *args, **kwargs))
+    edited = check_one_sheet(kw, ({**frames, kw: df}, errors), ref_index, store=store, scope="a")
+    monkeypatch.undo()
+    assert edited["changes"]["changed"] == 1
+    assert calls == [len(edited["error_fields"])]
+    assert_same_result(check_one_sheet(kw, ({**frames, kw: df}, errors), ref_index), edited, kw)
+
+# 不同范围（上传者 / 文件）的记录互不影响
+def test_scopes_are_isolated(parsed, tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"))
+    ref_index = RefIndex(prepare_refs(*(reference_frame(parsed, f, s) for f, s in REFERENCES.values()), []))
+    kw = sheet_keywords[0]
+    check_one_sheet(kw, parsed["月重卡"], ref_index, store=store, scope="client1/月重卡.xlsx")
+    other = check_one_sheet(kw, parsed["月重卡"], ref_index, store=store, scope="client2/月重卡.xlsx")
+    assert not other["changes"]["previous"]
+
+# 超过大小上限时淘汰最久未更新的记录，刚保存的记录保留；旧版本的记录直接删除
+def test_store_evicts_oldest_records(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"), max_bytes=60_000)
+    rows = pd.DataFrame({
+        "key": [f"PAZL{i}" for i in range(1000)], "occ": 0, "main_hash": 1, "ref_hash": 2, "err_mask": 0, "skip": 0, "kinds": 0,
+    })
+    for i in range(5):
+        store.save(f"s{i}", "二次", {}, rows)
+    kept = [i for i in range(5) if store.load(f"s{i}", "二次")[1] is not None]
+    assert kept and kept[-1] == 4 and kept == list(range(5 - len(kept), 5)) and len(kept) < 5
+
+    huge = FingerprintStore(store.path, max_bytes=0)
+    huge.save("latest", "二次", {}, rows)
+    assert huge.load("latest", "二次")[1] is not None
+    with huge.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sheet_fingerprints").fetchone()[0] == 1
+
+# 参考日期列（object / category）在增量比对中同样取 RefIndex 整列只解析一次的结果，不按sheet重复解析
+def test_reference_dates_are_parsed_once(parsed, tmp_path, monkeypatch):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"))
+    ref_index = RefIndex(prepare_refs(*(reference_frame(parsed, f, s) for f, s in REFERENCES.values()), []))
+    ref_index.prepare_dates()
+    memo = {ref_col for ref_col, _ in ref_index.parsed_dates}
+    assert memo
+    parse = audit_engine.parse_date_days
+    parsed_columns = []
+    monkeypatch.setattr(audit_engine, "parse_date_days", lambda series, fmt: parsed_columns.append(series.name) or parse(series, fmt))
+    for kw in sheet_keywords:
+        check_one_sheet(kw, parsed["月重卡"], ref_index, store=store, scope="a")
+    assert not set(parsed_columns) & memo
@@ -0,0 +1,62 @@
+# =====================================
+# 字段表漏填检查（find_missing_contracts）：合同号按 normalize_contract_key 标准化后做双向反连接，
+# 大小写 / 空白 / 全角连接符差异不算漏填，空合同不参与比较，重复合同号逐行标注
+# =====================================
+
+import numpy as np
+import pandas as pd
+
+from audit_engine import find_missing_contracts, normalize_contract_key
+
+def zd_frame(contracts, car_manager=None, bonus_type=None):
+    data = {"合同号": contracts}
+    if car_manager is not None:
+        data["是否车管家"] = car_manager
+    if bonus_type is not None:
+        data["提成类型"] = bonus_type
+    return pd.DataFrame(data)
+
+# 月重卡中出现过的合同号（与 stream / audit 中收集 contracts_seen 的方式相同）
+def seen(*contracts):
+    return set(normalize_contract_key(pd.Series(contracts, dtype=object)))
+
+def test_anti_join_both_directions():
+    zd_df = zd_frame(["PAZL001", "PAZL002", "PAZL003"])
+    mask, unmatched = find_missing_contracts(zd_df, "合同号", seen("PAZL001", "PAZL009", "PAZL003", "PAZL008"))
+    assert mask.tolist() == [False, True, False]
+    assert unmatched == ["PAZL008", "PAZL009"]
+
+def test_case_and_whitespace_variants_match():
+    zd_df = zd_frame([" pazl001", "PAZL 002\t", "PAZL－003", "PAZL004.0", 12345.0])
+    mask, unmatched = find_missing_contracts(zd_df, "合同号", seen("PAZL001 ", "pazl002", "PAZL-003", "pazl004", "12345"))
+    assert not mask.any()
+    assert unmatched == []
+
+def test_contracts_missing_from_field_table():
+    zd_df = zd_frame(["PAZL001"])
+    mask, unmatched = find_missing_contracts(zd_df, "合同号", seen("pazl001", "PAZL100", " pazl050 "))
+    assert mask.tolist() == [False]
+    assert unmatched == ["PAZL050", "PAZL100"]
+
+# 空合同（None / NaN / 空串）既不算漏填，也不会和月重卡的空合同号匹配
+def test_blank_contract_cells_are_ignored():
+    zd_df = zd_frame(["PAZL001", None, np.nan, "", "PAZL002"])
+    mask, unmatched = find_missing_contracts(zd_df, "合同号", seen("PAZL001") | {""})
+    assert mask.tolist() == [False, False, False, False, True]
+    assert unmatched == []
+
+def test_duplicate_keys_flag_every_row():
+    zd_df = zd_frame(["PAZL001", "pazl001", "PAZL002", "PAZL002 "])
+    mask, unmatched = find_missing_contracts(zd_df, "合同号", seen("PAZL002", "PAZL002", "PAZL003", "pazl003"))
+    assert mask.tolist() == [True, True, False, False]
+    assert unmatched == ["PAZL003"]
+
+def test_car_manager_and_bonus_type_rows_are_skipped():
+    zd_df = zd_frame(
+        ["PAZL001", "PAZL002", "PAZL003", "PAZL004", "PAZL005"],
+        car_manager=[" 是 ", "否", None, "否", "否"],
+        bonus_type=["普通", "驻店", "联合租赁 ", "普通", None],
+    )
+    mask, unmatched = find_missing_contracts(zd_df, "合同号", set())
+    assert mask.tolist() == [False, False, False, True, True]
+    assert unmatched == []
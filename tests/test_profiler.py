@@ -0,0 +1,96 @@
+# =====================================
+# 性能分析的分阶段内存：每个阶段的峰值只反映阶段内的分配，不受进程此前更大的峰值影响；嵌套阶段的峰值计入外层，
+# 只有顶层阶段重置进程峰值、归还空闲内存，嵌套阶段与其他线程的阶段不会打断外层的统计
+# =====================================
+
+import threading
+
+import numpy as np
+import pytest
+
+import audit_engine
+from audit_engine import StageProfiler
+
+pytestmark = pytest.mark.skipif(not audit_engine._memory_supported, reason="需要 /proc/self/clear_refs（Linux）")
+
+def allocate(mb):
+    block = np.ones(mb << 17)  # mb MB 的 float64，写满后才会计入常驻内存
+    return float(block.sum())
+
+def test_stage_peak_is_per_stage():
+    profiler = StageProfiler()
+    with profiler.stage("big"):
+        allocate(200)
+    with profiler.stage("small"):
+        allocate(40)
+    with profiler.stage("none"):
+        pass
+    big, small, none = profiler.records
+    assert big["peak_mb"] >= 190
+    # 进程峰值（ru_maxrss）此时仍是 200 MB 那次，分阶段统计只看到本阶段的 40 MB
+    assert 35 <= small["peak_mb"] < 100
+    assert none["peak_mb"] < 10
+    assert abs(small["retained_mb"]) < 10
+
+def test_nested_stage_peak_counts_toward_outer():
+    profiler = StageProfiler()
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            allocate(120)
+        allocate(30)
+    inner, outer = profiler.records
+    assert inner["peak_mb"] >= 110
+    assert outer["peak_mb"] >= 110
+    assert not audit_engine._open_stages
+
+# 统计 _reset_peak / _malloc_trim 的调用次数
+@pytest.fixture
+def resets(monkeypatch):
+    calls = {"reset": 0, "trim": 0}
+    reset_peak, malloc_trim = audit_engine._reset_peak, audit_engine._malloc_trim
+    def counting_reset():
+        calls["reset"] += 1
+        reset_peak()
+    def counting_trim(pad):
+        calls["trim"] += 1
+        return malloc_trim(pad) if malloc_trim is not None else 0
+    monkeypatch.setattr(audit_engine, "_reset_peak", counting_reset)
+    monkeypatch.setattr(audit_engine, "_malloc_trim", counting_trim)
+    return calls
+
+def test_only_top_level_stage_resets(resets):
+    profiler = StageProfiler()
+    with profiler.stage("outer"):
+        allocate(150)
+        for _ in range(3):
+            with profiler.stage("inner"):
+                allocate(20)
+    assert resets == {"reset": 1, "trim": 1}
+    *inners, outer = profiler.records
+    # 外层的 150 MB 峰值没有被内层阶段重置掉
+    assert outer["peak_mb"] >= 140
+    assert all(inner["peak_mb"] < 100 for inner in inners)
+
+def test_stage_in_other_thread_does_not_reset(resets):
+    opened, release = threading.Event(), threading.Event()
+    def worker():
+        with StageProfiler().stage("other"):
+            opened.set()
+            release.wait(10)
+    thread = threading.Thread(target=worker)
+    thread.start()
+    try:
+        opened.wait(10)
+        with StageProfiler().stage("here"):
+            pass
+        assert resets["reset"] == 1  # 只有先开始的 other 重置
+    finally:
+        release.set()
+        thread.join()
+    assert not audit_engine._open_stages
+
+def test_disabled_profiler_records_nothing():
+    profiler = StageProfiler(enabled=False)
+    with profiler.stage("x") as record:
+        allocate(10)
+    assert profiler.records == [] and "peak_mb" not in record
@@ -0,0 +1,47 @@
+# =====================================
+# 读取时按关键字筛列（read_sheet 的 usecols 选择器）：两种读取引擎下结果与整表读取后按 find_col 取列相同，
+# 包括重名列、空表头、多列匹配（取第一列并提示）与没有匹配列的情况
+# =====================================
+
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from audit_engine import WORKBOOK_SHEETS, matched_positions, read_sheet
+
+HEADER = ["合同号", None, "合同编号", "提报人", " 提报 ", "区域", "是否车管家", "是否车管家 ", "提成类型", 5, "主车台数", "合同号"]
+
+def odd_header_workbook():
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "重卡"
+    ws.append(HEADER)
+    for i in range(5):
+        ws.append([f"C{i}", 1, "x", "a", "24", "东", "是", "否", "A", i, 2, f"D{i}", "多出的列"])
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+def full_then_select(xls, columns, notes):
+    df = xls.parse("重卡", header=0)
+    positions = matched_positions(df, columns, notes, "「重卡」")
+    return df.iloc[:, positions]
+
+@pytest.mark.parametrize("engine", ["openpyxl", "calamine"])
+@pytest.mark.parametrize("columns", [WORKBOOK_SHEETS["字段"][0][2], [("提报", False), ("合同", False), ("x", True)]])
+def test_selector_matches_full_parse(engine, columns):
+    with pd.ExcelFile(BytesIO(odd_header_workbook()), engine=engine) as xls:
+        expected_notes, notes = [], []
+        expected = full_then_select(xls, columns, expected_notes)
+        df = read_sheet(xls, "重卡", 0, columns, notes)
+    pd.testing.assert_frame_equal(df, expected)
+    assert notes == expected_notes and notes
+
+@pytest.mark.parametrize("engine", ["openpyxl", "calamine"])
+def test_no_matching_column(engine):
+    with pd.ExcelFile(BytesIO(odd_header_workbook()), engine=engine) as xls:
+        notes = []
+        df = read_sheet(xls, "重卡", 0, [("不存在", False)], notes)
+    assert df.columns.empty and notes == []
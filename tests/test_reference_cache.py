@@ -0,0 +1,88 @@
+# =====================================
+# 参考数据持久化缓存（ReferenceStore）：Arrow IPC 往返后值与类型不变，文件内容或缓存版本变化时作废，
+# run_audit 命中缓存时不解析参考文件，结果（含漏填标注文件）与不用缓存时相同
+# =====================================
+
+import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import audit_engine
+from audit_engine import ReferenceStore, compact_frame, content_digest, run_audit
+
+pytestmark = [pytest.mark.filterwarnings("ignore::UserWarning"), pytest.mark.filterwarnings("ignore::FutureWarning")]
+
+def mixed_frame():
+    df = pd.DataFrame({
+        "合同号": ["PAZL001", "PAZL002", None, "PAZL004", "PAZL005", "PAZL006"],
+        "混合": ["文本", 12, 3.5, np.nan, datetime.datetime(2024, 3, 1, 8, 30), True],
+        "时间": [datetime.time(9, 15), None, "无", np.nan, datetime.date(2024, 1, 2), pd.NaT],
+        "起租日": pd.to_datetime(["2024-01-01", None, "2024-02-29", "2023-12-31", None, "2024-06-30"]),
+        "金额": [1.5, np.nan, 0.1, 2e10, -3.25, np.nan],
+        "台数": np.array([1, 2, 3, 4, 5, 6], dtype=np.int64),
+        "省区": ["华东", "华南", "华东", np.nan, "华东", "华南"],
+    }, index=pd.RangeIndex(10, 16))
+    return compact_frame(df)
+
+def value_types(series):
+    return [type(v) for v in series.to_numpy()]
+
+def test_round_trip_keeps_values_and_types(tmp_path):
+    df = mixed_frame()
+    assert isinstance(df["省区"].dtype, pd.CategoricalDtype) and df["台数"].dtype == np.int8
+    store = ReferenceStore(str(tmp_path))
+    notes = [("warning", "提示")]
+    assert store.save("zd", "d1", {"std": df, "missing": df[["合同号"]]}, notes)
+    frames, loaded_notes = store.load("zd", "d1", ["std", "missing"])
+    assert loaded_notes == notes
+    pd.testing.assert_frame_equal(frames["std"], df)
+    pd.testing.assert_frame_equal(frames["missing"], df[["合同号"]])
+    for col in ("合同号", "混合", "时间"):
+        assert value_types(frames["std"][col]) == value_types(df[col]), col
+
+def test_entry_is_invalidated_by_digest_and_version(tmp_path, monkeypatch):
+    store = ReferenceStore(str(tmp_path))
+    store.save("fk", "d1", {"std": mixed_frame()}, [])
+    assert store.load("fk", "d1", ["std"]) is not None
+    assert store.load("fk", "d2", ["std"]) is None
+    assert store.load("ec", "d1", ["std"]) is None
+    monkeypatch.setattr(audit_engine, "REF_CACHE_VERSION", audit_engine.REF_CACHE_VERSION + 1)
+    assert store.load("fk", "d1", ["std"]) is None
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    store = ReferenceStore(str(tmp_path))
+    store.save("fk", "d1", {"std": mixed_frame()}, [])
+    with open(store.file(store.key("fk", "d1"), "std"), "wb") as f:
+        f.write(b"not arrow")
+    assert store.load("fk", "d1", ["std"]) is None
+
+def cells(data):
+    return None if data is None else [[c.value for c in row] for row in load_workbook(BytesIO(data)).active.iter_rows()]
+
+def summary(result):
+    sheets = {
+        kw: ({key: r[key] for key in ("total_errors", "field_errors", "contracts_seen", "error_rows", "notes")},
+             None if rendered is None else (cells(rendered["annotated"]), cells(rendered["errors_only"])))
+        for kw, (r, rendered) in result["sheets"].items()
+    }
+    return (result["notes"], result["total_errors"], result["missing_count"], result["unmatched_contracts"], sheets,
+            [cells(data) for data in result["missing_workbooks"]])
+
+# 命中缓存的审核不再解析三个参考文件（含漏填导出用的整表字段表），结果与冷启动完全相同
+def test_run_audit_hit_equals_cold_run(month_files, tmp_path, monkeypatch):
+    cold = summary(run_audit(month_files))
+    store = ReferenceStore(str(tmp_path))
+    assert summary(run_audit(month_files, ref_store=store)) == cold
+
+    parsed = []
+    parse_workbook = audit_engine.parse_workbook
+    def recording_parse(data, *args, **kwargs):
+        parsed.append(content_digest(data))
+        return parse_workbook(data, *args, **kwargs)
+    monkeypatch.setattr(audit_engine, "parse_workbook", recording_parse)
+    assert summary(run_audit(month_files, ref_store=store)) == cold
+    assert parsed == [content_digest(month_files["月重卡"])]
@@ -0,0 +1,79 @@
+# =====================================
+# 分块流式审核与整表审核的一致性：不同块大小（含 1 行以内的小块、大于整表的块）下，
+# 比对结果与两个标注文件的每个单元格（值与填充色）都要与整表审核相同；另用一份含边界情况的月重卡
+# （表中间的空行、超出表头宽度的行、重复列名、公式错误值、字符串日期 / 数值、前几行只有数字样文本的文本列）再比一次
+# =====================================
+
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+
+from audit_engine import run_audit, sheet_keywords
+
+RESULT_KEYS = (
+    "total_errors", "field_errors", "error_fields", "error_columns", "skip_city_manager",
+    "contracts_seen", "error_rows", "contract_col", "notes",
+)
+
+# 工作簿第一个工作表的 (值, 填充色) 矩阵，去掉行尾空单元格；数值按 float 比较
+def cells(data):
+    if data is None:
+        return None
+    rows = []
+    for row in load_workbook(BytesIO(data)).active.iter_rows():
+        values = [
+            (float(c.value) if isinstance(c.value, (int, float)) and not isinstance(c.value, bool) else c.value,
+             c.fill.fgColor.rgb if c.fill is not None and c.fill.fill_type else None)
+            for c in row
+        ]
+        while values and values[-1] == (None, None):
+            values.pop()
+        rows.append(values)
+    return rows
+
+# 在生成的月重卡上制造边界情况
+def edge_case_workbook(data):
+    wb = load_workbook(BytesIO(data))
+    for n, ws in enumerate(wb.worksheets):
+        header = [c.value for c in ws[2]]
+        col = lambda name: next(i + 1 for i, v in enumerate(header) if v and name in str(v))
+        ws.cell(2, ws.max_column).value = header[0]               # 最后一列与第一列同名
+        ws.insert_rows(6, 2)                                      # 表中间的空行
+        ws.cell(9 if n % 2 == 0 else 12, col("起租")).value = "2024/05/06" if n % 2 == 0 else "garbage"
+        ws.cell(10, col("租赁本金")).value = "12,345"
+        ws.cell(11, col("租赁期限")).value = "=1/0"
+        ws.cell(13, ws.max_column + 3).value = "wide"             # 超出表头宽度的行
+        ws.cell(14, col("保证金")).value = "5%"
+        ws.cell(15, col("城市经理")).value = " "
+        # 前几行的文本列只有数字样的文本：整列读取时仍是文本，只看这几行的块会被推断成数值
+        for row in range(3, 12):
+            ws.cell(row, col("合同")).value = f"{row * 7:08d}"             # 带前导零的纯数字合同号
+            ws.cell(row, col("提报")).value = ["24", "100000", "00000049"][row % 3]
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+@pytest.fixture(scope="module", params=["generated", "edge_cases"])
+def files(request, month_files):
+    if request.param == "generated":
+        return month_files
+    return {**month_files, "月重卡": edge_case_workbook(month_files["月重卡"])}
+
+@pytest.fixture(scope="module")
+def full_audit(files):
+    return run_audit(files)
+
+@pytest.mark.parametrize("chunk_size", [7, 50, 100_000])
+def test_stream_matches_full_audit(files, full_audit, chunk_size):
+    streamed = run_audit(files, chunk_size=chunk_size)
+    for kw in sheet_keywords:
+        (full, full_rendered), (chunked, chunked_rendered) = full_audit["sheets"][kw], streamed["sheets"][kw]
+        for key in RESULT_KEYS:
+            assert full[key] == chunked[key], (chunk_size, kw, key)
+        assert (full_rendered is None) == (chunked_rendered is None)
+        if full_rendered is not None:
+            for kind in ("annotated", "errors_only"):
+                assert cells(full_rendered[kind]) == cells(chunked_rendered[kind]), (chunk_size, kw, kind)
+    assert full_audit["missing_count"] == streamed["missing_count"]
+    assert full_audit["unmatched_contracts"] == streamed["unmatched_contracts"]
@@ -0,0 +1,48 @@
+# =====================================
+# 多进程工作进程的入口：模拟 Streamlit 把界面脚本注册为 __main__（没有 __spec__、不带 if __name__ 保护），
+# 脚本把 __spec__ 指向 audit_worker 后，spawn 出的工作进程导入 audit_worker，不会重新执行界面脚本
+# =====================================
+
+import os
+import subprocess
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 与 Streamlit 相同：新建 __main__ 模块执行脚本，脚本中启动进程池
+RUNNER = textwrap.dedent("""
+    import sys, types
+    script = sys.argv[1]
+    module = types.ModuleType("__main__")
+    module.__file__ = script
+    sys.modules["__main__"] = module
+    exec(compile(open(script, encoding="utf-8").read(), script, "exec"), module.__dict__)
+""")
+
+SCRIPT = textwrap.dedent("""
+    import importlib.util, os, sys
+    {spec_line}
+    with open(os.environ["AUDIT_TEST_MARKER"], "a") as f:
+        f.write("ran\\n")
+    from audit_engine import make_executor
+    executor = make_executor("process", max_workers=2)
+    expr = "__import__('os').path.basename(__import__('sys').modules['__main__'].__file__)"
+    main_files = list(executor.map(eval, [expr] * 2))
+    executor.shutdown()
+    print(sorted(set(main_files)), sys.modules["__main__"].__file__ == __file__)
+""")
+
+def run_script(tmp_path, spec_line):
+    script, runner, marker = tmp_path / "app.py", tmp_path / "runner.py", tmp_path / "marker"
+    script.write_text(SCRIPT.format(spec_line=spec_line), encoding="utf-8")
+    runner.write_text(RUNNER, encoding="utf-8")
+    env = dict(os.environ, AUDIT_TEST_MARKER=str(marker), PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, str(runner), str(script)], env=env, cwd=ROOT, capture_output=True, text=True, timeout=120)
+    return proc, marker.read_text().count("ran")
+
+def test_workers_import_worker_entry_instead_of_script(tmp_path):
+    proc, runs = run_script(tmp_path, '__spec__ = importlib.util.find_spec("audit_worker")')
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.split("\n")[0] == "['audit_worker.py'] True"
+    assert runs == 1  # 只在父进程中执行过一次